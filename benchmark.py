@@ -0,0 +1,794 @@
+#!/usr/bin/env python3
+"""
+word2img-mcp 性能基准脚本
+
+用法:
+    python benchmark.py startup [--runs 5] [--budget-ms 1500]
+    python benchmark.py registry [--tasks 1000000]
+    python benchmark.py wal [--writers 1,4,16] [--tasks 2000]
+    python benchmark.py storage [--images 40]       （需要 boto3，使用 s3_standin.py）
+    python benchmark.py encode [--repeat 5]         （含 PNG 调色板优化对比）
+    python benchmark.py template [--variants 200]   （PIL 后端：完整渲染 vs 模板变量替换）
+    python benchmark.py incremental [--edits 20]    （PIL 后端：修改单个段落后重新提交）
+    python benchmark.py table [--rows 200]          （PIL 后端：大表格的布局与绘制耗时）
+    python benchmark.py parse [--repeat 20]         （imgkit 失败回退到 PIL：各自解析 vs 共享解析缓存）
+    python benchmark.py renditions [--backend api]  （三种尺寸/格式分三次提交 vs 一次提交附加输出；api 使用 render_api_stub.py）
+    python benchmark.py async [--renders 200]       （并发外部渲染：异步子进程 vs 线程池 + subprocess.run）
+    python benchmark.py remote [--renders 300]      （md-to-image API：每次新建连接 vs 长连接池，使用 render_api_stub.py）
+    python benchmark.py hedge [--endpoints 3]       （多个 API 端点：单端点 vs 负载均衡 vs 负载均衡 + 对冲请求）
+
+每个子命令打印结果表；带预算的基准在超出预算时以非零状态退出，可直接用于 CI。
+"""
+
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent
+
+# 冷启动预算：导入 MCP 服务模块并构建工具列表（不含 MCP SDK 以外的渲染后端）
+STARTUP_BUDGET_MS = 1500
+
+_STARTUP_SNIPPET = """
+import asyncio
+import word2img_mcp.mcp_app as app
+asyncio.run(app.handle_list_tools())
+heavy = [m for m in ("PIL", "imgkit", "markdown", "markdown_it", "requests") if m in __import__("sys").modules]
+assert not heavy, f"eagerly imported: {heavy}"
+assert app._store is None, "ImageStore created at import time"
+"""
+
+
+def bench_startup(args: argparse.Namespace) -> int:
+    """Measure cold start of the MCP server module in fresh interpreters."""
+    samples = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SNIPPET],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            print(result.stderr, file=sys.stderr)
+            return 1
+        samples.append(elapsed_ms)
+
+    median_ms = statistics.median(samples)
+    print(f"{'runs':<12}{args.runs}")
+    print(f"{'min_ms':<12}{min(samples):.1f}")
+    print(f"{'median_ms':<12}{median_ms:.1f}")
+    print(f"{'max_ms':<12}{max(samples):.1f}")
+    print(f"{'budget_ms':<12}{args.budget_ms}")
+    if median_ms > args.budget_ms:
+        print(f"❌ 冷启动超出预算: {median_ms:.1f}ms > {args.budget_ms}ms")
+        return 1
+    print("✅ 冷启动在预算内")
+    return 0
+
+
+def _max_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 计，macOS 以字节计
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def bench_registry(args: argparse.Namespace) -> int:
+    """Build a registry with N tasks, reopen it and measure memory and lookup latency."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from word2img_mcp.registry import TaskRecord, TaskRegistry
+    from word2img_mcp.store import ImageStore
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        started = time.perf_counter()
+        registry = TaskRegistry(base_dir)
+        created = datetime.now() - timedelta(days=30)
+        sample_ids = []
+        batch = []
+        for i in range(args.tasks):
+            task_id = str(uuid.uuid4())
+            if i % max(1, args.tasks // 1000) == 0:
+                sample_ids.append(task_id)
+            batch.append(TaskRecord(
+                task_id=task_id,
+                created_at=(created + timedelta(seconds=i)).isoformat(),
+                status="completed",
+                format="png",
+                file_size=random.randint(20_000, 400_000),
+                path=os.path.join(base_dir, f"{task_id}.png")
+            ))
+            if len(batch) >= 10_000:
+                registry.add_many(batch)
+                batch.clear()
+        registry.add_many(batch)
+        registry.close()
+        build_s = time.perf_counter() - started
+        file_mb = sum(
+            os.path.getsize(os.path.join(base_dir, name)) for name in os.listdir(base_dir)
+        ) / (1024 * 1024)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        store = ImageStore(base_dir)
+        store.get_path(sample_ids[0])
+        open_ms = (time.perf_counter() - started) * 1000
+        _, open_peak = tracemalloc.get_traced_memory()
+
+        for task_id in sample_ids:
+            assert store._registry.get(task_id) is not None
+        store.list_tasks(limit=10)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # 延迟测量不开 tracemalloc（其分配钩子会显著拖慢）
+        started = time.perf_counter()
+        for task_id in sample_ids:
+            store._registry.get(task_id)
+        lookup_us = (time.perf_counter() - started) * 1e6 / len(sample_ids)
+
+        started = time.perf_counter()
+        store.list_tasks(limit=10)
+        list_ms = (time.perf_counter() - started) * 1000
+        store.close()
+
+    print(f"{'tasks':<22}{args.tasks}")
+    print(f"{'build_s':<22}{build_s:.2f}")
+    print(f"{'on_disk_mb':<22}{file_mb:.1f}")
+    print(f"{'open_ms':<22}{open_ms:.2f}")
+    print(f"{'open_heap_kb':<22}{open_peak / 1024:.1f}")
+    print(f"{'lookup_us':<22}{lookup_us:.1f}")
+    print(f"{'list_tasks_ms':<22}{list_ms:.2f}")
+    print(f"{'heap_after_kb':<22}{current / 1024:.1f}")
+    print(f"{'heap_peak_kb':<22}{peak / 1024:.1f}")
+    print(f"{'max_rss_mb':<22}{_max_rss_mb():.1f}")
+    return 0
+
+
+def bench_wal(args: argparse.Namespace) -> int:
+    """Journaled task writes per second with N concurrent writers (group commit)."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from word2img_mcp.journal import JournaledTaskRegistry
+    from word2img_mcp.registry import TaskRecord
+
+    # 默认在当前目录下测试，tmpfs 上的 fsync 没有意义
+    print(f"{'writers':<10}{'tasks':<10}{'seconds':<10}{'tasks/s':<12}")
+    for writers in [int(value) for value in args.writers.split(",")]:
+        with tempfile.TemporaryDirectory(dir=args.dir) as base_dir:
+            registry = JournaledTaskRegistry(base_dir)
+            per_writer = args.tasks // writers
+
+            def write() -> None:
+                for _ in range(per_writer):
+                    registry.add(TaskRecord(
+                        task_id=str(uuid.uuid4()),
+                        created_at=datetime.now().isoformat(),
+                        status="completed",
+                        format="png",
+                        file_size=100_000
+                    ))
+
+            threads = [threading.Thread(target=write) for _ in range(writers)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            registry.close()
+        total = per_writer * writers
+        print(f"{writers:<10}{total:<10}{elapsed:<10.2f}{total / elapsed:<12.0f}")
+    return 0
+
+
+def bench_storage(args: argparse.Namespace) -> int:
+    """save_image latency with local storage vs. S3 (background upload) against the stand-in."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from PIL import Image
+    from s3_standin import serve
+    from word2img_mcp.storage import LocalStorageDriver, S3StorageDriver
+    from word2img_mcp.store import ImageStore
+
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "standin")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "standin")
+    # 随机噪声图片，避免内容去重让上传被跳过
+    images = [
+        Image.frombytes("RGB", (600, 800), os.urandom(600 * 800 * 3)) for _ in range(args.images)
+    ]
+
+    print(f"{'driver':<10}{'p50_ms':<10}{'p95_ms':<10}{'drain_ms':<10}")
+    with tempfile.TemporaryDirectory() as data_dir:
+        httpd = serve(os.path.join(data_dir, "s3"), port=0)
+        endpoint = f"http://127.0.0.1:{httpd.server_address[1]}"
+        drivers = {
+            "local": LocalStorageDriver(),
+            "s3": S3StorageDriver("benchmark", endpoint_url=endpoint, region_name="us-east-1")
+        }
+        drivers["s3"]._client.create_bucket(Bucket="benchmark")
+        for name, driver in drivers.items():
+            store = ImageStore(os.path.join(data_dir, name), storage=driver)
+            samples = []
+            for image in images:
+                started = time.perf_counter()
+                store.save_image(image, "png")
+                samples.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            driver.flush()
+            drain_ms = (time.perf_counter() - started) * 1000
+            store.close()
+            samples.sort()
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            print(f"{name:<10}{statistics.median(samples):<10.1f}{p95:<10.1f}{drain_ms:<10.1f}")
+        httpd.shutdown()
+    return 0
+
+
+# 典型卡片：标题 + 段落 + 列表 + 表格
+SAMPLE_MARKDOWN = """# 本周产品更新
+
+新版渲染服务已上线，**平均延迟下降 40%**，同时支持更多主题。
+
+## 主要变化
+- 多后端自动回退
+- 任务注册表与预写日志
+- 输出目录分片与内容去重
+
+| 指标 | 上周 | 本周 |
+|------|------|------|
+| P50 延迟 | 820ms | 490ms |
+| 失败率 | 0.8% | 0.2% |
+"""
+
+
+def _render_sample_cards(width: int, height: int):
+    """Render the sample card with the PIL backend for each built-in theme colour pair."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from PIL import Image
+    from word2img_mcp.render import MarkdownRenderer, RenderOptions
+
+    cards = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        # PIL 后端把中间文件写到 ./outputs，切到临时目录避免污染仓库
+        os.chdir(work_dir)
+        try:
+            for background, text in (("#FFFFFF", "#000000"), ("#1E1E1E", "#EEEEEE"), ("#FFF8E7", "#4682B4")):
+                options = RenderOptions(width=width, height=height, background_color=background,
+                                        text_color=text, output_format="png")
+                path = MarkdownRenderer()._render_with_pil(SAMPLE_MARKDOWN, options)
+                with Image.open(path) as img:
+                    img.load()
+                    cards.append(img.copy())
+        finally:
+            os.chdir(cwd)
+    return cards
+
+
+def bench_encode(args: argparse.Namespace) -> int:
+    """Encode time vs. size for every format and encoding profile on typical renders."""
+    import io
+
+    from word2img_mcp.encoding import ENCODING_PROFILES, encode_image, reduce_colors
+
+    cards = _render_sample_cards(args.width, args.height)
+    formats = ["png", "jpg", "webp"]
+    try:
+        from PIL import features
+        if features.check("avif"):
+            formats.append("avif")
+    except ImportError:
+        pass
+
+    # PNG 额外对比调色板优化（耗时包含颜色分析与量化）
+    variants = [(format, "off") for format in formats] + [("png", "lossless"), ("png", "auto")]
+    print(f"{'format':<8}{'palette':<10}{'profile':<10}{'encode_ms':<12}{'max_kb':<10}")
+    for format, palette in variants:
+        for profile in ENCODING_PROFILES:
+            timings = []
+            size = 0
+            for _ in range(args.repeat):
+                for card in cards:
+                    buffer = io.BytesIO()
+                    started = time.perf_counter()
+                    image, _ = reduce_colors(card, palette)
+                    encode_image(image, buffer, format, args.quality, profile)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    size = max(size, buffer.tell())
+            print(f"{format:<8}{palette:<10}{profile:<10}{statistics.median(timings):<12.1f}{size / 1024:<10.1f}")
+    return 0
+
+
+TEMPLATE_MARKDOWN = SAMPLE_MARKDOWN + """
+## 个性化提醒
+亲爱的 {{ name }}，您的账户 {{ account }} 本周共生成 {{ count }} 张图片。
+"""
+
+
+def bench_template(args: argparse.Namespace) -> int:
+    """Per-variant render time: full parse + layout + draw vs. template substitution (PIL backend)."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from word2img_mcp.render import MarkdownRenderer, RenderOptions
+    from word2img_mcp.templates import MarkdownTemplate
+
+    options = RenderOptions(width=args.width, height=args.height, output_format="png")
+    variants = [{"name": f"用户{i}", "account": f"acct-{i:06d}", "count": str(i * 7)} for i in range(args.variants)]
+
+    started = time.perf_counter()
+    template = MarkdownTemplate("bench", TEMPLATE_MARKDOWN, options)
+    prepare_ms = (time.perf_counter() - started) * 1000
+
+    renderer = MarkdownRenderer()
+    full, templated = [], []
+    for values in variants:
+        # 完整路径与 _render_with_pil 相同（不含中间文件编码）
+        started = time.perf_counter()
+        img, draw = renderer._new_pil_canvas(options)
+        segments = renderer._parse_markdown(template.substitute(values))
+        renderer._draw_pil_segments(draw, segments, options, renderer._pil_top_offset(options))
+        renderer._draw_pil_watermark(draw, options)
+        full.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        template.render_pil(values)
+        templated.append((time.perf_counter() - started) * 1000)
+
+    full_p50, template_p50 = statistics.median(full), statistics.median(templated)
+    print(f"variants: {args.variants}  template prepare: {prepare_ms:.1f}ms  "
+          f"static prefix: {template._first_dynamic}/{len(template._segments)} segments")
+    print(f"{'mode':<10}{'p50_ms':<10}{'p95_ms':<10}{'total_s':<10}")
+    for mode, timings in (("full", full), ("template", templated)):
+        p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+        print(f"{mode:<10}{statistics.median(timings):<10.2f}{p95:<10.2f}{sum(timings) / 1000:<10.2f}")
+    print(f"speedup (p50): {full_p50 / template_p50:.1f}x")
+    return 0
+
+
+def bench_incremental(args: argparse.Namespace) -> int:
+    """Resubmitting a document with one paragraph edited: cold vs. layout-cached vs. incremental."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from word2img_mcp.layout import LAYOUT_CACHE, LAYOUT_SNAPSHOTS
+    from word2img_mcp.render import MarkdownRenderer, RenderOptions
+
+    paragraphs = [f"第 {i} 段：" + "渲染服务在多后端之间自动回退，保证每次提交都能得到图片。" * 3
+                  for i in range(args.paragraphs)]
+    documents = []
+    for edit in range(args.edits + 1):
+        edited = list(paragraphs)
+        edited[edit % len(edited)] += f"（修订 {edit}）"
+        documents.append("# 长文档\n\n" + "\n\n".join(edited))
+
+    def render(text: str, base_task_id=None) -> RenderOptions:
+        options = RenderOptions(width=args.width, height=args.height, output_format="png",
+                                base_task_id=base_task_id)
+        MarkdownRenderer()._render_with_pil(text, options)
+        return options
+
+    results = {"cold": [], "layout_cached": [], "incremental": []}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        # PIL 后端把中间文件写到 ./outputs，切到临时目录避免污染仓库
+        os.chdir(work_dir)
+        try:
+            LAYOUT_SNAPSHOTS.put("v0", render(documents[0]).layout_snapshot)
+            redrawn = []
+            for version, text in enumerate(documents[1:], start=1):
+                LAYOUT_CACHE.clear()
+                started = time.perf_counter()
+                render(text)
+                results["cold"].append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                render(text)
+                results["layout_cached"].append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                options = render(text, base_task_id=f"v{version - 1}")
+                results["incremental"].append((time.perf_counter() - started) * 1000)
+                LAYOUT_SNAPSHOTS.put(f"v{version}", options.layout_snapshot)
+                redrawn.append(options.layout_snapshot.stats.get("redrawn_rows", args.height))
+        finally:
+            os.chdir(cwd)
+
+    print(f"paragraphs: {args.paragraphs}  edits: {args.edits}  "
+          f"median redrawn rows: {statistics.median(redrawn):.0f}/{args.height}")
+    print(f"{'mode':<16}{'p50_ms':<10}")
+    for mode, timings in results.items():
+        print(f"{mode:<16}{statistics.median(timings):<10.2f}")
+    return 0
+
+
+def bench_table(args: argparse.Namespace) -> int:
+    """Layout, draw and full PIL render time of a large table."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from word2img_mcp import text_layout
+    from word2img_mcp.layout import LAYOUT_CACHE
+    from word2img_mcp.render import MarkdownRenderer, RenderOptions
+
+    rng = random.Random(42)
+    words = ["渲染", "后端", "回退", "缓存", "latency", "throughput", "p99", "wkhtmltoimage", "队列", "超时"]
+    header = "| " + " | ".join(f"列 {col}" for col in range(args.cols)) + " |"
+    lines = [header, "|" + "---|" * args.cols]
+    for row in range(args.rows):
+        cells = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 12))) for _ in range(args.cols)]
+        cells[0] = f"第 {row} 行"
+        lines.append("| " + " | ".join(cells) + " |")
+    text = "# 大表格\n\n" + "\n".join(lines)
+
+    renderer = MarkdownRenderer()
+    options = RenderOptions(width=args.width, height=args.height, output_format="png")
+    segments = renderer._parse_markdown(text)
+    top = renderer._pil_top_offset(options)
+
+    results = {"layout_cold": [], "layout_cached": [], "draw": [], "render": []}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        # PIL 后端把中间文件写到 ./outputs，切到临时目录避免污染仓库
+        os.chdir(work_dir)
+        try:
+            for _ in range(args.repeat):
+                LAYOUT_CACHE.clear()
+                text_layout._METRICS.clear()
+                started = time.perf_counter()
+                blocks = renderer._layout_pil_segments(segments, options, top)
+                results["layout_cold"].append((time.perf_counter() - started) * 1000)
+
+                LAYOUT_CACHE.clear()
+                started = time.perf_counter()
+                blocks = renderer._layout_pil_segments(segments, options, top)
+                results["layout_cached"].append((time.perf_counter() - started) * 1000)
+
+                _, draw = renderer._new_pil_canvas(options)
+                started = time.perf_counter()
+                renderer._draw_pil_blocks(draw, blocks)
+                results["draw"].append((time.perf_counter() - started) * 1000)
+
+                LAYOUT_CACHE.clear()
+                started = time.perf_counter()
+                renderer._render_with_pil(text, options)
+                results["render"].append((time.perf_counter() - started) * 1000)
+        finally:
+            os.chdir(cwd)
+
+    table = next(block.layout.table for block in blocks if block.layout.kind == "table")
+    print(f"rows: {args.rows}  cols: {args.cols}  canvas: {args.width}x{args.height}  "
+          f"table: {table.width}x{table.height}px  wrapped cells: {table.wrapped_cells}")
+    print("layout_cached: 清空布局缓存，保留字形宽度缓存")
+    print(f"{'stage':<16}{'p50_ms':<10}")
+    for stage, timings in results.items():
+        print(f"{stage:<16}{statistics.median(timings):<10.2f}")
+    return 0
+
+
+def bench_parse(args: argparse.Namespace) -> int:
+    """一次请求从 imgkit 回退到 PIL 时的解析耗时：原先两个后端各自解析，现在共用缓存的解析结果"""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from word2img_mcp.document import DOCUMENT_CACHE, parse_document
+
+    rng = random.Random(7)
+    words = ["渲染", "后端", "回退", "缓存", "**latency**", "`p99`", "[链接](https://example.com)", "队列", "超时"]
+    parts = []
+    for section in range(args.sections):
+        parts.append(f"## 第 {section} 节")
+        parts.append(" ".join(rng.choice(words) for _ in range(60)))
+        parts.append("\n".join(f"- {rng.choice(words)} {rng.choice(words)}" for _ in range(5)))
+        parts.append("| 指标 | 数值 |\n|---|---|\n" + "\n".join(f"| {rng.choice(words)} | {i} |" for i in range(5)))
+        parts.append("```python\nfor item in items:\n    render(item)\n```")
+    text = "\n\n".join(parts)
+
+    results = {}
+    try:
+        import markdown
+
+        def separate() -> None:
+            # 旧流程：imgkit 用 python-markdown 生成 HTML，失败后 PIL 再用 markdown-it-py 解析一次
+            markdown.Markdown(extensions=["tables", "fenced_code", "codehilite", "nl2br", "toc", "attr_list"]).convert(text)
+            parse_document(text)
+        results["separate"] = separate
+    except ImportError:
+        pass
+    results["parse_once"] = lambda: parse_document(text)
+    DOCUMENT_CACHE.get(text)
+    results["cached"] = lambda: (DOCUMENT_CACHE.get(text).html, DOCUMENT_CACHE.get(text).segments)
+
+    print(f"document: {len(text)} chars, {args.sections} sections")
+    print(f"{'mode':<14}{'p50_ms':<10}")
+    for mode, func in results.items():
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"{mode:<14}{statistics.median(timings):<10.3f}")
+    return 0
+
+
+RENDITIONS = [
+    {"width": 1200, "height": 1600, "format": "png"},
+    {"width": 600, "height": 800, "format": "webp", "quality": 80},
+    {"width": 300, "height": 400, "format": "jpg", "quality": 85},
+]
+
+
+def bench_renditions(args: argparse.Namespace) -> int:
+    """submit_markdown 耗时：每种输出单独提交 vs 一次提交并附加 renditions
+
+    --backend pil 使用本地 PIL 后端；--backend api 使用带固定延迟的 render_api_stub.py，
+    代表每次渲染都需要一次外部调用的后端（wkhtmltoimage、md-to-image）。
+    """
+    sys.path.insert(0, str(PROJECT_ROOT))
+    import asyncio
+    import json
+
+    # 基准连续提交，关闭按客户端限流
+    os.environ["WORD2IMG_ADMISSION_CLIENT_RATE"] = "0"
+    server = None
+    if args.backend == "api":
+        import render_api_stub
+
+        server = render_api_stub.serve(port=0, latency_ms=args.latency_ms)
+        os.environ["WORD2IMG_RENDER_API_URL"] = f"http://127.0.0.1:{server.server_port}/convert"
+    from word2img_mcp import mcp_app
+
+    sections = [f"## 第 {i} 节\n\n" + "渲染 **后端** 在 `p99` 超时后回退到下一个后端，结果写入缓存。" * 3 for i in range(6)]
+    base = "# 多尺寸输出\n\n" + "\n\n".join(sections)
+
+    def submit(text: str, output: dict, extra: list) -> dict:
+        arguments = {"markdown_text": text, "width": output["width"], "height": output["height"],
+                     "output_format": output["format"], "quality": output.get("quality", 95),
+                     "backend_preference": "pil" if args.backend == "pil" else "md-to-image", "renditions": extra}
+        return json.loads(asyncio.run(mcp_app._handle_submit_markdown(arguments))[0].text)
+
+    results = {"separate": [], "fanout": []}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            for index in range(args.repeat):
+                # 每轮使用不同文本，避免上一轮的解析和布局缓存
+                text = f"{base}\n\n第 {index} 轮"
+                started = time.perf_counter()
+                for output in RENDITIONS:
+                    submit(text + "（单独）", output, [])
+                results["separate"].append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                info = submit(text + "（合并）", RENDITIONS[0], RENDITIONS[1:])
+                results["fanout"].append((time.perf_counter() - started) * 1000)
+                assert len(info["renditions"]) == len(RENDITIONS) - 1
+        finally:
+            if mcp_app._store is not None:
+                mcp_app._store.close()
+                mcp_app._store = None
+            if server is not None:
+                server.shutdown()
+            os.chdir(cwd)
+
+    print(f"backend: {args.backend}" + (f" (latency {args.latency_ms}ms)" if server else ""))
+    print("outputs: " + ", ".join(f"{o['width']}x{o['height']}.{o['format']}" for o in RENDITIONS))
+    print(f"{'mode':<10}{'p50_ms':<10}")
+    for mode, timings in results.items():
+        print(f"{mode:<10}{statistics.median(timings):<10.1f}")
+    print(f"speedup (p50): {statistics.median(results['separate']) / statistics.median(results['fanout']):.1f}x")
+    return 0
+
+
+def bench_async(args: argparse.Namespace) -> int:
+    """Many concurrent external renders: asyncio subprocesses vs. blocking subprocess.run in threads."""
+    import asyncio
+
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from word2img_mcp.async_render import run_subprocess
+
+    # 用固定耗时的子进程代替外部渲染器（wkhtmltoimage / markdown-pdf）
+    cmd = [sys.executable, "-c", f"import time; time.sleep({args.render_ms / 1000})"]
+
+    async def run(mode: str) -> tuple:
+        peak_threads = threading.active_count()
+
+        async def one() -> None:
+            nonlocal peak_threads
+            if mode == "asyncio":
+                await run_subprocess(cmd, timeout=60)
+            else:
+                await asyncio.to_thread(subprocess.run, cmd, capture_output=True, check=True, timeout=60)
+            peak_threads = max(peak_threads, threading.active_count())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.renders)))
+        return time.perf_counter() - started, peak_threads
+
+    print(f"renders: {args.renders}  per-render: {args.render_ms}ms")
+    print(f"{'mode':<12}{'wall_s':<10}{'peak_threads':<14}")
+    for mode in ("asyncio", "threads"):
+        wall, peak = asyncio.run(run(mode))
+        print(f"{mode:<12}{wall:<10.2f}{peak:<14}")
+    return 0
+
+
+def bench_remote(args: argparse.Namespace) -> int:
+    """Render API latency: a bare requests.post per render vs. the pooled keep-alive client."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    import requests
+
+    import render_api_stub
+    from word2img_mcp.remote import RemoteRenderClient, RemoteRenderConfig
+
+    server = render_api_stub.serve(port=0, latency_ms=args.latency_ms)
+    url = f"http://127.0.0.1:{server.server_port}/convert"
+    payload = {"markdown": "# 基准", "width": args.width, "height": args.height}
+
+    def unpooled(output_file: str) -> None:
+        response = requests.post(url, json=payload, timeout=60)
+        response.raise_for_status()
+        with open(output_file, "wb") as f:
+            f.write(response.content)
+
+    client = RemoteRenderClient(RemoteRenderConfig(urls=(url,)))
+    print(f"renders: {args.renders}  image: {args.width}x{args.height}  server latency: {args.latency_ms}ms")
+    print(f"{'mode':<10}{'p50_ms':<10}{'p99_ms':<10}{'connections':<12}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_file = os.path.join(work_dir, "out.png")
+        for mode, render in (("unpooled", unpooled), ("pooled", lambda path: client.render_to_file(payload, path))):
+            connections = server.state.snapshot()["connections"]
+            timings = []
+            for _ in range(args.renders):
+                started = time.perf_counter()
+                render(output_file)
+                timings.append((time.perf_counter() - started) * 1000)
+            p99 = statistics.quantiles(timings, n=100)[-1] if len(timings) > 1 else timings[0]
+            print(f"{mode:<10}{statistics.median(timings):<10.2f}{p99:<10.2f}"
+                  f"{server.state.snapshot()['connections'] - connections:<12}")
+    client.close()
+    server.shutdown()
+    return 0
+
+
+def bench_hedge(args: argparse.Namespace) -> int:
+    """Tail latency against a farm of stubs with occasional slow responses: one endpoint,
+    least-outstanding balancing, and balancing plus hedged requests."""
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from concurrent.futures import ThreadPoolExecutor
+
+    import render_api_stub
+    from word2img_mcp.remote import REMOTE_HEDGES_TOTAL, EndpointPool, RemoteRenderClient, RemoteRenderConfig
+
+    servers = [render_api_stub.serve(port=0, latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 2,
+                                     spike_rate=args.spike_rate, spike_ms=args.spike_ms)
+               for _ in range(args.endpoints)]
+    urls = tuple(f"http://127.0.0.1:{server.server_port}/convert" for server in servers)
+    payload = {"markdown": "# 基准", "width": 200, "height": 200}
+
+    print(f"endpoints: {args.endpoints}  renders: {args.renders}  concurrency: {args.concurrency}  "
+          f"latency: {args.latency_ms}ms  spikes: {args.spike_rate:.0%} x {args.spike_ms}ms")
+    print(f"{'mode':<10}{'p50_ms':<10}{'p95_ms':<10}{'p99_ms':<10}{'hedges':<8}{'per_endpoint':<20}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for mode, config in (
+            ("single", RemoteRenderConfig(urls=urls[:1], hedge_after=0)),
+            ("balanced", RemoteRenderConfig(urls=urls, hedge_after=0)),
+            ("hedged", RemoteRenderConfig(urls=urls)),
+        ):
+            client = RemoteRenderClient(config, EndpointPool(config))
+            hedges = REMOTE_HEDGES_TOTAL.value(outcome="sent")
+
+            def render(index: int) -> tuple:
+                started = time.perf_counter()
+                result = client.render_to_file(payload, os.path.join(work_dir, f"{index % 64}.png"))
+                return (time.perf_counter() - started) * 1000, result["endpoint"]
+
+            with ThreadPoolExecutor(args.concurrency) as pool:
+                results = list(pool.map(render, range(args.renders)))
+            timings = sorted(duration for duration, _ in results)
+            spread = "/".join(str(sum(1 for _, url in results if url == endpoint)) for endpoint in config.urls)
+            print(f"{mode:<10}{statistics.median(timings):<10.1f}{timings[int(len(timings) * 0.95)]:<10.1f}"
+                  f"{timings[int(len(timings) * 0.99)]:<10.1f}"
+                  f"{int(REMOTE_HEDGES_TOTAL.value(outcome='sent') - hedges):<8}{spread:<20}")
+            client.close()
+    for server in servers:
+        server.shutdown()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="word2img-mcp benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    startup = subparsers.add_parser("startup", help="MCP 服务冷启动时间")
+    startup.add_argument("--runs", type=int, default=5)
+    startup.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    startup.set_defaults(func=bench_startup)
+
+    registry = subparsers.add_parser("registry", help="大规模任务注册表的内存与查询开销")
+    registry.add_argument("--tasks", type=int, default=1_000_000)
+    registry.set_defaults(func=bench_registry)
+
+    wal = subparsers.add_parser("wal", help="预写日志组提交吞吐")
+    wal.add_argument("--writers", default="1,4,16")
+    wal.add_argument("--tasks", type=int, default=2000)
+    wal.add_argument("--dir", default=str(PROJECT_ROOT))
+    wal.set_defaults(func=bench_wal)
+
+    storage = subparsers.add_parser("storage", help="存储驱动对保存延迟的影响（后台上传）")
+    storage.add_argument("--images", type=int, default=40)
+    storage.set_defaults(func=bench_storage)
+
+    encode = subparsers.add_parser("encode", help="各编码档位的编码耗时与文件大小")
+    encode.add_argument("--repeat", type=int, default=5)
+    encode.add_argument("--quality", type=int, default=95)
+    encode.add_argument("--width", type=int, default=1200)
+    encode.add_argument("--height", type=int, default=1600)
+    encode.set_defaults(func=bench_encode)
+
+    template = subparsers.add_parser("template", help="模板渲染与完整渲染的单张耗时对比")
+    template.add_argument("--variants", type=int, default=200)
+    template.add_argument("--width", type=int, default=1200)
+    template.add_argument("--height", type=int, default=1600)
+    template.set_defaults(func=bench_template)
+
+    incremental = subparsers.add_parser("incremental", help="修改单个段落后重新提交的渲染耗时")
+    incremental.add_argument("--edits", type=int, default=20)
+    incremental.add_argument("--paragraphs", type=int, default=12)
+    incremental.add_argument("--width", type=int, default=1200)
+    incremental.add_argument("--height", type=int, default=1600)
+    incremental.set_defaults(func=bench_incremental)
+
+    table = subparsers.add_parser("table", help="大表格的布局、绘制与完整渲染耗时")
+    table.add_argument("--rows", type=int, default=200)
+    table.add_argument("--cols", type=int, default=5)
+    table.add_argument("--repeat", type=int, default=5)
+    table.add_argument("--width", type=int, default=1200)
+    table.add_argument("--height", type=int, default=1600)
+    table.set_defaults(func=bench_table)
+
+    parse = subparsers.add_parser("parse", help="后端回退时重复解析与共享解析缓存的耗时对比")
+    parse.add_argument("--sections", type=int, default=40)
+    parse.add_argument("--repeat", type=int, default=20)
+    parse.set_defaults(func=bench_parse)
+
+    renditions = subparsers.add_parser("renditions", help="多尺寸/多格式输出：分次提交与一次提交的耗时对比")
+    renditions.add_argument("--repeat", type=int, default=10)
+    renditions.add_argument("--backend", choices=["pil", "api"], default="pil")
+    renditions.add_argument("--latency-ms", type=float, default=300.0)
+    renditions.set_defaults(func=bench_renditions)
+
+    async_ = subparsers.add_parser("async", help="大量并发外部渲染时的耗时与线程占用")
+    async_.add_argument("--renders", type=int, default=200)
+    async_.add_argument("--render-ms", type=int, default=500)
+    async_.set_defaults(func=bench_async)
+
+    remote = subparsers.add_parser("remote", help="md-to-image API 客户端的连接复用效果")
+    remote.add_argument("--renders", type=int, default=300)
+    remote.add_argument("--latency-ms", type=float, default=0.0)
+    remote.add_argument("--width", type=int, default=1200)
+    remote.add_argument("--height", type=int, default=1600)
+    remote.set_defaults(func=bench_remote)
+
+    hedge = subparsers.add_parser("hedge", help="多个 API 端点的负载均衡与对冲请求对尾延迟的影响")
+    hedge.add_argument("--endpoints", type=int, default=3)
+    hedge.add_argument("--renders", type=int, default=1000)
+    hedge.add_argument("--concurrency", type=int, default=8)
+    hedge.add_argument("--latency-ms", type=float, default=20.0)
+    hedge.add_argument("--spike-rate", type=float, default=0.03)
+    hedge.add_argument("--spike-ms", type=float, default=300.0)
+    hedge.set_defaults(func=bench_hedge)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+本地 md-to-image 渲染 API 替身服务（仅用于开发、测试和基准测试）
+
+POST /convert 接收与 md-to-image API 相同的 JSON 请求体，返回按 width/height
+生成的纯色 PNG（背景色取 "background"）；GET /health 返回当前状态
+（state.healthy 为 False 时返回 503，用于验证多端点的健康检查）。
+可模拟延迟和故障，用来验证连接复用、重试退避和超时：
+
+    --latency-ms   每个请求的处理时间
+    --jitter-ms    在处理时间上叠加的随机抖动
+    --fail-rate    以该概率返回 503（带 Retry-After: 0）
+    --spike-rate   以该概率额外停顿 --spike-ms（模拟 GC、冷缓存等长尾）
+
+用法:
+    python render_api_stub.py --port 3000 --latency-ms 50 --fail-rate 0.1
+    python render_api_stub.py --port 3001 --latency-ms 50 --jitter-ms 400
+
+    WORD2IMG_RENDER_API_URL=http://127.0.0.1:3000/convert,http://127.0.0.1:3001/convert python -m word2img_mcp
+"""
+
+import argparse
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+
+
+def _parse_color(value: Any) -> Tuple[int, int, int]:
+    if isinstance(value, str) and value.startswith("#") and len(value) == 7:
+        return tuple(int(value[i:i + 2], 16) for i in (1, 3, 5))
+    return (255, 255, 255)
+
+
+def solid_png(width: int, height: int, color: Tuple[int, int, int]) -> bytes:
+    """Encode a solid-colour RGB PNG without Pillow."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    row = b"\x00" + bytes(color) * width
+    raw = zlib.compress(row * height, 6)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", raw) + chunk(b"IEND", b"")
+
+
+class StubState:
+    """Behaviour knobs and counters shared by all handler threads."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, fail_rate: float = 0.0,
+                 spike_rate: float = 0.0, spike_ms: float = 0.0) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate
+        self.spike_rate = spike_rate
+        self.spike_ms = spike_ms
+        self.healthy = True
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.connections = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"status": "ok" if self.healthy else "unhealthy", "requests": self.requests, "failures": self.failures,
+                    "in_flight": self.in_flight, "connections": self.connections}
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # 分块写响应时关闭 Nagle，避免长连接上与延迟确认叠加出 40ms 停顿
+        disable_nagle_algorithm = True
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+        def setup(self) -> None:
+            super().setup()
+            with state.lock:
+                state.connections += 1
+
+        def _send(self, status: int, body: bytes, content_type: str, headers: Dict[str, str] = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            # 分块写出，模拟较大的图片响应
+            try:
+                for offset in range(0, len(body), 16 * 1024):
+                    self.wfile.write(body[offset:offset + 16 * 1024])
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端已放弃（例如对冲请求中落败的一方）
+                self.close_connection = True
+
+        def do_GET(self) -> None:  # noqa: N802 - http.server API
+            if self.path.rstrip("/") != "/health":
+                self._send(404, b"not found", "text/plain")
+                return
+            self._send(200 if state.healthy else 503, json.dumps(state.snapshot()).encode("utf-8"),
+                       "application/json")
+
+        def do_POST(self) -> None:  # noqa: N802 - http.server API
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with state.lock:
+                state.requests += 1
+                state.in_flight += 1
+            try:
+                delay = state.latency_ms + random.uniform(0, state.jitter_ms)
+                if random.random() < state.spike_rate:
+                    delay += state.spike_ms
+                if delay:
+                    time.sleep(delay / 1000)
+                if random.random() < state.fail_rate:
+                    with state.lock:
+                        state.failures += 1
+                    self._send(503, b"overloaded", "text/plain", {"Retry-After": "0"})
+                    return
+                if "markdown" not in payload:
+                    self._send(400, b"missing markdown", "text/plain")
+                    return
+                width = max(1, min(4000, int(payload.get("width", 1200))))
+                height = max(1, min(6000, int(payload.get("height", 1600))))
+                body = solid_png(width, height, _parse_color(payload.get("background")))
+                self._send(200, body, "image/png")
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 3000, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+          fail_rate: float = 0.0, spike_rate: float = 0.0, spike_ms: float = 0.0) -> ThreadingHTTPServer:
+    """Start the stub on a daemon thread and return the server (port 0 = any free port).
+
+    The server's ``state`` attribute holds the counters and behaviour knobs.
+    """
+    state = StubState(latency_ms, jitter_ms, fail_rate, spike_rate, spike_ms)
+    httpd = ThreadingHTTPServer((host, port), make_handler(state))
+    httpd.daemon_threads = True
+    httpd.state = state
+    threading.Thread(target=httpd.serve_forever, name="render-api-stub", daemon=True).start()
+    return httpd
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local md-to-image render API stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--spike-rate", type=float, default=0.0)
+    parser.add_argument("--spike-ms", type=float, default=500.0)
+    args = parser.parse_args()
+
+    state = StubState(args.latency_ms, args.jitter_ms, args.fail_rate, args.spike_rate, args.spike_ms)
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    httpd.daemon_threads = True
+    print(f"🖼️  渲染 API 替身服务: http://{args.host}:{args.port}/convert "
+          f"(延迟 {args.latency_ms}ms, 失败率 {args.fail_rate:.0%})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+本地 S3 兼容替身服务（仅用于开发和基准测试，不做鉴权）
+
+支持 path-style 的 PutObject / GetObject（含 Range）/ HeadObject / DeleteObject、
+CreateBucket 以及分片上传（Create / UploadPart / Complete / Abort），
+足以让 boto3 的 upload_file / download_file 跑通。对象保存在 --dir 目录下。
+
+用法:
+    python s3_standin.py --port 9000 --dir /tmp/s3-standin
+
+    WORD2IMG_STORAGE=s3 WORD2IMG_S3_BUCKET=word2img \\
+    WORD2IMG_S3_ENDPOINT_URL=http://127.0.0.1:9000 \\
+    AWS_ACCESS_KEY_ID=test AWS_SECRET_ACCESS_KEY=test \\
+    python -m word2img_mcp
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+
+def _read_body(handler: BaseHTTPRequestHandler) -> bytes:
+    """Read a request body, decoding HTTP chunked and aws-chunked encodings."""
+    if handler.headers.get("Transfer-Encoding", "").lower() == "chunked":
+        raw = bytearray()
+        while True:
+            size = int(handler.rfile.readline().split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                # 跳过 trailer 直到空行
+                while handler.rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            raw += handler.rfile.read(size)
+            handler.rfile.readline()
+        body = bytes(raw)
+    else:
+        body = handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+
+    if "aws-chunked" in handler.headers.get("Content-Encoding", "") \
+            or handler.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+        decoded = bytearray()
+        pos = 0
+        while pos < len(body):
+            line_end = body.index(b"\r\n", pos)
+            size = int(body[pos:line_end].split(b";")[0], 16)
+            pos = line_end + 2
+            if size == 0:
+                break
+            decoded += body[pos:pos + size]
+            pos += size + 2
+        body = bytes(decoded)
+    return body
+
+
+class S3StandIn:
+    """Object and multipart-upload state kept under one directory."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def object_path(self, bucket: str, key: str) -> str:
+        # key 中的 "/" 映射为子目录；防止跳出根目录
+        parts = [part for part in key.split("/") if part not in ("", ".", "..")]
+        return os.path.join(self.root, bucket, "objects", *parts)
+
+    def upload_dir(self, bucket: str, upload_id: str) -> str:
+        return os.path.join(self.root, bucket, "uploads", re.sub(r"[^0-9a-f]", "", upload_id))
+
+
+def make_handler(state: S3StandIn):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+        def _target(self) -> Tuple[str, str, dict]:
+            url = urlsplit(self.path)
+            bucket, _, key = unquote(url.path).lstrip("/").partition("/")
+            return bucket, key, parse_qs(url.query, keep_blank_values=True)
+
+        def _send(self, status: int, body: bytes = b"", headers: Optional[dict] = None) -> None:
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def _xml(self, status: int, body: str) -> None:
+            payload = ('<?xml version="1.0" encoding="UTF-8"?>' + body).encode("utf-8")
+            self._send(status, payload, {"Content-Type": "application/xml"})
+
+        def _error(self, status: int, code: str, message: str) -> None:
+            self._xml(status, f"<Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>")
+
+        def do_PUT(self) -> None:  # noqa: N802 - http.server API
+            bucket, key, query = self._target()
+            body = _read_body(self)
+            if not key:
+                os.makedirs(os.path.join(state.root, bucket, "objects"), exist_ok=True)
+                self._send(200)
+                return
+            if "uploadId" in query:
+                part_dir = state.upload_dir(bucket, query["uploadId"][0])
+                if not os.path.isdir(part_dir):
+                    self._error(404, "NoSuchUpload", "upload does not exist")
+                    return
+                part_number = int(query["partNumber"][0])
+                with open(os.path.join(part_dir, f"{part_number:05d}"), "wb") as f:
+                    f.write(body)
+                self._send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+                return
+            path = state.object_path(bucket, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            self._send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+        def do_POST(self) -> None:  # noqa: N802 - http.server API
+            bucket, key, query = self._target()
+            body = _read_body(self)
+            if "uploads" in query:
+                upload_id = uuid.uuid4().hex
+                os.makedirs(state.upload_dir(bucket, upload_id))
+                self._xml(200, (
+                    "<InitiateMultipartUploadResult>"
+                    f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                    f"<UploadId>{upload_id}</UploadId>"
+                    "</InitiateMultipartUploadResult>"
+                ))
+                return
+            if "uploadId" in query:
+                part_dir = state.upload_dir(bucket, query["uploadId"][0])
+                if not os.path.isdir(part_dir):
+                    self._error(404, "NoSuchUpload", "upload does not exist")
+                    return
+                part_numbers = [int(n) for n in re.findall(rb"<PartNumber>(\d+)</PartNumber>", body)]
+                path = state.object_path(bucket, key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                digest = hashlib.md5()
+                tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                with open(tmp_path, "wb") as out:
+                    for number in part_numbers:
+                        with open(os.path.join(part_dir, f"{number:05d}"), "rb") as part:
+                            data = part.read()
+                        digest.update(hashlib.md5(data).digest())
+                        out.write(data)
+                os.replace(tmp_path, path)
+                shutil.rmtree(part_dir, ignore_errors=True)
+                etag = f"{digest.hexdigest()}-{len(part_numbers)}"
+                self._xml(200, (
+                    "<CompleteMultipartUploadResult>"
+                    f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key>"
+                    f"<ETag>&quot;{etag}&quot;</ETag>"
+                    "</CompleteMultipartUploadResult>"
+                ))
+                return
+            self._error(400, "InvalidRequest", "unsupported POST")
+
+        def do_GET(self) -> None:  # noqa: N802 - http.server API
+            bucket, key, _ = self._target()
+            path = state.object_path(bucket, key)
+            if not key or not os.path.isfile(path):
+                self._error(404, "NoSuchKey", "The specified key does not exist.")
+                return
+            with open(path, "rb") as f:
+                data = f.read()
+            headers = {"ETag": f'"{hashlib.md5(data).hexdigest()}"', "Content-Type": "application/octet-stream"}
+            match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else len(data) - 1
+                end = min(end, len(data) - 1)
+                headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+                self._send(206, data[start:end + 1], headers)
+                return
+            self._send(200, data, headers)
+
+        def do_HEAD(self) -> None:  # noqa: N802 - http.server API
+            bucket, key, _ = self._target()
+            path = state.object_path(bucket, key)
+            if not key:
+                self._send(200 if os.path.isdir(os.path.join(state.root, bucket)) else 404)
+                return
+            if not os.path.isfile(path):
+                self._send(404)
+                return
+            with open(path, "rb") as f:
+                etag = hashlib.md5(f.read()).hexdigest()
+            self.send_response(200)
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("ETag", f'"{etag}"')
+            self.send_header("Content-Type", "application/octet-stream")
+            self.end_headers()
+
+        def do_DELETE(self) -> None:  # noqa: N802 - http.server API
+            bucket, key, query = self._target()
+            if "uploadId" in query:
+                shutil.rmtree(state.upload_dir(bucket, query["uploadId"][0]), ignore_errors=True)
+            else:
+                try:
+                    os.remove(state.object_path(bucket, key))
+                except FileNotFoundError:
+                    pass
+            self._send(204)
+
+    return Handler
+
+
+def serve(root: str, host: str = "127.0.0.1", port: int = 9000) -> ThreadingHTTPServer:
+    """Start the stand-in on a daemon thread and return the server (port 0 = any free port)."""
+    httpd = ThreadingHTTPServer((host, port), make_handler(S3StandIn(root)))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="s3-standin", daemon=True).start()
+    return httpd
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local S3-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--dir", default="s3-standin-data")
+    args = parser.parse_args()
+
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(S3StandIn(args.dir)))
+    print(f"🪣 S3 替身服务: http://{args.host}:{args.port} (数据目录 {os.path.abspath(args.dir)})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+@pytest.fixture
+def outputs_dir(tmp_path, monkeypatch):
+    """A fresh working directory, so anything written to ./outputs stays inside the test."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "outputs"
@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+import pytest
+
+from word2img_mcp.admission import AdmissionController, AdmissionPolicy, AdmissionRejected
+
+MB = 1024 * 1024
+
+
+def controller(**overrides):
+    policy = AdmissionPolicy(memory_budget_bytes=100 * MB, max_queue=4, queue_timeout=5.0,
+                             client_rate=0, client_burst=20)
+    for name, value in overrides.items():
+        setattr(policy, name, value)
+    return AdmissionController(policy)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_admits_within_budget_and_queues_in_fifo_order():
+    async def scenario():
+        admission = controller()
+        first = await admission.acquire("a", 60 * MB)
+        order = []
+
+        async def waiter(name, cost):
+            granted = await admission.acquire(name, cost)
+            order.append(name)
+            return granted
+
+        large = asyncio.ensure_future(waiter("large", 80 * MB))
+        await asyncio.sleep(0)
+        small = asyncio.ensure_future(waiter("small", 10 * MB))
+        await asyncio.sleep(0.01)
+        # 小请求放得下，但不能插队到排在前面的大请求之前
+        assert order == []
+        assert admission.status()["queued_renders"] == 2
+        first.release()
+        for granted in await asyncio.gather(large, small):
+            granted.release()
+        return order, admission.status()
+
+    order, status = run(scenario())
+    assert order == ["large", "small"]
+    assert status["in_use_bytes"] == 0 and status["active_renders"] == 0
+
+
+def test_render_larger_than_budget_runs_alone():
+    async def scenario():
+        admission = controller()
+        granted = await admission.acquire("a", 500 * MB)
+        assert granted.cost == 100 * MB
+        granted.release()
+
+    run(scenario())
+
+
+def test_queue_full_is_rejected_and_refunds_the_token():
+    async def scenario():
+        admission = controller(max_queue=0, client_rate=60, client_burst=2)
+        held = await admission.acquire("a", 100 * MB)
+        for _ in range(3):
+            with pytest.raises(AdmissionRejected) as rejected:
+                await admission.acquire("a", 10 * MB)
+            assert rejected.value.reason == "queue_full"
+            assert rejected.value.retry_after >= 1
+        # 被拒绝的请求没有渲染，不应消耗限流配额
+        assert admission._buckets["a"].tokens == pytest.approx(1, abs=0.01)
+        held.release()
+
+    run(scenario())
+
+
+def test_queue_timeout_is_rejected():
+    async def scenario():
+        admission = controller(queue_timeout=0.05)
+        held = await admission.acquire("a", 100 * MB)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("b", 10 * MB)
+        assert rejected.value.reason == "queue_timeout"
+        assert admission.status()["queued_renders"] == 0
+        held.release()
+
+    run(scenario())
+
+
+def test_client_over_its_rate_is_rejected_with_retry_after():
+    async def scenario():
+        admission = controller(client_rate=6, client_burst=1)
+        (await admission.acquire("a", MB)).release()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("a", MB)
+        assert rejected.value.reason == "rate_limited"
+        # 每分钟 6 个令牌：下一个令牌约 10 秒后
+        assert 9 <= rejected.value.retry_after <= 10
+        # 其他客户端不受影响
+        (await admission.acquire("b", MB)).release()
+
+    run(scenario())
+
+
+def test_reserved_memory_counts_against_the_budget():
+    reserved = {"bytes": 50 * MB}
+
+    async def scenario():
+        admission = AdmissionController(
+            AdmissionPolicy(memory_budget_bytes=100 * MB, max_queue=4, queue_timeout=0.05, client_rate=0),
+            reserved=lambda: reserved["bytes"])
+        # 没有在途渲染时总是放行
+        held = await admission.acquire("a", 40 * MB)
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire("b", 20 * MB)
+        reserved["bytes"] = 0
+        (await admission.acquire("b", 20 * MB)).release()
+        held.release()
+        return admission.status()
+
+    assert run(scenario())["reserved_bytes"] == 0
+
+
+def test_tool_call_returns_rejection_as_structured_error(outputs_dir, monkeypatch):
+    from word2img_mcp import mcp_app
+
+    admission = controller(client_rate=6, client_burst=1)
+    monkeypatch.setattr(mcp_app, "_admission", admission)
+    run(admission.acquire("client-1", MB)).release()
+
+    result = run(mcp_app.handle_call_tool(
+        "submit_markdown", {"markdown_text": "# hi", "client_id": "client-1"}))
+    assert result.isError
+    assert result.structuredContent["reason"] == "rate_limited"
+    assert result.structuredContent["retry_after"] >= 1
+    assert json.loads(result.content[0].text) == result.structuredContent
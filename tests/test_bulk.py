@@ -0,0 +1,51 @@
+import threading
+import time
+
+import pytest
+
+from word2img_mcp import bulk
+from word2img_mcp.bulk import BulkJob, BulkRenderer
+from word2img_mcp.store import ImageStore
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def fast_render(job_id, markdown_text, render_kwargs):
+    """Stand-in for render_job: renders are instant, so only saving can fall behind."""
+    return {"job_id": job_id, "image": Image.new("RGB", (64, 48), "#336699"), "backend_used": "pil-fallback",
+            "backend_failures": [], "render_ms": 0.0, "resolved": {"output_format": "png", "quality": 95}}
+
+
+def test_slow_saves_stop_the_job_stream(tmp_path, monkeypatch):
+    store = ImageStore(base_dir=str(tmp_path / "store"))
+    renderer = BulkRenderer(store, str(tmp_path / "manifest.jsonl"), workers=1, save_workers=1)
+    max_pending = renderer.workers * 4
+    release = threading.Event()
+    save = renderer._save
+    consumed = []
+
+    def blocked_save(*args):
+        release.wait(timeout=30)
+        return save(*args)
+
+    def jobs():
+        for i in range(40):
+            consumed.append(i)
+            yield BulkJob(f"doc-{i}", f"# 文档 {i}", {})
+
+    monkeypatch.setattr(renderer, "_save", blocked_save)
+    monkeypatch.setattr(bulk, "render_job", fast_render)
+    runner = threading.Thread(target=renderer.run, args=(jobs(),))
+    runner.start()
+    try:
+        # 保存全部被阻塞：渲染完成的结果不能无限堆积，任务流应停在 max_pending
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and len(consumed) < max_pending:
+            time.sleep(0.05)
+        time.sleep(0.5)
+        assert len(consumed) == max_pending
+    finally:
+        release.set()
+        runner.join(timeout=60)
+        store.close()
+    assert renderer.summary.completed == 40
@@ -0,0 +1,145 @@
+import os
+import threading
+import uuid
+from datetime import datetime
+
+import pytest
+
+from word2img_mcp import registry as registry_module
+from word2img_mcp.journal import JournaledTaskRegistry, list_segments
+from word2img_mcp.registry import TaskRecord
+
+
+def make_record(status="completed"):
+    return TaskRecord(str(uuid.uuid4()), datetime.now().isoformat(), status, "png", 1234)
+
+
+def crash(registry):
+    """Stop the background threads without compacting, as if the process died."""
+    registry._stopping = True
+    registry._compact_requested.set()
+    registry._compactor.join()
+    registry._wal.close()
+    registry._snapshot.close()
+
+
+def test_records_survive_crash_before_compaction(tmp_path):
+    registry = JournaledTaskRegistry(str(tmp_path))
+    records = [make_record() for _ in range(5)]
+    registry.add_many(records[:3])
+    registry.add(records[3])
+    registry.add(records[4])
+    registry.update(records[0].task_id, status="failed")
+    registry.delete(records[1].task_id)
+    crash(registry)
+    assert list_segments(str(tmp_path))
+
+    reopened = JournaledTaskRegistry(str(tmp_path))
+    try:
+        assert reopened.recovered_records == 7
+        assert len(reopened) == 4
+        assert reopened.get(records[0].task_id).status == "failed"
+        assert reopened.get(records[1].task_id) is None
+        assert reopened.get(records[4].task_id).file_size == 1234
+        # 重放后的日志段已折叠进快照并删除
+        assert [segment for segment, _ in list_segments(str(tmp_path))] == [reopened._wal.segment]
+    finally:
+        reopened.close()
+
+
+def test_torn_record_at_end_of_segment_is_discarded(tmp_path):
+    registry = JournaledTaskRegistry(str(tmp_path))
+    kept = make_record()
+    registry.add(kept)
+    segment_path = registry._wal.segment_path(registry._wal.segment)
+    crash(registry)
+    frame = registry._wal.encode({"op": "put", "task": make_record().to_dict()})
+    with open(segment_path, "ab") as f:
+        f.write(frame[:len(frame) // 2])
+
+    reopened = JournaledTaskRegistry(str(tmp_path))
+    try:
+        assert reopened.recovered_records == 1
+        assert len(reopened) == 1
+        assert reopened.get(kept.task_id) is not None
+    finally:
+        reopened.close()
+
+
+def test_failed_compaction_keeps_records_and_retries(tmp_path, monkeypatch):
+    registry = JournaledTaskRegistry(str(tmp_path))
+    first = [make_record() for _ in range(3)]
+    registry.add_many(first)
+
+    fold = registry._fold_into_snapshot
+
+    def failing_fold(overlay):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(registry, "_fold_into_snapshot", failing_fold)
+    with pytest.raises(OSError):
+        registry.compact()
+    assert all(registry.get(record.task_id) is not None for record in first)
+
+    second = make_record()
+    registry.add(second)
+    monkeypatch.setattr(registry, "_fold_into_snapshot", fold)
+    assert registry.compact() == 4
+    assert registry._sealed == {} and registry._sealed_segments == []
+    assert [segment for segment, _ in list_segments(str(tmp_path))] == [registry._wal.segment]
+    registry.close()
+
+    reopened = JournaledTaskRegistry(str(tmp_path))
+    try:
+        assert len(reopened) == 4
+        assert reopened.get(second.task_id) is not None
+    finally:
+        reopened.close()
+
+
+def test_replaying_a_compacted_segment_is_idempotent(tmp_path):
+    registry = JournaledTaskRegistry(str(tmp_path))
+    record = make_record()
+    registry.add(record)
+    segment_path = registry._wal.segment_path(registry._wal.segment)
+    with open(segment_path, "rb") as f:
+        segment = f.read()
+    registry.compact()
+    crash(registry)
+    # 压缩后、删除日志段前崩溃：同一日志段会被再次重放
+    with open(segment_path, "wb") as f:
+        f.write(segment)
+
+    reopened = JournaledTaskRegistry(str(tmp_path))
+    try:
+        assert len(reopened) == 1
+        assert reopened.get(record.task_id).task_id == record.task_id
+        assert [path for _, path in list_segments(str(tmp_path))] == [reopened._wal.segment_path(reopened._wal.segment)]
+        assert os.path.getsize(reopened._wal.segment_path(reopened._wal.segment)) == 0
+    finally:
+        reopened.close()
+
+
+def test_iteration_does_not_block_writers(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry_module, "ITER_BATCH", 3)
+    registry = JournaledTaskRegistry(str(tmp_path))
+    records = [make_record() for _ in range(10)]
+    for index, record in enumerate(records):
+        record.created_at = datetime(2024, 1, 1, 0, 0, index).isoformat()
+    registry.add_many(records[:8])
+    registry.compact()
+    registry.add_many(records[8:])
+    registry.update(records[2].task_id, status="failed")
+    try:
+        newest = registry.iter_records(newest_first=True)
+        assert next(newest).task_id == records[9].task_id
+        # 迭代器挂起时写入者不被阻塞
+        writer = threading.Thread(target=registry.add, args=(make_record(),))
+        writer.start()
+        writer.join(timeout=5)
+        assert not writer.is_alive()
+        assert [record.task_id for record in newest] == [record.task_id for record in reversed(records[:9])]
+        assert [record.task_id for record in registry.iter_records()][:10] == [record.task_id for record in records]
+        assert [record.task_id for record in registry.iter_records(status="failed")] == [records[2].task_id]
+    finally:
+        registry.close()
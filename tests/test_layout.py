@@ -0,0 +1,32 @@
+import pytest
+
+from word2img_mcp.layout import RenderSnapshot, SnapshotStore
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def snapshot(width, height):
+    return RenderSnapshot("canvas", Image.new("RGB", (width, height)), [], {})
+
+
+def test_snapshots_are_bounded_by_bytes():
+    store = SnapshotStore(max_entries=10, max_bytes=3 * 100 * 100 * 3)
+    for task_id in "abcd":
+        store.put(task_id, snapshot(100, 100))
+    # 最旧的快照被淘汰，总字节数不超过上限
+    assert store.get("a") is None
+    assert len(store) == 3 and store.nbytes == 3 * 100 * 100 * 3
+
+    store.put("b", snapshot(50, 100))
+    assert store.nbytes == 2 * 100 * 100 * 3 + 50 * 100 * 3
+    store.discard("c")
+    assert store.nbytes == 100 * 100 * 3 + 50 * 100 * 3
+
+
+def test_canvas_larger_than_the_budget_is_not_kept():
+    store = SnapshotStore(max_entries=10, max_bytes=100 * 100 * 3)
+    store.put("a", snapshot(100, 100))
+    store.put("big", snapshot(200, 200))
+    assert store.get("big") is None
+    assert store.get("a") is not None
+    assert store.nbytes == 100 * 100 * 3
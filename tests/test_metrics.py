@@ -0,0 +1,52 @@
+import asyncio
+import functools
+
+from word2img_mcp.admission import AdmissionController, AdmissionPolicy
+from word2img_mcp.metrics import (
+    CACHE_HITS_TOTAL,
+    CACHE_MISSES_TOTAL,
+    RENDER_QUEUE_DEPTH,
+    render_metrics,
+    track_lru_cache,
+)
+
+MB = 1024 * 1024
+
+
+def test_lru_cache_feeds_cache_counters_on_scrape():
+    @functools.lru_cache(maxsize=4)
+    def square(x):
+        return x * x
+
+    track_lru_cache("test_square", square)
+    square(2), square(2), square(3)
+    render_metrics()
+    assert CACHE_HITS_TOTAL.value(cache="test_square") == 1
+    assert CACHE_MISSES_TOTAL.value(cache="test_square") == 2
+
+    # cache_clear() 之后计数从零重新累计，计数器不会回退
+    square.cache_clear()
+    square(2), square(2)
+    text = render_metrics()
+    assert CACHE_HITS_TOTAL.value(cache="test_square") == 2
+    assert CACHE_MISSES_TOTAL.value(cache="test_square") == 3
+    assert 'word2img_cache_hits_total{cache="test_square"} 2' in text
+
+
+def test_queue_depth_counts_renders_waiting_for_admission():
+    admission = AdmissionController(AdmissionPolicy(memory_budget_bytes=100 * MB, max_queue=4,
+                                                    queue_timeout=5.0, client_rate=0, client_burst=20))
+
+    async def scenario():
+        first = await admission.acquire("a", 80 * MB)
+        waiters = [asyncio.ensure_future(admission.acquire("b", 80 * MB)) for _ in range(2)]
+        await asyncio.sleep(0)
+        depth = RENDER_QUEUE_DEPTH.value()
+        first.release()
+        second = await waiters[0]
+        second.release()
+        (await waiters[1]).release()
+        return depth
+
+    assert asyncio.run(scenario()) == 2
+    assert RENDER_QUEUE_DEPTH.value() == 0
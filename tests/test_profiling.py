@@ -0,0 +1,40 @@
+import asyncio
+import threading
+
+import pytest
+
+from word2img_mcp.async_render import AsyncMarkdownRenderer
+from word2img_mcp.profiling import RenderProfiler
+from word2img_mcp.render import RenderOptions
+
+
+def test_profiled_render_runs_in_a_worker_thread(outputs_dir, monkeypatch):
+    pytest.importorskip("PIL")
+    renderer = AsyncMarkdownRenderer(profiler=RenderProfiler())
+    render_with_pil = renderer._render_with_pil
+    threads = []
+
+    def tracked(text, options):
+        threads.append(threading.get_ident())
+        return render_with_pil(text, options)
+
+    monkeypatch.setattr(renderer, "_render_with_pil", tracked)
+
+    async def render():
+        with renderer.profiler:
+            return await renderer.render("# 标题\n\n正文", RenderOptions(backend_preference="pil"))
+
+    loop_thread = threading.get_ident()
+    asyncio.run(render())
+
+    # 渲染不在事件循环线程上执行，但剖析报告仍包含工作线程中的调用
+    assert threads and threads[0] != loop_thread
+    assert renderer.profiler.active
+    assert "tracked" in renderer.profiler.report()
+
+
+def test_profile_without_cpu_steps_still_reports():
+    with RenderProfiler() as profiler:
+        pass
+    assert profiler.summary()["profiled"] is True
+    assert "no CPU-bound steps" in profiler.report()
@@ -0,0 +1,35 @@
+import uuid
+from datetime import datetime
+
+from word2img_mcp.registry import TaskRecord, TaskRegistry
+
+
+def make_record(format="png", file_size=100):
+    return TaskRecord(str(uuid.uuid4()), datetime.now().isoformat(), "completed", format, file_size)
+
+
+def test_statistics_are_maintained_across_writes(tmp_path):
+    registry = TaskRegistry(str(tmp_path))
+    records = [make_record("png", 100) for _ in range(5)] + [make_record("jpg", 50) for _ in range(3)]
+    registry.add_many(records[:4])
+    assert len(registry) == 4
+    registry.add_many(records[4:])
+    # 从中间删除、改状态、原地覆盖已有任务
+    registry.delete(records[2].task_id)
+    registry.delete(records[6].task_id)
+    registry.update(records[0].task_id, status="failed")
+    records[1].file_size = 1000
+    registry.add(records[1])
+
+    expected = {"counts": {"completed": 5, "failed": 1}, "formats": {"png": 4, "jpg": 2},
+                "total_size": 100 * 2 + 1000 + 50 * 2 + 100}
+    assert registry.statistics() == expected
+    assert len(registry) == 6
+    registry.close()
+
+    # 重新打开后扫描得到的结果一致
+    reopened = TaskRegistry(str(tmp_path))
+    try:
+        assert reopened.statistics() == expected
+    finally:
+        reopened.close()
@@ -0,0 +1,17 @@
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_cold_start_within_budget():
+    """``benchmark.py startup`` exits non-zero when the median cold start exceeds the budget
+    or the server module eagerly imports a render backend."""
+    result = subprocess.run(
+        [sys.executable, str(PROJECT_ROOT / "benchmark.py"), "startup", "--runs", "3"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
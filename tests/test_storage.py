@@ -0,0 +1,60 @@
+import pytest
+
+from word2img_mcp import storage
+from word2img_mcp.storage import StorageDriver
+
+
+class FlakyDriver(StorageDriver):
+    """Fails the first ``failures`` uploads, then stores keys in memory."""
+
+    name = "flaky"
+    remote = True
+
+    def __init__(self, failures, upload_retries):
+        super().__init__(upload_workers=1, upload_retries=upload_retries)
+        self.failures = failures
+        self.attempts = 0
+        self.objects = {}
+
+    def upload(self, key, path):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("connection reset")
+        with open(path, "rb") as f:
+            self.objects[key] = f.read()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_RETRY_BASE_DELAY", 0.0)
+
+
+@pytest.fixture
+def image_file(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"png bytes")
+    return str(path)
+
+
+def test_transient_upload_failures_are_retried(image_file):
+    driver = FlakyDriver(failures=2, upload_retries=3)
+    driver.submit("ab/cd/task.png", image_file).result()
+    driver.close()
+    assert driver.objects == {"ab/cd/task.png": b"png bytes"}
+    status = driver.status()
+    assert (status["uploaded"], status["retried"], status["failed"], status["awaiting_retry"]) == (1, 2, 0, 0)
+
+
+def test_upload_failing_after_retries_is_kept_for_a_later_attempt(image_file, monkeypatch):
+    driver = FlakyDriver(failures=3, upload_retries=2)
+    with pytest.raises(ConnectionError):
+        driver.submit("ab/cd/task.png", image_file).result()
+    assert driver.failed_uploads == {"ab/cd/task.png": image_file}
+    assert driver.status()["last_error"].startswith("ab/cd/task.png: ConnectionError")
+
+    # 下一次上传时重新提交之前失败的对象
+    monkeypatch.setattr(storage, "FAILED_UPLOAD_RETRY_INTERVAL", 0.0)
+    driver.submit("ef/gh/other.png", image_file).result()
+    driver.close()
+    assert set(driver.objects) == {"ab/cd/task.png", "ef/gh/other.png"}
+    assert driver.failed_uploads == {}
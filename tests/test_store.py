@@ -0,0 +1,127 @@
+import errno
+import hashlib
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+import pytest
+
+from word2img_mcp.store import ImageStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ImageStore(base_dir=str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_legacy_tasks_json_sets_aside_entries_the_registry_cannot_hold(tmp_path):
+    good, bad_status, bad_format, bad_date = (str(uuid.uuid4()) for _ in range(4))
+    now = datetime.now().isoformat()
+    tasks = {
+        good: {"created_at": now, "status": "completed", "format": "png", "file_size": 10},
+        bad_status: {"created_at": now, "status": "exploded", "format": "png", "file_size": 10},
+        bad_format: {"created_at": now, "status": "completed", "format": "tiff-lzw", "file_size": 10},
+        bad_date: {"created_at": "yesterday", "status": "completed", "format": "png", "file_size": 10},
+        "not-a-uuid": {"created_at": now, "status": "completed", "format": "png", "file_size": 10},
+    }
+    tasks_file = tmp_path / "tasks.json"
+    tasks_file.write_text(json.dumps(tasks), encoding="utf-8")
+
+    store = ImageStore(base_dir=str(tmp_path))
+    try:
+        assert len(store._registry) == 1
+        assert store._registry.get(good) is not None
+    finally:
+        store.close()
+
+    rejected = json.loads((tmp_path / "tasks.json.rejected").read_text(encoding="utf-8"))
+    assert set(rejected) == {bad_status, bad_format, bad_date}
+    assert all(entry["error"] for entry in rejected.values())
+    assert not tasks_file.exists()
+    assert (tmp_path / "tasks.json.migrated").exists()
+
+    # 迁移只做一次：重新打开不会再次导入或失败
+    reopened = ImageStore(base_dir=str(tmp_path))
+    try:
+        assert len(reopened._registry) == 1
+    finally:
+        reopened.close()
+
+
+def test_corrupt_tasks_json_is_kept_for_inspection(tmp_path):
+    (tmp_path / "tasks.json").write_text("{not json", encoding="utf-8")
+    store = ImageStore(base_dir=str(tmp_path))
+    try:
+        assert len(store._registry) == 0
+    finally:
+        store.close()
+    assert (tmp_path / "tasks.json.corrupt").exists()
+
+
+def test_identical_images_share_one_blob(store):
+    Image = pytest.importorskip("PIL.Image")
+    image = Image.new("RGB", (64, 48), "#336699")
+    first = store.save_image(image, format="png")
+    second = store.save_image(image, format="png")
+
+    metadata = store.get_task_metadata(first)
+    blob_path = store._blob_path(metadata["content_sha256"], "png")
+    assert store.get_task_metadata(second)["content_sha256"] == metadata["content_sha256"]
+    assert os.stat(blob_path).st_nlink == 3
+
+    store.delete_task(first)
+    assert os.stat(blob_path).st_nlink == 2
+    store.delete_task(second)
+    assert not os.path.exists(blob_path)
+
+
+def test_racing_blob_writers_share_one_inode(store, tmp_path):
+    data = b"\x89PNG racing writers" * 64
+    digest = hashlib.sha256(data).hexdigest()
+    paths = [str(tmp_path / f"task{i}.png") for i in range(16)]
+    barrier = threading.Barrier(len(paths))
+    results = []
+
+    def write(path):
+        barrier.wait()
+        results.append(store._write_blob(data, digest, "png", path))
+
+    threads = [threading.Thread(target=write, args=(path,)) for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    blob_path = store._blob_path(digest, "png")
+    # 恰好一个写入者写入了字节，其余都链接到同一个 inode
+    assert results.count(False) == 1
+    assert os.stat(blob_path).st_nlink == len(paths) + 1
+    assert {os.stat(path).st_ino for path in paths} == {os.stat(blob_path).st_ino}
+    assert not [name for name in os.listdir(os.path.dirname(blob_path)) if name.endswith(".tmp")]
+
+
+def test_filesystem_without_hard_links_stores_private_copies(store, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+
+    def no_links(src, dst):
+        if not os.path.exists(src):
+            raise FileNotFoundError(errno.ENOENT, "No such file or directory", src)
+        raise OSError(errno.EPERM, "Operation not permitted")
+
+    monkeypatch.setattr(os, "link", no_links)
+    image = Image.new("RGB", (64, 48), "#336699")
+    first = store.save_image(image, format="png")
+    second = store.save_image(image, format="png")
+
+    for task_id in (first, second):
+        path = store.get_path(task_id)
+        assert os.stat(path).st_nlink == 1
+        with Image.open(path) as saved:
+            assert saved.size == (64, 48)
+            assert saved.convert("RGB").getpixel((0, 0)) == (0x33, 0x66, 0x99)
+        assert store.get_task_metadata(task_id)["deduplicated"] is False
+    assert not os.path.exists(store._blob_path(store.get_task_metadata(first)["content_sha256"], "png"))
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from word2img_mcp import mcp_app
+from word2img_mcp.admission import estimate_render_bytes
+from word2img_mcp.layout import SnapshotStore
+from word2img_mcp.store import ImageStore
+
+pytest.importorskip("PIL")
+
+
+@pytest.fixture
+def store(outputs_dir, monkeypatch):
+    store = ImageStore(base_dir=str(outputs_dir))
+    monkeypatch.setattr(mcp_app, "_store", store)
+    monkeypatch.setattr(mcp_app, "_admission", None)
+    monkeypatch.setattr(mcp_app, "LAYOUT_SNAPSHOTS", SnapshotStore(max_entries=4, max_bytes=64 * 1024 * 1024))
+    yield store
+    store.close()
+
+
+def submit(**arguments):
+    arguments.setdefault("backend_preference", "pil")
+    result = asyncio.run(mcp_app._handle_submit_markdown({"markdown_text": "# 标题\n\n正文", **arguments}))
+    return json.loads(result[0].text)
+
+
+def test_image_work_runs_off_the_event_loop(store, monkeypatch):
+    threads = {}
+    load_group_images = mcp_app._load_group_images
+    save_image = store.save_image
+
+    def tracked_load(*args):
+        threads["load"] = threading.get_ident()
+        return load_group_images(*args)
+
+    def tracked_save(*args, **kwargs):
+        threads["save"] = threading.get_ident()
+        return save_image(*args, **kwargs)
+
+    monkeypatch.setattr(mcp_app, "_load_group_images", tracked_load)
+    monkeypatch.setattr(store, "save_image", tracked_save)
+
+    task = submit(width=400, height=300, renditions=[{"width": 200}])
+    assert task["status"] == "completed" and len(task["renditions"]) == 1
+    # 解码、缩放和保存都不在事件循环线程上执行
+    assert threading.get_ident() not in threads.values()
+    assert set(threads) == {"load", "save"}
+
+
+def test_snapshot_is_kept_only_at_the_main_image_size(store):
+    task = submit(width=400, height=300)
+    snapshot = mcp_app.LAYOUT_SNAPSHOTS.get(task["task_id"])
+    assert snapshot is not None and snapshot.image.size == (400, 300)
+
+    # 主图由 800x600 的母版缩放而来：母版画布不能作为主图的增量快照保存
+    task = submit(width=400, height=300, renditions=[{"width": 800}])
+    assert task["options"]["resampled_from"] == "800x600"
+    assert mcp_app.LAYOUT_SNAPSHOTS.get(task["task_id"]) is None
+
+
+def test_admission_is_charged_for_every_group(store, monkeypatch):
+    admission = mcp_app._get_admission()
+    acquire = admission.acquire
+    charged = []
+
+    async def tracked(client_id, nbytes):
+        charged.append(nbytes)
+        return await acquire(client_id, nbytes)
+
+    monkeypatch.setattr(admission, "acquire", tracked)
+    # 4:3 的主图与 1:1 的附加输出分成两组，各渲染一次
+    submit(width=400, height=300, renditions=[{"width": 200, "height": 200}])
+    assert charged == [estimate_render_bytes(400, 300) + estimate_render_bytes(200, 200)]
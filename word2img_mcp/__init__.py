@@ -5,19 +5,40 @@ word2img-mcp: Markdown to Image MCP Server
 支持 imgkit/wkhtmltopdf、markdown-pdf、PIL 等多种渲染后端。
 """
 
+import importlib
+
 __version__ = "1.0.0"
 __author__ = "mcp"
 __description__ = "MCP service to render Markdown text into high-quality images"
 
-from .render import RenderOptions, render_markdown_text_to_image, MarkdownRenderer
-from .mcp_app import server, run_server
-from .store import ImageStore
+# 子模块按需导入（PEP 562），避免 `import word2img_mcp` 时加载 MCP SDK 和渲染后端
+_LAZY_ATTRIBUTES = {
+    "RenderOptions": ".render",
+    "render_markdown_text_to_image": ".render",
+    "MarkdownRenderer": ".render",
+    "server": ".mcp_app",
+    "run_server": ".mcp_app",
+    "ImageStore": ".store",
+}
 
 __all__ = [
     "RenderOptions",
-    "render_markdown_text_to_image", 
+    "render_markdown_text_to_image",
     "MarkdownRenderer",
     "server",
     "run_server",
     "ImageStore"
 ]
+
+
+def __getattr__(name: str):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,17 +1,119 @@
 #!/usr/bin/env python3
 """
 word2img-mcp MCP 服务启动入口
+
+用法:
+    python -m word2img_mcp                      启动 MCP 服务
+    python -m word2img_mcp migrate-layout       将旧的平铺输出目录迁移到分片布局
+    python -m word2img_mcp render docs/ a.jsonl 批量渲染目录、glob 或 JSONL（- 为标准输入），可断点续跑
 """
 
+import argparse
 import asyncio
-from .mcp_app import run_server
+import json
+import os
+import sys
+
+
+def _serve() -> int:
+    from .mcp_app import run_server
 
-if __name__ == "__main__":
     print("🚀 启动 word2img-mcp MCP 服务...")
     print("📊 支持的工具:")
     print("  - submit_markdown: 提交 Markdown 文本生成图片")
     print("  - get_image: 获取生成的图片")
     print("🎨 渲染后端: imgkit/wkhtmltopdf (优先), markdown-pdf, PIL")
     print("⏳ 等待客户端连接...")
-    
+
     asyncio.run(run_server())
+    return 0
+
+
+def _migrate_layout(args: argparse.Namespace) -> int:
+    from .store import ImageStore
+
+    store = ImageStore(args.base_dir)
+    try:
+        report = store.migrate_to_sharded_layout(batch_size=args.batch_size)
+    finally:
+        store.close()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+def _render(args: argparse.Namespace) -> int:
+    from .bulk import MANIFEST_NAME, BulkRenderer, iter_jobs
+    from .storage import storage_driver_from_env
+    from .store import ImageStore
+
+    defaults = {
+        name: value for name, value in (
+            ("output_format", args.format),
+            ("theme", args.theme),
+            ("width", args.width),
+            ("height", args.height),
+            ("quality", args.quality),
+            ("encoding_profile", args.encoding_profile),
+            ("palette", args.palette),
+        ) if value is not None
+    }
+    if args.options:
+        defaults.update(json.loads(args.options))
+
+    base_dir = os.path.abspath(args.base_dir)
+    store = ImageStore(base_dir, storage=storage_driver_from_env())
+    renderer = BulkRenderer(
+        store,
+        manifest_path=args.manifest or os.path.join(base_dir, MANIFEST_NAME),
+        workers=args.workers,
+        save_workers=args.save_workers,
+        resume=not args.no_resume,
+        progress=sys.stderr,
+        results=None if args.quiet else sys.stdout,
+    )
+    try:
+        summary = renderer.run(iter_jobs(args.sources, defaults))
+    except KeyboardInterrupt:
+        print("⏹️  已中断，重新运行同一命令即可从断点继续", file=sys.stderr)
+        return 130
+    finally:
+        store.close()
+    print(json.dumps(summary.to_dict(), ensure_ascii=False), file=sys.stderr)
+    return 1 if summary.failed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="word2img_mcp", description="word2img-mcp MCP 服务")
+    subparsers = parser.add_subparsers(dest="command")
+
+    migrate = subparsers.add_parser("migrate-layout", help="将平铺的输出目录迁移到 ab/cd/ 分片布局")
+    migrate.add_argument("--base-dir", default="outputs")
+    migrate.add_argument("--batch-size", type=int, default=1000)
+    migrate.set_defaults(func=_migrate_layout)
+
+    render = subparsers.add_parser("render", help="批量渲染 Markdown 文件、目录、glob 或 JSONL 到输出目录")
+    render.add_argument("sources", nargs="+", help="Markdown 文件、目录、glob、.jsonl 文件或 -（标准输入 JSONL）")
+    render.add_argument("--base-dir", default="outputs")
+    render.add_argument("--manifest", help="进度清单路径（默认 <base-dir>/bulk-manifest.jsonl）")
+    render.add_argument("--no-resume", action="store_true", help="忽略清单中已完成的任务，全部重新渲染")
+    render.add_argument("--workers", type=int, help="渲染进程数（默认 CPU 核数）")
+    render.add_argument("--save-workers", type=int, default=4, help="编码并写入存储的线程数")
+    render.add_argument("--format", choices=["png", "jpg", "jpeg", "webp", "avif"])
+    render.add_argument("--theme")
+    render.add_argument("--width", type=int)
+    render.add_argument("--height", type=int)
+    render.add_argument("--quality", type=int)
+    render.add_argument("--encoding-profile", choices=["fast", "balanced", "smallest"])
+    render.add_argument("--palette", choices=["off", "lossless", "auto"])
+    render.add_argument("--options", help="其余默认渲染选项（JSON 对象），JSONL 每行可覆盖")
+    render.add_argument("--quiet", action="store_true", help="不在标准输出逐条打印结果")
+    render.set_defaults(func=_render)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        return _serve()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
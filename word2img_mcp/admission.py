@@ -0,0 +1,299 @@
+"""
+Admission control for renders.
+
+Every render is charged an estimated memory cost before it starts:
+``width * height`` pixels at 4 bytes each (RGBA worst case), times the
+number of full-size copies a render holds at once (the canvas, the image
+loaded back for saving, and the encoder's working buffer).  A 4000x6000
+render costs ~288 MB, the default 1200x1600 ~23 MB.
+
+``AdmissionController`` admits renders while their total cost fits in a
+global memory budget.  Renders that do not fit wait in a FIFO queue (so a
+large render is not starved by a stream of small ones) for at most
+``queue_timeout`` seconds; when the queue is full or the wait times out the
+render is rejected with a ``retry_after`` hint (and its rate-limit token is
+given back, since nothing was rendered).  A render larger than the
+whole budget is charged the whole budget, i.e. it runs alone.
+
+Each client also has a token bucket (``client_rate`` renders per minute,
+bursts of ``client_burst``); a client over its rate is rejected at once with
+the time until its next token as ``retry_after``.  Clients are identified
+by the ``client_id`` tool argument, or by their MCP session.
+
+Memory held between renders (the PIL canvas snapshots kept for incremental
+renders, see layout.py) is reported through the ``reserved`` callback and
+counted against the same budget.  When nothing is rendering, the first
+waiter is admitted regardless, so retained memory cannot stall the queue.
+
+Configuration:
+    WORD2IMG_ADMISSION_MEMORY_MB       global render memory budget (default 1024)
+    WORD2IMG_ADMISSION_MAX_QUEUE       renders allowed to wait (default 32)
+    WORD2IMG_ADMISSION_QUEUE_TIMEOUT   seconds a render may wait (default 30)
+    WORD2IMG_ADMISSION_CLIENT_RATE     renders per minute per client, 0 disables (default 120)
+    WORD2IMG_ADMISSION_CLIENT_BURST    token bucket size per client (default 20)
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional
+
+from .metrics import REGISTRY, RENDER_QUEUE_DEPTH
+
+ADMISSION_MEMORY_MB_ENV = "WORD2IMG_ADMISSION_MEMORY_MB"
+ADMISSION_MAX_QUEUE_ENV = "WORD2IMG_ADMISSION_MAX_QUEUE"
+ADMISSION_QUEUE_TIMEOUT_ENV = "WORD2IMG_ADMISSION_QUEUE_TIMEOUT"
+ADMISSION_CLIENT_RATE_ENV = "WORD2IMG_ADMISSION_CLIENT_RATE"
+ADMISSION_CLIENT_BURST_ENV = "WORD2IMG_ADMISSION_CLIENT_BURST"
+
+BYTES_PER_PIXEL = 4
+# 画布、保存前重新载入的图片、编码器缓冲区
+WORKING_COPIES = 3
+# 令牌桶数量超过该值时清理已回满（长时间空闲）的客户端
+MAX_TRACKED_CLIENTS = 4096
+
+ADMISSION_IN_USE_BYTES = REGISTRY.gauge(
+    "word2img_admission_in_use_bytes", "Estimated memory of admitted renders.")
+ADMISSION_REJECTIONS_TOTAL = REGISTRY.counter(
+    "word2img_admission_rejections_total", "Renders rejected by admission control.", ["reason"])
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "word2img_admission_wait_seconds", "Time admitted renders spent waiting for budget.")
+
+
+def estimate_render_bytes(width: int, height: int) -> int:
+    """Estimated peak memory of one render at ``width`` x ``height``."""
+    return int(width) * int(height) * BYTES_PER_PIXEL * WORKING_COPIES
+
+
+class AdmissionRejected(RuntimeError):
+    """The render was not admitted; the client should retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, reason: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionPolicy:
+    """Limits enforced by the admission controller."""
+
+    memory_budget_bytes: int = 1024 * 1024 * 1024
+    max_queue: int = 32
+    queue_timeout: float = 30.0
+    client_rate: float = 120.0
+    client_burst: int = 20
+
+    @classmethod
+    def from_env(cls) -> "AdmissionPolicy":
+        memory_mb = os.environ.get(ADMISSION_MEMORY_MB_ENV)
+        max_queue = os.environ.get(ADMISSION_MAX_QUEUE_ENV)
+        queue_timeout = os.environ.get(ADMISSION_QUEUE_TIMEOUT_ENV)
+        client_rate = os.environ.get(ADMISSION_CLIENT_RATE_ENV)
+        client_burst = os.environ.get(ADMISSION_CLIENT_BURST_ENV)
+        return cls(
+            memory_budget_bytes=int(float(memory_mb) * 1024 * 1024) if memory_mb else 1024 * 1024 * 1024,
+            max_queue=int(max_queue) if max_queue else 32,
+            queue_timeout=float(queue_timeout) if queue_timeout else 30.0,
+            client_rate=float(client_rate) if client_rate else 120.0,
+            client_burst=max(1, int(client_burst)) if client_burst else 20
+        )
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        self.tokens = tokens
+        self.updated = updated
+
+
+class _Waiter:
+    __slots__ = ("cost", "future", "loop", "granted")
+
+    def __init__(self, cost: int) -> None:
+        self.cost = cost
+        self.loop = asyncio.get_running_loop()
+        self.future: asyncio.Future = self.loop.create_future()
+        self.granted = False
+
+    def wake(self) -> None:
+        self.granted = True
+        self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class Admission:
+    """An admitted render; ``release`` returns its cost to the budget (idempotent)."""
+
+    def __init__(self, controller: "AdmissionController", cost: int, waited: float) -> None:
+        self.controller = controller
+        self.cost = cost
+        self.waited = waited
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.controller._release(self.cost, time.monotonic() - self._started)
+
+
+class AdmissionController:
+    """Global memory budget with a FIFO wait queue, plus per-client rate limits."""
+
+    def __init__(self, policy: AdmissionPolicy, reserved: Optional[Callable[[], int]] = None) -> None:
+        self.policy = policy
+        # 渲染之间仍占用的内存（如增量渲染快照），计入同一预算
+        self._reserved = reserved or (lambda: 0)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._active = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._rejected: Dict[str, int] = {}
+        # 单次渲染占用预算时长的指数平均，用于估算 retry_after
+        self._hold_seconds = 1.0
+
+    async def acquire(self, client_id: str, cost: int) -> Admission:
+        """Admit a render of estimated ``cost`` bytes for ``client_id``, waiting for budget if needed.
+
+        Raises ``AdmissionRejected`` when the client is over its rate, the
+        queue is full, or the wait exceeds ``queue_timeout``.
+        """
+        started = time.monotonic()
+        cost = min(max(0, cost), self.policy.memory_budget_bytes)
+        with self._lock:
+            self._take_token(client_id)
+            if not self._waiters and self._fits(cost):
+                self._grant(cost)
+                return Admission(self, cost, 0.0)
+            if len(self._waiters) >= self.policy.max_queue:
+                # 未渲染的请求不消耗限流配额
+                self._refund_token(client_id)
+                raise self._reject("queue_full", f"渲染队列已满（{self.policy.max_queue}），请稍后重试")
+            waiter = _Waiter(cost)
+            self._waiters.append(waiter)
+            RENDER_QUEUE_DEPTH.set(len(self._waiters))
+
+        try:
+            await asyncio.wait({waiter.future}, timeout=self.policy.queue_timeout)
+        except BaseException:
+            # 调用方被取消：若恰好已获准入，归还预算
+            self._abandon(waiter, keep=False)
+            raise
+        if not self._abandon(waiter, keep=True):
+            with self._lock:
+                self._refund_token(client_id)
+            raise self._reject("queue_timeout",
+                               f"等待渲染资源超过 {self.policy.queue_timeout:g}s，请稍后重试", locked=False)
+        waited = time.monotonic() - started
+        ADMISSION_WAIT_SECONDS.observe(waited)
+        return Admission(self, cost, waited)
+
+    def _abandon(self, waiter: _Waiter, keep: bool) -> bool:
+        """Leave the queue; returns True if the waiter was granted and ``keep`` holds on to the grant."""
+        with self._lock:
+            if waiter.granted:
+                if not keep:
+                    self._release_locked(waiter.cost, 0.0)
+                return keep
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+            RENDER_QUEUE_DEPTH.set(len(self._waiters))
+            self._wake_waiters()
+            return False
+
+    def _take_token(self, client_id: str) -> None:
+        rate = self.policy.client_rate
+        if rate <= 0:
+            return
+        now = time.monotonic()
+        bucket = self._buckets.get(client_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_CLIENTS:
+                self._prune_buckets(now)
+            bucket = self._buckets[client_id] = _TokenBucket(self.policy.client_burst, now)
+        bucket.tokens = min(self.policy.client_burst, bucket.tokens + (now - bucket.updated) * rate / 60)
+        bucket.updated = now
+        if bucket.tokens < 1:
+            retry_after = (1 - bucket.tokens) * 60 / rate
+            raise self._reject("rate_limited", f"客户端 {client_id} 超过每分钟 {rate:g} 次渲染的限制",
+                               retry_after=retry_after)
+        bucket.tokens -= 1
+
+    def _refund_token(self, client_id: str) -> None:
+        bucket = self._buckets.get(client_id)
+        if bucket is not None and self.policy.client_rate > 0:
+            bucket.tokens = min(self.policy.client_burst, bucket.tokens + 1)
+
+    def _prune_buckets(self, now: float) -> None:
+        full_after = self.policy.client_burst * 60 / self.policy.client_rate
+        for client_id in [c for c, b in self._buckets.items() if now - b.updated >= full_after]:
+            del self._buckets[client_id]
+
+    def _reject(self, reason: str, message: str, retry_after: Optional[float] = None,
+                locked: bool = True) -> AdmissionRejected:
+        if not locked:
+            with self._lock:
+                return self._reject(reason, message, retry_after)
+        if retry_after is None:
+            # 粗略估计：排在前面的渲染按当前并发度完成所需的时间
+            retry_after = self._hold_seconds * (len(self._waiters) / max(1, self._active) + 1)
+        retry_after = max(1, math.ceil(retry_after))
+        self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        ADMISSION_REJECTIONS_TOTAL.inc(reason=reason)
+        return AdmissionRejected(message, reason, retry_after)
+
+    def _fits(self, cost: int) -> bool:
+        # 没有在途渲染时总是放行，保留内存不能让队列永远等待
+        return self._active == 0 or self._in_use + self._reserved() + cost <= self.policy.memory_budget_bytes
+
+    def _grant(self, cost: int) -> None:
+        self._in_use += cost
+        self._active += 1
+        ADMISSION_IN_USE_BYTES.set(self._in_use)
+
+    def _release(self, cost: int, held: float) -> None:
+        with self._lock:
+            self._release_locked(cost, held)
+
+    def _release_locked(self, cost: int, held: float) -> None:
+        self._in_use -= cost
+        self._active -= 1
+        if held > 0:
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held
+        ADMISSION_IN_USE_BYTES.set(self._in_use)
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        # 严格先进先出：队首放不下时后面的小请求也不插队，避免大图饿死
+        while self._waiters and self._fits(self._waiters[0].cost):
+            waiter = self._waiters.popleft()
+            self._grant(waiter.cost)
+            waiter.wake()
+        RENDER_QUEUE_DEPTH.set(len(self._waiters))
+
+    def status(self) -> Dict[str, Any]:
+        """Current load, for get_render_info."""
+        with self._lock:
+            return {
+                "memory_budget_bytes": self.policy.memory_budget_bytes,
+                "in_use_bytes": self._in_use,
+                "reserved_bytes": self._reserved(),
+                "utilization": round((self._in_use + self._reserved()) / self.policy.memory_budget_bytes, 3)
+                if self.policy.memory_budget_bytes else None,
+                "active_renders": self._active,
+                "queued_renders": len(self._waiters),
+                "max_queue": self.policy.max_queue,
+                "queue_timeout_seconds": self.policy.queue_timeout,
+                "client_rate_per_minute": self.policy.client_rate,
+                "client_burst": self.policy.client_burst,
+                "tracked_clients": len(self._buckets),
+                "rejected": dict(self._rejected),
+            }
@@ -0,0 +1,185 @@
+"""
+Async-native rendering.
+
+``AsyncMarkdownRenderer`` tries the same backends in the same order as
+``MarkdownRenderer``, but never blocks the event loop on external work:
+
+* wkhtmltoimage, markdown-pdf and md-to-image run as asyncio subprocesses
+  under the process supervisor (supervisor.py): own process group, rlimits,
+  wall-clock timeout.  On timeout or cancellation (for example the MCP
+  client went away) the whole group is killed and reaped before the error
+  propagates;
+* the md-to-image API is called through the async client in remote.py
+  (httpx keep-alive pool per event loop, same retry, timeout, balancing and
+  hedging policy as the blocking backend);
+* CPU-bound steps (Markdown to HTML, the PIL backend, PDF conversion) run in
+  the default thread pool, or inline when ``offload_cpu`` is False.  Profiled
+  renders stay in the thread pool: each step runs through
+  ``RenderProfiler.call``, which enables cProfile inside the worker thread.
+
+``asyncio.CancelledError`` is not an ``Exception``, so a cancelled render
+skips the fallback loop and reaches the caller instead of trying the next
+backend.
+"""
+
+import asyncio
+import os
+import tempfile
+from typing import Any, Callable, List, Optional, Tuple
+
+from .metrics import (
+    RENDER_BACKEND_FAILURES_TOTAL,
+    RENDER_DURATION_SECONDS,
+    RENDER_FAILURES_TOTAL,
+    RENDER_FALLBACKS_TOTAL,
+    RENDERS_TOTAL,
+)
+from .profiling import RenderProfiler
+from .remote import get_async_remote_client
+from .render import IMGKIT_AVAILABLE, MarkdownRenderer, RenderOptions
+from .supervisor import SUPERVISOR, run_subprocess  # noqa: F401 - run_subprocess re-exported
+from .timing import StageTimer
+
+
+class AsyncMarkdownRenderer(MarkdownRenderer):
+    """Markdown渲染器的异步版本：外部进程和 HTTP 调用不占用线程，可随请求取消"""
+
+    def __init__(self, subprocess_timeout: Optional[float] = None, offload_cpu: bool = True,
+                 profiler: Optional[RenderProfiler] = None):
+        super().__init__()
+        # None: 使用 WORD2IMG_RENDER_TIMEOUT（见 supervisor.py）
+        self.subprocess_timeout = subprocess_timeout
+        self.offload_cpu = offload_cpu
+        self.profiler = profiler
+
+    async def render(self, text: str, options: RenderOptions, timer: Optional[StageTimer] = None) -> str:
+        """渲染Markdown为图片，逐个尝试后端；取消会立即终止当前后端并向上传播"""
+        timer = timer or StageTimer()
+        self._timer = timer
+        failed_attempts = 0
+        try:
+            for backend in self._backend_order(text, options):
+                skipped = SUPERVISOR.skip(backend)
+                if skipped is not None:
+                    self._record_failure(options, backend, skipped, 0.0)
+                    continue
+                attempt = {}
+                try:
+                    with timer.stage(f"render.{backend}", backend=backend) as attempt:
+                        if backend == 'imgkit-wkhtmltopdf':
+                            path = await self._render_with_imgkit_async(text, options)
+                        elif backend == 'markdown-pdf-cli':
+                            path = await self._render_with_markdown_pdf_async(text, options)
+                        elif backend == 'md-to-image-cli':
+                            path = await self._render_with_cli_async(text, options)
+                        elif backend == 'md-to-image-api':
+                            path = await self._render_with_api_async(text, options)
+                        elif backend == 'pil-fallback':
+                            path = await self._cpu(self._render_with_pil, text, options)
+                        else:
+                            continue
+                    options.backend_used = backend
+                    RENDERS_TOTAL.inc(backend=backend)
+                    RENDER_DURATION_SECONDS.observe(attempt["duration_ms"] / 1000, backend=backend)
+                    if failed_attempts:
+                        RENDER_FALLBACKS_TOTAL.inc()
+                    return path
+                except Exception as e:
+                    failed_attempts += 1
+                    RENDER_BACKEND_FAILURES_TOTAL.inc(backend=backend)
+                    self._record_failure(options, backend, e, attempt.get("duration_ms", 0.0))
+                    continue
+        finally:
+            self._timer = None
+
+        RENDER_FAILURES_TOTAL.inc()
+        raise RuntimeError(f"所有渲染后端都失败了: {self._failure_summary(options)}")
+
+    async def _cpu(self, func: Callable, *args: Any) -> Any:
+        """CPU 密集的步骤放到线程池执行（offload_cpu=False 时在当前线程执行）"""
+        if self.profiler is not None:
+            # 剖析器在执行该步骤的线程内启用，不会采样事件循环上的其他请求
+            func, args = self.profiler.call, (func, *args)
+        if self.offload_cpu:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def _run(self, cmd: List[str], backend: str, input: Optional[bytes] = None) -> Tuple[bytes, bytes]:
+        return await SUPERVISOR.run_async(cmd, backend, input, timeout=self.subprocess_timeout)
+
+    async def _render_with_imgkit_async(self, text: str, options: RenderOptions) -> str:
+        """直接调用 wkhtmltoimage（HTML 经 stdin 传入），与 imgkit.from_string 的参数一致"""
+        if not IMGKIT_AVAILABLE:
+            raise RuntimeError("imgkit不可用")
+        output_file = self._output_file("imgkit", options.output_format)
+        cmd = self._wkhtmltoimage_command(output_file, options)
+
+        with self._stage("render.imgkit.markdown_to_html"):
+            html_content = await self._cpu(self._markdown_to_html, text, options)
+
+        with self._stage("render.imgkit.wkhtmltoimage"):
+            await self._run(cmd, "imgkit-wkhtmltopdf", html_content.encode("utf-8"))
+        if not output_file.exists():
+            raise RuntimeError("图片文件未生成")
+        return str(output_file)
+
+    async def _render_with_markdown_pdf_async(self, text: str, options: RenderOptions) -> str:
+        """使用markdown-pdf CLI渲染（异步子进程）"""
+        md_file = await self._write_temp_markdown(text)
+        try:
+            pdf_file = self._output_file("md_pdf", "pdf")
+            await self._run(self._markdown_pdf_command(md_file, pdf_file), "markdown-pdf-cli")
+            output_file = pdf_file.with_suffix(f".{options.output_format}")
+            return await self._cpu(self._pdf_to_image, pdf_file, output_file, options)
+        finally:
+            self._unlink(md_file)
+
+    async def _render_with_cli_async(self, text: str, options: RenderOptions) -> str:
+        """使用md-to-image CLI渲染（异步子进程）"""
+        md_file = await self._write_temp_markdown(text)
+        try:
+            output_file = self._output_file("md_cli", options.output_format)
+            await self._run(self._cli_command(md_file, output_file, options), "md-to-image-cli")
+            if not output_file.exists():
+                raise RuntimeError("输出文件未生成")
+            return str(output_file)
+        finally:
+            self._unlink(md_file)
+
+    async def _render_with_api_async(self, text: str, options: RenderOptions) -> str:
+        """使用HTTP API渲染（httpx 异步客户端，响应流式写入文件）"""
+        output_file = self._output_file("md_api", options.output_format)
+        try:
+            with self._stage("render.api.request"):
+                await get_async_remote_client(self.md_to_image_api_urls).render_to_file(
+                    self._api_payload(text, options), str(output_file))
+            return str(output_file)
+        except ImportError:
+            raise RuntimeError("httpx 不可用，无法使用 md-to-image API 异步后端") from None
+        except Exception as e:
+            raise RuntimeError(f"API请求失败: {e}") from e
+
+    async def _write_temp_markdown(self, text: str) -> str:
+        def write() -> str:
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.md', delete=False, encoding='utf-8') as f:
+                f.write(text)
+                return f.name
+        return await self._cpu(write)
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+async def render_markdown_text_to_image_async(md_text: str, options: Optional[RenderOptions] = None,
+                                              timer: Optional[StageTimer] = None,
+                                              offload_cpu: bool = True,
+                                              profiler: Optional[RenderProfiler] = None) -> str:
+    """渲染Markdown文本为图片文件（异步，可取消）"""
+    if options is None:
+        options = RenderOptions()
+    renderer = AsyncMarkdownRenderer(offload_cpu=offload_cpu, profiler=profiler)
+    return await renderer.render(md_text, options, timer=timer)
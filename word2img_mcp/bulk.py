@@ -0,0 +1,369 @@
+"""
+Bulk rendering for backfills: ``python -m word2img_mcp render``.
+
+Sources may be Markdown files, directories (``*.md`` / ``*.markdown``,
+recursively), glob patterns, JSONL files or ``-`` for JSONL on stdin.  Each
+JSONL line is one document::
+
+    {"id": "post-42", "markdown_text": "# ...", "theme": "dark", "output_format": "webp"}
+
+``path`` may replace ``markdown_text`` (relative to the JSONL file), and
+render options may be given flat or under ``"options"``; they override the
+command-line defaults.  Documents are rendered in a process pool, and the
+parent saves results into the ``ImageStore`` from a few threads (encoding
+releases the GIL, and concurrent registry writes share one WAL flush).
+
+Every finished job is appended to a manifest (JSONL).  Rerunning the same
+command skips jobs whose id and content digest are already recorded as
+completed, so an interrupted backfill resumes where it stopped; failed jobs
+are retried.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, fields
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Set
+
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+JSONL_SUFFIXES = (".jsonl", ".ndjson")
+MANIFEST_NAME = "bulk-manifest.jsonl"
+
+# 逐行可覆盖的选项：RenderOptions 字段 + ImageStore 编码参数
+STORE_OPTION_NAMES = ("encoding_profile", "palette")
+_INTERNAL_RENDER_FIELDS = ("backend_used", "base_task_id", "layout_snapshot", "backend_preference",
+                          "backend_failures")
+
+
+def render_option_names() -> List[str]:
+    from .render import RenderOptions
+
+    return [f.name for f in fields(RenderOptions) if f.name not in _INTERNAL_RENDER_FIELDS]
+
+
+@dataclass
+class BulkJob:
+    """One document to render; ``digest`` covers the text and the options."""
+
+    job_id: str
+    markdown_text: str
+    options: Dict[str, Any]
+    digest: str = ""
+
+    def __post_init__(self) -> None:
+        if not self.digest:
+            payload = json.dumps([self.markdown_text, self.options], sort_keys=True, ensure_ascii=False)
+            self.digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class BulkSummary:
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed_s": round(elapsed, 3),
+            "images_per_s": round(self.completed / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+# ---------------------------------------------------------------- sources
+
+def _jobs_from_jsonl(stream: IO[str], source: str, base_dir: str,
+                     defaults: Dict[str, Any]) -> Iterator[BulkJob]:
+    for lineno, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        job_id = f"{source}:{lineno}"
+        try:
+            entry = json.loads(line)
+            job_id = str(entry.pop("id", job_id))
+            text = entry.pop("markdown_text", None)
+            path = entry.pop("path", None)
+            if text is None:
+                if path is None:
+                    raise ValueError("每行需要 markdown_text 或 path")
+                with open(os.path.join(base_dir, path), "r", encoding="utf-8") as f:
+                    text = f.read()
+            options = {**defaults, **entry.pop("options", {}), **entry}
+        except (OSError, ValueError) as e:
+            # 坏行记为失败任务，不中断整个批次
+            yield BulkJob(job_id, "", {"__error__": f"{type(e).__name__}: {e}"})
+            continue
+        yield BulkJob(job_id, text, options)
+
+
+def _markdown_file_job(path: str, defaults: Dict[str, Any]) -> BulkJob:
+    with open(path, "r", encoding="utf-8") as f:
+        return BulkJob(os.path.relpath(path), f.read(), dict(defaults))
+
+
+def _expand_source(source: str) -> List[str]:
+    if os.path.isdir(source):
+        matches = [
+            path for suffix in MARKDOWN_SUFFIXES
+            for path in glob.glob(os.path.join(source, "**", f"*{suffix}"), recursive=True)
+        ]
+        return sorted(matches)
+    if glob.has_magic(source):
+        return sorted(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+    return [source]
+
+
+def iter_jobs(sources: Iterable[str], defaults: Optional[Dict[str, Any]] = None,
+              stdin: Optional[IO[str]] = None) -> Iterator[BulkJob]:
+    """Yield jobs from files, directories, globs, JSONL files and ``-`` (stdin), lazily."""
+    defaults = defaults or {}
+    for source in sources:
+        if source == "-":
+            yield from _jobs_from_jsonl(stdin or sys.stdin, "stdin", os.getcwd(), defaults)
+            continue
+        for path in _expand_source(source):
+            if path.lower().endswith(JSONL_SUFFIXES):
+                with open(path, "r", encoding="utf-8") as f:
+                    yield from _jobs_from_jsonl(f, os.path.relpath(path), os.path.dirname(path), defaults)
+            else:
+                try:
+                    yield _markdown_file_job(path, defaults)
+                except OSError as e:
+                    yield BulkJob(os.path.relpath(path), "", {"__error__": f"{type(e).__name__}: {e}"})
+
+
+# ---------------------------------------------------------------- manifest
+
+def load_completed(manifest_path: str) -> Set[tuple]:
+    """(job_id, digest) pairs recorded as completed; a torn last line is ignored."""
+    completed: Set[tuple] = set()
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("status") == "completed":
+                completed.add((entry.get("job_id"), entry.get("digest")))
+    return completed
+
+
+# ---------------------------------------------------------------- workers
+
+def _init_worker(work_dir: str) -> None:
+    # 渲染后端把中间文件写到 ./outputs，每个工作进程在私有目录中运行
+    path = os.path.join(work_dir, str(os.getpid()))
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+
+
+def render_job(job_id: str, markdown_text: str, render_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Render one document in a worker process; returns the decoded image and backend."""
+    from PIL import Image
+
+    from .render import RenderOptions, render_markdown_text_to_image
+
+    started = time.perf_counter()
+    options = RenderOptions(**render_kwargs)
+    path = render_markdown_text_to_image(markdown_text, options)
+    try:
+        with Image.open(path) as img:
+            img.load()
+            image = img.copy()
+    finally:
+        os.remove(path)
+    return {
+        "job_id": job_id,
+        "image": image,
+        "backend_used": options.backend_used,
+        "backend_failures": options.backend_failures,
+        "render_ms": round((time.perf_counter() - started) * 1000, 3),
+        "resolved": {name: getattr(options, name) for name in render_option_names()},
+    }
+
+
+def split_options(options: Dict[str, Any]) -> tuple:
+    """Split per-job options into RenderOptions kwargs and ImageStore kwargs."""
+    allowed = set(render_option_names())
+    unknown = sorted(set(options) - allowed - set(STORE_OPTION_NAMES))
+    if unknown:
+        raise ValueError(f"未知的渲染选项: {unknown}")
+    render_kwargs = {name: value for name, value in options.items() if name in allowed}
+    if "width" in render_kwargs and "height" not in render_kwargs:
+        from .render import ASPECT_RATIO
+
+        render_kwargs["height"] = int(render_kwargs["width"] * ASPECT_RATIO[1] / ASPECT_RATIO[0])
+    store_kwargs = {name: options[name] for name in STORE_OPTION_NAMES if name in options}
+    return render_kwargs, store_kwargs
+
+
+# ---------------------------------------------------------------- driver
+
+class BulkRenderer:
+    """Render jobs with a process pool and save them into an ``ImageStore``."""
+
+    def __init__(self, store, manifest_path: str, workers: Optional[int] = None, save_workers: int = 4,
+                 resume: bool = True, progress: Optional[IO[str]] = None,
+                 results: Optional[IO[str]] = None, progress_interval: float = 2.0) -> None:
+        self.store = store
+        self.manifest_path = manifest_path
+        self.workers = workers or os.cpu_count() or 1
+        self.save_workers = max(1, save_workers)
+        self.resume = resume
+        self.progress = progress
+        self.results = results
+        self.progress_interval = progress_interval
+        self.summary = BulkSummary()
+        self._manifest_lock = threading.Lock()
+        self._last_progress = 0.0
+
+    def _record(self, manifest: IO[str], entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._manifest_lock:
+            manifest.write(line + "\n")
+            manifest.flush()
+            if entry["status"] == "completed":
+                self.summary.completed += 1
+            else:
+                self.summary.failed += 1
+            if self.results is not None:
+                self.results.write(line + "\n")
+                self.results.flush()
+        self._report()
+
+    def _report(self, final: bool = False) -> None:
+        if self.progress is None:
+            return
+        now = time.perf_counter()
+        if not final and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        s = self.summary
+        done = s.completed + s.failed
+        print(f"⏳ 已处理 {done}/{s.total - s.skipped} (失败 {s.failed}, 跳过 {s.skipped}) "
+              f"{s.completed / max(s.elapsed, 1e-9):.1f} 张/秒", file=self.progress, flush=True)
+
+    def _save(self, job: BulkJob, result: Dict[str, Any], store_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        image = result["image"]
+        resolved = result["resolved"]
+        storage_options = {
+            **resolved,
+            **store_kwargs,
+            "backend_used": result["backend_used"],
+            "bulk_job_id": job.job_id,
+        }
+        if result["backend_failures"]:
+            storage_options["backend_failures"] = result["backend_failures"]
+        task_id = self.store.save_image(
+            image, format=resolved["output_format"], options=storage_options,
+            quality=resolved["quality"], **store_kwargs
+        )
+        return {
+            "job_id": job.job_id,
+            "digest": job.digest,
+            "status": "completed",
+            "task_id": task_id,
+            "backend_used": result["backend_used"],
+            "render_ms": result["render_ms"],
+        }
+
+    def _failure(self, job: BulkJob, error: BaseException) -> Dict[str, Any]:
+        return {
+            "job_id": job.job_id,
+            "digest": job.digest,
+            "status": "failed",
+            "error": str(error),
+            "error_type": type(error).__name__,
+        }
+
+    def run(self, jobs: Iterable[BulkJob]) -> BulkSummary:
+        completed = load_completed(self.manifest_path) if self.resume else set()
+        manifest_dir = os.path.dirname(os.path.abspath(self.manifest_path))
+        os.makedirs(manifest_dir, exist_ok=True)
+        # 在线程并发保存前打开任务注册表，避免并发初始化
+        self.store.list_tasks(limit=1)
+        max_pending = self.workers * 4
+
+        with open(self.manifest_path, "a", encoding="utf-8") as manifest, \
+                tempfile.TemporaryDirectory(prefix="word2img-bulk-") as work_dir, \
+                ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(work_dir,)) as pool, \
+                ThreadPoolExecutor(self.save_workers, thread_name_prefix="word2img-bulk-save") as savers:
+            rendering: Dict[Future, tuple] = {}
+            saving: Set[Future] = set()
+
+            def drain(block: bool) -> None:
+                # 渲染结果在保存完成前一直持有解码后的图片，所以等待队列同时覆盖渲染和保存
+                pending = [*rendering, *saving]
+                if not pending:
+                    return
+                done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in saving:
+                        saving.discard(future)
+                        future.result()
+                        continue
+                    job, store_kwargs = rendering.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception as e:
+                        self._record(manifest, self._failure(job, e))
+                        continue
+                    saving.add(savers.submit(self._save_and_record, manifest, job, result, store_kwargs))
+
+            try:
+                for job in jobs:
+                    self.summary.total += 1
+                    if (job.job_id, job.digest) in completed:
+                        self.summary.skipped += 1
+                        continue
+                    try:
+                        if "__error__" in job.options:
+                            raise ValueError(job.options["__error__"])
+                        render_kwargs, store_kwargs = split_options(job.options)
+                    except ValueError as e:
+                        self._record(manifest, self._failure(job, e))
+                        continue
+                    rendering[pool.submit(render_job, job.job_id, job.markdown_text, render_kwargs)] = (job, store_kwargs)
+                    # 保存跟不上渲染时也要阻塞，否则待保存的图片会无限堆积
+                    while len(rendering) + len(saving) >= max_pending:
+                        drain(block=True)
+                    drain(block=False)
+                while rendering or saving:
+                    drain(block=True)
+            except BaseException:
+                for future in rendering:
+                    future.cancel()
+                raise
+            finally:
+                self._report(final=True)
+        return self.summary
+
+    def _save_and_record(self, manifest: IO[str], job: BulkJob, result: Dict[str, Any],
+                         store_kwargs: Dict[str, Any]) -> None:
+        try:
+            entry = self._save(job, result, store_kwargs)
+        except Exception as e:
+            entry = self._failure(job, e)
+        self._record(manifest, entry)
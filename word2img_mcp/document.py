@@ -0,0 +1,289 @@
+"""
+Parse-once Markdown documents shared by all render backends.
+
+The text is tokenized once by markdown-it-py (CommonMark plus GFM tables
+and strikethrough; newlines inside a paragraph are line breaks, as with
+python-markdown's nl2br that the imgkit backend used before).  The single
+token stream yields everything the backends need:
+
+* ``html``: the HTML body wkhtmltoimage renders (imgkit backend, templates);
+* ``segments``: the block list the PIL backend lays out;
+* ``features``: counts of headings, lists, tables, images, raw HTML etc.,
+  so backend routing can look at a document without parsing it again.
+
+``ParsedDocument`` objects are cached by a hash of the text in an LRU
+(``DOCUMENT_CACHE``, WORD2IMG_DOCUMENT_CACHE_SIZE entries, default 256), so
+a fallback from imgkit to PIL, a re-render at another size or theme, and a
+resubmitted document do not parse again.  External renderers (markdown-pdf,
+md-to-image CLI and API) still receive the Markdown text and parse it
+themselves.
+
+Segments are plain dicts:
+
+    heading    level, runs
+    paragraph  runs, plus list/quote context: indent (list nesting depth),
+               marker ("•", "3." ...; first paragraph of a list item only),
+               quote (blockquote depth)
+    code       text (fenced or indented code block), indent, quote
+    rule       (thematic break)
+    table      table_data: rows of plain cell text, header row first
+
+``runs`` is a tuple of ``(text, flags)`` pairs, where ``flags`` is a sorted
+string of inline styles: ``b`` strong, ``i`` emphasis, ``c`` code span,
+``l`` link, ``s`` strikethrough.  Line breaks are ``"\\n"``; images are
+represented by their alt text.  Every block also carries ``text``, its
+plain text, which templates use to find placeholders.  Raw HTML blocks are
+dropped.  Segments are shared between renders and must not be modified.
+
+Apart from ``table_data`` every value is hashable; layout.segment_key turns
+a segment into its layout cache key.
+"""
+
+import functools
+import hashlib
+import os
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import CACHE_HITS_TOTAL, CACHE_MISSES_TOTAL
+
+DOCUMENT_CACHE_SIZE_ENV = "WORD2IMG_DOCUMENT_CACHE_SIZE"
+DEFAULT_DOCUMENT_CACHE_SIZE = 256
+
+Run = Tuple[str, str]
+
+# 无序列表各层的项目符号
+BULLETS = ("•", "◦", "▪")
+
+_INLINE_FLAGS = {
+    "strong_open": "b",
+    "em_open": "i",
+    "s_open": "s",
+    "link_open": "l",
+}
+_INLINE_CLOSE = {
+    "strong_close": "b",
+    "em_close": "i",
+    "s_close": "s",
+    "link_close": "l",
+}
+_LINE_BREAK_TAGS = ("<br>", "<br/>", "<br />")
+
+
+@functools.lru_cache(maxsize=1)
+def _parser():
+    # markdown-it-py 只在第一次解析时导入，不影响服务冷启动
+    from markdown_it import MarkdownIt
+
+    return MarkdownIt("commonmark", {"breaks": True}).enable(["table", "strikethrough"])
+
+
+def inline_runs(children: Optional[List[Any]], features: Optional[Counter] = None) -> Tuple[Run, ...]:
+    """Styled runs of an ``inline`` token's children, adjacent runs of the same style merged.
+
+    Inline features (images, links, raw HTML) are counted into ``features``.
+    """
+    features = Counter() if features is None else features
+    runs: List[List[str]] = []
+    active: Dict[str, int] = {}
+
+    def emit(text: str, extra: str = "") -> None:
+        if not text:
+            return
+        flags = "".join(sorted(set(active) | set(extra)))
+        if runs and runs[-1][1] == flags:
+            runs[-1][0] += text
+        else:
+            runs.append([text, flags])
+
+    for child in children or ():
+        kind = child.type
+        if kind == "text":
+            emit(child.content)
+        elif kind in ("softbreak", "hardbreak"):
+            emit("\n")
+        elif kind == "code_inline":
+            emit(child.content, "c")
+        elif kind == "image":
+            features["images"] += 1
+            emit(child.content or "".join(c.content for c in child.children or ()), "i")
+        elif kind == "html_inline":
+            if child.content.strip().lower() in _LINE_BREAK_TAGS:
+                emit("\n")
+            else:
+                features["raw_html"] += 1
+        elif kind in _INLINE_FLAGS:
+            flag = _INLINE_FLAGS[kind]
+            if flag == "l":
+                features["links"] += 1
+            active[flag] = active.get(flag, 0) + 1
+        elif kind in _INLINE_CLOSE:
+            flag = _INLINE_CLOSE[kind]
+            if active.get(flag, 0) > 1:
+                active[flag] -= 1
+            else:
+                active.pop(flag, None)
+    return tuple((text, flags) for text, flags in runs)
+
+
+def plain_text(runs: Tuple[Run, ...]) -> str:
+    return "".join(text for text, _ in runs)
+
+
+def _fold(tokens: List[Any]) -> Tuple[List[Dict], Counter]:
+    """Fold the token stream into segments, counting document features on the way."""
+    segments: List[Dict] = []
+    features: Counter = Counter()
+    # 列表栈：每层为 [是否有序, 下一个序号]
+    lists: List[List[Any]] = []
+    quote = 0
+    marker: Optional[str] = None
+    heading_level = 0
+    table: Optional[List[List[str]]] = None
+
+    for token in tokens:
+        kind = token.type
+        if kind == "inline":
+            runs = inline_runs(token.children, features)
+            if table is not None:
+                table[-1].append(plain_text(runs).strip())
+            elif heading_level:
+                features["headings"] += 1
+                segments.append({"kind": "heading", "level": heading_level, "runs": runs,
+                                 "text": plain_text(runs)})
+            else:
+                features["paragraphs"] += 1
+                segments.append({"kind": "paragraph", "runs": runs, "text": plain_text(runs),
+                                 "indent": len(lists), "marker": marker, "quote": quote})
+                marker = None
+        elif kind == "heading_open":
+            heading_level = int(token.tag[1:])
+        elif kind == "heading_close":
+            heading_level = 0
+        elif kind in ("bullet_list_open", "ordered_list_open"):
+            start = token.attrs.get("start", 1) if token.attrs else 1
+            lists.append([kind == "ordered_list_open", int(start)])
+            features["list_depth"] = max(features["list_depth"], len(lists))
+        elif kind in ("bullet_list_close", "ordered_list_close"):
+            lists.pop()
+        elif kind == "list_item_open":
+            features["list_items"] += 1
+            ordered, number = lists[-1]
+            if ordered:
+                marker = f"{number}."
+                lists[-1][1] += 1
+            else:
+                marker = BULLETS[min(len(lists), len(BULLETS)) - 1]
+        elif kind == "list_item_close":
+            if marker is not None:
+                # 空列表项：只显示项目符号
+                segments.append({"kind": "paragraph", "runs": (), "text": "", "indent": len(lists),
+                                 "marker": marker, "quote": quote})
+                marker = None
+        elif kind == "blockquote_open":
+            features["quotes"] += 1
+            quote += 1
+        elif kind == "blockquote_close":
+            quote -= 1
+        elif kind in ("fence", "code_block"):
+            features["code_blocks"] += 1
+            segments.append({"kind": "code", "text": token.content.rstrip("\n"), "indent": len(lists),
+                             "quote": quote})
+            marker = None
+        elif kind == "hr":
+            features["rules"] += 1
+            segments.append({"kind": "rule", "text": ""})
+        elif kind == "table_open":
+            table = []
+        elif kind == "tr_open":
+            table.append([])
+        elif kind == "table_close":
+            if table:
+                features["tables"] += 1
+                segments.append({"kind": "table", "text": "", "table_data": table})
+            table = None
+        elif kind == "html_block":
+            features["raw_html"] += 1
+    return segments, features
+
+
+@dataclass(frozen=True)
+class ParsedDocument:
+    """One parse of a Markdown text, in the forms each backend consumes."""
+
+    digest: str
+    html: str
+    segments: Tuple[Dict, ...]
+    features: Dict[str, Any]
+
+    @property
+    def pil_faithful(self) -> bool:
+        """True when the PIL backend can show everything in the document (no images or raw HTML)."""
+        return not self.features.get("images") and not self.features.get("raw_html")
+
+
+def text_digest(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def parse_document(text: str, digest: Optional[str] = None) -> ParsedDocument:
+    """Parse ``text`` once into HTML, PIL segments and features (uncached)."""
+    md = _parser()
+    tokens = md.parse(text)
+    segments, features = _fold(tokens)
+    features["characters"] = len(text)
+    return ParsedDocument(
+        digest=digest or text_digest(text),
+        html=md.renderer.render(tokens, md.options, {}),
+        segments=tuple(segments),
+        features=dict(features))
+
+
+class DocumentCache:
+    """Thread-safe LRU of ``ParsedDocument`` keyed by a hash of the Markdown text."""
+
+    def __init__(self, max_entries: Optional[int] = None) -> None:
+        if max_entries is None:
+            try:
+                max_entries = max(0, int(os.environ.get(DOCUMENT_CACHE_SIZE_ENV, DEFAULT_DOCUMENT_CACHE_SIZE)))
+            except ValueError:
+                max_entries = DEFAULT_DOCUMENT_CACHE_SIZE
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, ParsedDocument]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> ParsedDocument:
+        """The parsed form of ``text``, parsing it on a miss."""
+        digest = text_digest(text)
+        with self._lock:
+            document = self._entries.get(digest)
+            if document is not None:
+                self._entries.move_to_end(digest)
+        if document is not None:
+            CACHE_HITS_TOTAL.inc(cache="document")
+            return document
+        CACHE_MISSES_TOTAL.inc(cache="document")
+        # 解析在锁外进行；并发解析同一文本时结果相同，后写入者覆盖即可
+        document = parse_document(text, digest)
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[digest] = document
+                self._entries.move_to_end(digest)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return document
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def status(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+DOCUMENT_CACHE = DocumentCache()
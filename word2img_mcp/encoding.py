@@ -0,0 +1,168 @@
+"""
+Image encoding profiles.
+
+A profile trades encode CPU time for output size:
+
+    fast       PNG zlib level 1, no JPEG optimize pass, WebP method 0, AVIF speed 10
+    balanced   PNG level 6, optimized (not progressive) JPEG, WebP method 4, AVIF speed 6
+    smallest   PNG level 9 + optimize, progressive optimized JPEG, WebP method 6, AVIF speed 2
+
+``quality`` (1-100) applies to the lossy formats (JPEG, WebP, AVIF).  JPEG
+keeps 4:4:4 chroma in every profile so coloured text stays sharp.
+
+The default profile is ``balanced``; set WORD2IMG_ENCODING_PROFILE to change it.
+
+Before PNG encoding, ``reduce_colors`` can shrink text-card renders (flat
+backgrounds, a few text colours) to 8 bits per pixel:
+
+    off        keep the image as rendered
+    lossless   grayscale ("L") or an exact palette ("P") when that loses nothing
+    auto       lossless when possible, else an adaptive 256-colour palette for
+               low-colour images (photos and gradients are left alone)
+
+The default is ``lossless``; set WORD2IMG_PALETTE to change it.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import IO, TYPE_CHECKING, Any, Dict, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+ENCODING_PROFILE_ENV = "WORD2IMG_ENCODING_PROFILE"
+PALETTE_ENV = "WORD2IMG_PALETTE"
+PALETTE_MODES = ("off", "lossless", "auto")
+DEFAULT_PALETTE_MODE = "lossless"
+# auto 模式下视为"低色彩"的不同颜色数上限：文字卡片抗锯齿后通常只有几百到几千种颜色
+LOW_COLOR_LIMIT = 8192
+DEFAULT_ENCODING_PROFILE = "balanced"
+DEFAULT_QUALITY = 95
+
+# 文件扩展名 -> Pillow 格式名
+PIL_FORMATS = {
+    "png": "PNG",
+    "jpg": "JPEG",
+    "jpeg": "JPEG",
+    "webp": "WEBP",
+    "avif": "AVIF",
+}
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """Encoder parameters for one speed/size trade-off."""
+
+    name: str
+    png_compress_level: int
+    png_optimize: bool
+    jpeg_optimize: bool
+    jpeg_progressive: bool
+    webp_method: int
+    avif_speed: int
+
+
+ENCODING_PROFILES: Dict[str, EncodingProfile] = {
+    "fast": EncodingProfile("fast", png_compress_level=1, png_optimize=False,
+                            jpeg_optimize=False, jpeg_progressive=False, webp_method=0, avif_speed=10),
+    "balanced": EncodingProfile("balanced", png_compress_level=6, png_optimize=False,
+                                jpeg_optimize=True, jpeg_progressive=False, webp_method=4, avif_speed=6),
+    "smallest": EncodingProfile("smallest", png_compress_level=9, png_optimize=True,
+                                jpeg_optimize=True, jpeg_progressive=True, webp_method=6, avif_speed=2),
+}
+
+
+def get_encoding_profile(name: Optional[str] = None) -> EncodingProfile:
+    """Look up a profile by name; None selects the configured default."""
+    name = (name or os.environ.get(ENCODING_PROFILE_ENV) or DEFAULT_ENCODING_PROFILE).lower()
+    try:
+        return ENCODING_PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown encoding profile {name!r}; expected one of {sorted(ENCODING_PROFILES)}") from None
+
+
+def save_parameters(format: str, quality: Optional[int] = None,
+                    profile: Union[str, EncodingProfile, None] = None) -> Tuple[str, Dict[str, Any]]:
+    """Return the Pillow format name and ``Image.save`` keyword arguments."""
+    if not isinstance(profile, EncodingProfile):
+        profile = get_encoding_profile(profile)
+    pil_format = PIL_FORMATS.get(format.lower())
+    if pil_format is None:
+        raise ValueError(f"Unsupported image format: {format}")
+    quality = DEFAULT_QUALITY if quality is None else max(1, min(100, int(quality)))
+
+    if pil_format == "PNG":
+        params = {"compress_level": profile.png_compress_level, "optimize": profile.png_optimize}
+    elif pil_format == "JPEG":
+        params = {"quality": quality, "subsampling": 0, "optimize": profile.jpeg_optimize,
+                  "progressive": profile.jpeg_progressive}
+    elif pil_format == "WEBP":
+        params = {"quality": quality, "method": profile.webp_method}
+    else:
+        params = {"quality": quality, "speed": profile.avif_speed}
+    return pil_format, params
+
+
+def get_palette_mode(mode: Optional[str] = None) -> str:
+    """Validate a palette mode; None selects the configured default."""
+    mode = (mode or os.environ.get(PALETTE_ENV) or DEFAULT_PALETTE_MODE).lower()
+    if mode not in PALETTE_MODES:
+        raise ValueError(f"Unknown palette mode {mode!r}; expected one of {list(PALETTE_MODES)}")
+    return mode
+
+
+def _is_grayscale(image: "Image.Image") -> bool:
+    from PIL import ImageChops
+
+    red, green, blue = image.split()
+    return ImageChops.difference(red, green).getbbox() is None and \
+        ImageChops.difference(green, blue).getbbox() is None
+
+
+def reduce_colors(image: "Image.Image", mode: Optional[str] = None) -> Tuple["Image.Image", Optional[Dict[str, Any]]]:
+    """Convert an RGB image to "L" or "P" where ``mode`` allows it.
+
+    Returns the (possibly unchanged) image and a description of the
+    reduction, or None when nothing was done.
+    """
+    mode = get_palette_mode(mode)
+    if mode == "off" or image.mode != "RGB":
+        return image, None
+    from PIL import Image, ImageChops
+
+    # getcolors 超过上限时返回 None，只需一次遍历即可判断是否 ≤256 色
+    colors = image.getcolors(256)
+    if colors is not None:
+        if all(r == g == b for _, (r, g, b) in colors):
+            return image.convert("L"), {"mode": "L", "colors": len(colors), "lossless": True}
+        # 颜色数 = 调色板大小时中位切分通常逐色成箱；映射结果逐像素校验，不精确则放弃
+        reduced = image.quantize(len(colors), method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+        if ImageChops.difference(reduced.convert("RGB"), image).getbbox() is None:
+            return reduced, {"mode": "P", "colors": len(colors), "lossless": True}
+        return image, None
+
+    if _is_grayscale(image):
+        return image.convert("L"), {"mode": "L", "colors": None, "lossless": True}
+
+    if mode == "auto" and image.getcolors(LOW_COLOR_LIMIT) is not None:
+        reduced = image.quantize(256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+        return reduced, {"mode": "P", "colors": 256, "lossless": False}
+    return image, None
+
+
+def encode_image(image: "Image.Image", fp: Union[str, os.PathLike, IO[bytes]], format: str,
+                 quality: Optional[int] = None,
+                 profile: Union[str, EncodingProfile, None] = None) -> Dict[str, Any]:
+    """Encode ``image`` to ``fp`` with a profile; returns the profile name and parameters used."""
+    if not isinstance(profile, EncodingProfile):
+        profile = get_encoding_profile(profile)
+    pil_format, params = save_parameters(format, quality, profile)
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L", "CMYK"):
+        image = image.convert("RGB")
+    if pil_format == "AVIF":
+        from PIL import features
+
+        if not features.check("avif"):
+            raise ValueError("AVIF encoding is not supported by this Pillow build")
+    image.save(fp, format=pil_format, **params)
+    return {"profile": profile.name, "format": pil_format, **params}
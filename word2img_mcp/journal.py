@@ -0,0 +1,423 @@
+"""
+Write-ahead log in front of the task registry.
+
+Every mutation is appended to ``tasks.wal.<n>`` as a framed JSON record and
+acknowledged only after it is fsync'ed.  A single writer thread batches all
+records queued while the previous fsync was in flight (group commit), so
+concurrent writers share one disk flush.
+
+Mutations are kept in an in-memory overlay until the active log segment
+grows past a threshold; a background compactor then seals the segment,
+folds its records into the ``tasks.dat`` snapshot, fsyncs it and deletes
+the segment.  On open, any segments left behind by a crash are replayed
+into the snapshot.  Replay is idempotent: every record carries the full
+task state (or a delete), so re-applying an already compacted segment is
+harmless, and a torn record at the end of a segment is discarded.
+"""
+
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .registry import STATUS_DELETED, TaskRecord, TaskRegistry
+
+WAL_PREFIX = "tasks.wal."
+
+# 活动日志段超过任一阈值即触发后台压缩
+WAL_COMPACT_BYTES = 4 * 1024 * 1024
+WAL_COMPACT_RECORDS = 10_000
+
+# frame: payload length, crc32(payload)
+_FRAME = struct.Struct("<II")
+
+# 覆盖层中的删除标记
+_TOMBSTONE = object()
+
+
+class WriteAheadLog:
+    """Append-only, group-committed log split into numbered segments."""
+
+    def __init__(self, base_dir: str, first_segment: int = 1, sync: bool = True) -> None:
+        self.base_dir = base_dir
+        self.sync = sync
+        self._cond = threading.Condition()
+        self._queue: List[bytes] = []
+        self._next_seq = 0
+        self._durable_seq = 0
+        self._writing = False
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self.segment = first_segment
+        self.segment_bytes = 0
+        self.segment_records = 0
+        self._file = open(self.segment_path(self.segment), "ab")
+        self._writer = threading.Thread(target=self._run, name="word2img-wal", daemon=True)
+        self._writer.start()
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.base_dir, f"{WAL_PREFIX}{segment:08d}")
+
+    @staticmethod
+    def encode(op: Dict) -> bytes:
+        payload = json.dumps(op, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def enqueue(self, op: Dict) -> int:
+        """Queue a record and return its sequence number (not yet durable)."""
+        frame = self.encode(op)
+        with self._cond:
+            if self._closed:
+                raise ValueError("Write-ahead log is closed")
+            self._queue.append(frame)
+            self._next_seq += 1
+            self.segment_bytes += len(frame)
+            self.segment_records += 1
+            self._cond.notify_all()
+            return self._next_seq
+
+    def wait(self, seq: int) -> None:
+        """Block until record ``seq`` has been written (and fsync'ed)."""
+        with self._cond:
+            while self._durable_seq < seq and self._error is None:
+                self._cond.wait()
+            if self._error is not None and self._durable_seq < seq:
+                raise ValueError(f"Write-ahead log failed: {self._error}") from self._error
+
+    def append(self, op: Dict) -> None:
+        self.wait(self.enqueue(op))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue and self._closed:
+                    return
+                batch, self._queue = self._queue, []
+                target = self._next_seq
+                self._writing = True
+            try:
+                self._file.write(b"".join(batch))
+                self._file.flush()
+                if self.sync:
+                    os.fsync(self._file.fileno())
+            except BaseException as e:  # surface to every waiter
+                with self._cond:
+                    self._error = e
+                    self._writing = False
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._durable_seq = target
+                self._writing = False
+                self._cond.notify_all()
+
+    def _drain(self) -> None:
+        """Wait until everything queued so far is durable (caller holds _cond)."""
+        while (self._queue or self._writing) and self._error is None:
+            self._cond.wait()
+
+    def rotate(self) -> int:
+        """Seal the active segment, start the next one and return the sealed number."""
+        with self._cond:
+            self._drain()
+            sealed = self.segment
+            self._file.close()
+            self.segment += 1
+            self.segment_bytes = 0
+            self.segment_records = 0
+            self._file = open(self.segment_path(self.segment), "ab")
+            return sealed
+
+    def close(self) -> None:
+        with self._cond:
+            self._drain()
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        self._file.close()
+
+
+def list_segments(base_dir: str) -> List[Tuple[int, str]]:
+    """Existing log segments in replay order."""
+    pattern = re.compile(re.escape(WAL_PREFIX) + r"(\d+)$")
+    segments = []
+    for name in os.listdir(base_dir):
+        match = pattern.match(name)
+        if match:
+            segments.append((int(match.group(1)), os.path.join(base_dir, name)))
+    return sorted(segments)
+
+
+def read_segment(path: str) -> Iterator[Dict]:
+    """Yield records from a segment, stopping at the first torn or corrupt frame."""
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + _FRAME.size <= len(data):
+        length, crc = _FRAME.unpack_from(data, offset)
+        start = offset + _FRAME.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        try:
+            yield json.loads(payload.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            break
+        offset = start + length
+
+
+class JournaledTaskRegistry:
+    """TaskRegistry front-end: WAL + in-memory overlay + compacted snapshot."""
+
+    def __init__(self, base_dir: str, sync: bool = True,
+                 compact_bytes: int = WAL_COMPACT_BYTES, compact_records: int = WAL_COMPACT_RECORDS) -> None:
+        self.base_dir = base_dir
+        self.compact_bytes = compact_bytes
+        self.compact_records = compact_records
+        self._lock = threading.RLock()
+        self._snapshot = TaskRegistry(base_dir)
+        # active: 当前日志段的变更；sealed: 正在压缩进快照的日志段
+        self._active: Dict[str, object] = {}
+        self._sealed: Dict[str, object] = {}
+        # 已封存、尚未成功压缩进快照的日志段编号
+        self._sealed_segments: List[int] = []
+        self.recovered_records = self._recover()
+        last = list_segments(base_dir)
+        self._wal = WriteAheadLog(base_dir, first_segment=(last[-1][0] + 1) if last else 1, sync=sync)
+        self._compact_lock = threading.Lock()
+        self._compact_requested = threading.Event()
+        self._stopping = False
+        self._compactor = threading.Thread(target=self._compact_loop, name="word2img-compactor", daemon=True)
+        self._compactor.start()
+
+    # -------------------------------------------------------------- recovery
+
+    def _recover(self) -> int:
+        """Replay segments left by a previous run into the snapshot."""
+        replayed = 0
+        for _, path in list_segments(self.base_dir):
+            overlay: Dict[str, object] = {}
+            for op in read_segment(path):
+                self._apply_to_overlay(overlay, op)
+                replayed += 1
+            self._fold_into_snapshot(overlay)
+            os.remove(path)
+        return replayed
+
+    @staticmethod
+    def _apply_to_overlay(overlay: Dict[str, object], op: Dict) -> None:
+        if op.get("op") == "put":
+            record = TaskRecord.from_dict(op["task"])
+            overlay[record.task_id] = record
+        elif op.get("op") == "delete":
+            overlay[op["task_id"]] = _TOMBSTONE
+
+    def _fold_into_snapshot(self, overlay: Dict[str, object]) -> None:
+        if not overlay:
+            return
+        puts = [value for value in overlay.values() if value is not _TOMBSTONE]
+        with self._lock:
+            self._snapshot.add_many(puts)
+            for task_id, value in overlay.items():
+                if value is _TOMBSTONE:
+                    self._snapshot.delete(task_id)
+            self._snapshot.sync()
+
+    # ------------------------------------------------------------ compaction
+
+    def _compact_loop(self) -> None:
+        while True:
+            self._compact_requested.wait()
+            self._compact_requested.clear()
+            if self._stopping:
+                return
+            try:
+                self.compact()
+            except Exception as e:
+                # 压缩失败不影响正确性：日志段和 sealed 中的变更都保留，下次压缩时重试，重启时重放
+                print(f"⚠️  任务日志压缩失败，将在下次压缩时重试: {e}", file=sys.stderr)
+
+    def _maybe_request_compaction(self) -> None:
+        if self._wal.segment_bytes >= self.compact_bytes or self._wal.segment_records >= self.compact_records:
+            self._compact_requested.set()
+
+    def compact(self) -> int:
+        """Fold the active log segment into the snapshot; returns records folded.
+
+        If a previous fold failed, its records are still in ``_sealed`` and its
+        segments on disk; they are folded again together with the new ones.
+        """
+        with self._compact_lock:
+            with self._lock:
+                if not self._active and not self._sealed:
+                    return 0
+                if self._active:
+                    self._sealed_segments.append(self._wal.rotate())
+                    # 合并而不是覆盖：较新的变更优先
+                    self._sealed.update(self._active)
+                    self._active = {}
+            folded = len(self._sealed)
+            self._fold_into_snapshot(self._sealed)
+            with self._lock:
+                self._sealed = {}
+                segments, self._sealed_segments = self._sealed_segments, []
+            for segment in segments:
+                os.remove(self._wal.segment_path(segment))
+            return folded
+
+    # ------------------------------------------------------------- mutations
+
+    def _log(self, op: Dict, task_id: str, value: object) -> None:
+        with self._lock:
+            seq = self._wal.enqueue(op)
+            self._active[task_id] = value
+        self._wal.wait(seq)
+        self._maybe_request_compaction()
+
+    def add(self, record: TaskRecord) -> None:
+        self._log({"op": "put", "task": record.to_dict()}, record.task_id, record)
+
+    def add_many(self, records: Iterable[TaskRecord]) -> int:
+        seqs = []
+        with self._lock:
+            for record in records:
+                seqs.append(self._wal.enqueue({"op": "put", "task": record.to_dict()}))
+                self._active[record.task_id] = record
+        if seqs:
+            self._wal.wait(seqs[-1])
+            self._maybe_request_compaction()
+        return len(seqs)
+
+    def update(self, task_id: str, **fields) -> Optional[TaskRecord]:
+        with self._lock:
+            record = self.get(task_id)
+            if record is None:
+                return None
+            for name, value in fields.items():
+                setattr(record, name, value)
+            seq = self._wal.enqueue({"op": "put", "task": record.to_dict()})
+            self._active[task_id] = record
+        self._wal.wait(seq)
+        self._maybe_request_compaction()
+        return record
+
+    def delete(self, task_id: str) -> bool:
+        with self._lock:
+            if self.get(task_id) is None:
+                return False
+            seq = self._wal.enqueue({"op": "delete", "task_id": task_id})
+            self._active[task_id] = _TOMBSTONE
+        self._wal.wait(seq)
+        self._maybe_request_compaction()
+        return True
+
+    def import_json(self, tasks: Dict[str, Dict]) -> Tuple[int, Dict[str, Dict]]:
+        # 一次性迁移直接写快照，不经过日志
+        with self._lock:
+            imported, rejected = self._snapshot.import_json(tasks)
+            self._snapshot.sync()
+            return imported, rejected
+
+    # ----------------------------------------------------------------- reads
+
+    def _overlay_get(self, task_id: str) -> Optional[object]:
+        value = self._active.get(task_id)
+        if value is None:
+            value = self._sealed.get(task_id)
+        return value
+
+    def _merged_overlay(self) -> Dict[str, object]:
+        merged = dict(self._sealed)
+        merged.update(self._active)
+        return merged
+
+    def get(self, task_id: str) -> Optional[TaskRecord]:
+        with self._lock:
+            value = self._overlay_get(task_id)
+            if value is _TOMBSTONE:
+                return None
+            if value is not None:
+                return TaskRecord.from_dict(value.to_dict())
+            return self._snapshot.get(task_id)
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+    def __len__(self) -> int:
+        return sum(self.statistics()["counts"].values())
+
+    def iter_records(self, newest_first: bool = False, status: Optional[str] = None) -> Iterator[TaskRecord]:
+        """Iterate live records; the overlay is copied under the lock, which is not held across ``yield``."""
+        with self._lock:
+            overlay = self._merged_overlay()
+            fresh = sorted(
+                (value for task_id, value in overlay.items()
+                 if value is not _TOMBSTONE and self._snapshot.get(task_id) is None),
+                key=lambda record: record.created_at,
+                reverse=newest_first
+            )
+        fresh_ids = {record.task_id for record in fresh}
+
+        def snapshot_records() -> Iterator[TaskRecord]:
+            # 快照自己分批加锁读取
+            for record in self._snapshot.iter_records(newest_first=newest_first):
+                value = overlay.get(record.task_id)
+                if value is _TOMBSTONE:
+                    continue
+                yield value if value is not None else record
+
+        # 未压缩的新任务总是比快照中的任务新
+        ordered = [fresh, snapshot_records()] if newest_first else [snapshot_records(), fresh]
+        for source in ordered:
+            for record in source:
+                if status and record.status != status:
+                    continue
+                if source is not fresh and record.task_id in fresh_ids:
+                    continue
+                yield record
+
+    def statistics(self) -> Dict:
+        with self._lock:
+            stats = self._snapshot.statistics()
+            counts, formats = stats["counts"], stats["formats"]
+            total_size = stats["total_size"]
+            for task_id, value in self._merged_overlay().items():
+                previous = self._snapshot.get(task_id)
+                if previous is not None:
+                    counts[previous.status] -= 1
+                    formats[previous.format] -= 1
+                    total_size -= previous.file_size
+                if value is not _TOMBSTONE and value.status != STATUS_DELETED:
+                    counts[value.status] = counts.get(value.status, 0) + 1
+                    formats[value.format] = formats.get(value.format, 0) + 1
+                    total_size += value.file_size
+            return {
+                "counts": {key: value for key, value in counts.items() if value},
+                "formats": {key: value for key, value in formats.items() if value},
+                "total_size": total_size
+            }
+
+    def wal_status(self) -> Dict:
+        with self._lock:
+            return {
+                "segment": self._wal.segment,
+                "segment_bytes": self._wal.segment_bytes,
+                "segment_records": self._wal.segment_records,
+                "pending_overlay": len(self._active) + len(self._sealed),
+                "recovered_records": self.recovered_records
+            }
+
+    def close(self) -> None:
+        self._stopping = True
+        self._compact_requested.set()
+        self._compactor.join()
+        self.compact()
+        self._wal.close()
+        os.remove(self._wal.segment_path(self._wal.segment))
+        self._snapshot.close()
@@ -0,0 +1,234 @@
+"""
+Block-level layout caching for the PIL backend.
+
+Laying out a block (choosing its font, wrapping its text, measuring its
+height) is the expensive part of a PIL render, and it depends only on the
+block's content, the resolved theme style, the canvas width and the
+alignment.  ``LAYOUT_CACHE`` memoises ``BlockLayout`` objects under exactly
+that key, so an edited document that is resubmitted only lays out the
+blocks that changed.
+
+A finished PIL render can also leave a ``RenderSnapshot`` (canvas plus the
+position of every block).  When a later submission names it through
+``base_task_id`` and the canvas settings match, only the horizontal bands
+whose blocks moved or changed are redrawn; everything else is copied from
+the snapshot.  Snapshots live in memory (``LAYOUT_SNAPSHOTS``), bounded by
+WORD2IMG_LAYOUT_SNAPSHOTS entries (default 16) and WORD2IMG_LAYOUT_SNAPSHOT_MB
+of pixel data (default 128; a single larger canvas is not kept).  The bytes
+held are reported to admission control, which counts them against the
+render memory budget.  A missing snapshot simply means a full draw that
+still benefits from the layout cache.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, Hashable, List, Optional, Tuple
+
+from .metrics import CACHE_HITS_TOTAL, CACHE_MISSES_TOTAL
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+    from .table_layout import TableLayout
+
+LAYOUT_CACHE_SIZE_ENV = "WORD2IMG_LAYOUT_CACHE_SIZE"
+LAYOUT_SNAPSHOTS_ENV = "WORD2IMG_LAYOUT_SNAPSHOTS"
+LAYOUT_SNAPSHOT_MB_ENV = "WORD2IMG_LAYOUT_SNAPSHOT_MB"
+DEFAULT_LAYOUT_CACHE_SIZE = 4096
+DEFAULT_LAYOUT_SNAPSHOTS = 16
+DEFAULT_LAYOUT_SNAPSHOT_MB = 128
+
+# 文字阴影和字形下伸部分可能超出块的名义高度，重绘条带时上下各多留一些
+INK_OVERFLOW = 8
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+def segment_key(segment: Dict) -> Tuple:
+    """Hashable identity of a parsed Markdown segment (see document.py)."""
+    if segment["kind"] == "table":
+        return ("table", tuple(tuple(row) for row in segment["table_data"]))
+    return tuple(sorted(segment.items()))
+
+
+@dataclass(frozen=True)
+class BlockLayout:
+    """A laid-out block: everything needed to draw it at any y offset.
+
+    ``lines`` holds, per line, pieces ``(x, text, flags, width)`` with x
+    relative to ``x``; ``run_styles`` maps each style flag string used by
+    the pieces to ``(flags, font key, colour, baseline offset)``.  ``rects``
+    are filled rectangles ``(x0, y0, x1, y1, colour)`` (code and quote
+    backgrounds, quote bars, underlines, rules) with y relative to the
+    block top, drawn before the text.
+    """
+
+    kind: str
+    lines: Tuple[Tuple[Tuple[int, str, str, int], ...], ...]
+    font_size: int
+    bold: bool
+    color: str
+    x: int
+    line_advance: int
+    height: int
+    shadow: Optional[Tuple[int, int, int]] = None
+    table: Optional["TableLayout"] = None
+    header_color: Optional[str] = None
+    text_top: int = 0
+    run_styles: Tuple[Tuple[str, Tuple, Any, int], ...] = ()
+    rects: Tuple[Tuple[int, int, int, int, Any], ...] = ()
+
+
+@dataclass
+class PlacedBlock:
+    key: Hashable
+    y: int
+    layout: BlockLayout
+
+    @property
+    def extent(self) -> Tuple[int, int]:
+        return self.y - INK_OVERFLOW, self.y + self.layout.height + INK_OVERFLOW
+
+
+class LayoutCache:
+    """Thread-safe LRU of ``BlockLayout`` keyed by (segment, style, width, align)."""
+
+    def __init__(self, max_entries: Optional[int] = None, name: str = "layout") -> None:
+        self.max_entries = _env_int(LAYOUT_CACHE_SIZE_ENV, DEFAULT_LAYOUT_CACHE_SIZE) \
+            if max_entries is None else max_entries
+        self.name = name
+        self._entries: "OrderedDict[Hashable, BlockLayout]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            layout = self._entries.get(key)
+            if layout is not None:
+                self._entries.move_to_end(key)
+        if layout is None:
+            CACHE_MISSES_TOTAL.inc(cache=self.name)
+            return default
+        CACHE_HITS_TOTAL.inc(cache=self.name)
+        return layout
+
+    def __setitem__(self, key: Hashable, layout: BlockLayout) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = layout
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+@dataclass
+class RenderSnapshot:
+    """A finished PIL canvas and where each block was drawn on it."""
+
+    canvas_key: Hashable
+    image: "Image.Image"
+    blocks: List[PlacedBlock]
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def nbytes(self) -> int:
+        """Pixel data held by the canvas."""
+        return self.image.width * self.image.height * len(self.image.getbands())
+
+
+class SnapshotStore:
+    """Most recent render snapshots by task id (in-process, LRU, bounded by count and bytes)."""
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> None:
+        self.max_entries = _env_int(LAYOUT_SNAPSHOTS_ENV, DEFAULT_LAYOUT_SNAPSHOTS) \
+            if max_entries is None else max_entries
+        self.max_bytes = _env_int(LAYOUT_SNAPSHOT_MB_ENV, DEFAULT_LAYOUT_SNAPSHOT_MB) * 1024 * 1024 \
+            if max_bytes is None else max_bytes
+        self._entries: "OrderedDict[str, RenderSnapshot]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        """Pixel data currently held by all snapshots."""
+        return self._bytes
+
+    def get(self, task_id: str) -> Optional[RenderSnapshot]:
+        with self._lock:
+            snapshot = self._entries.get(task_id)
+            if snapshot is not None:
+                self._entries.move_to_end(task_id)
+        if snapshot is None:
+            CACHE_MISSES_TOTAL.inc(cache="layout_snapshot")
+        else:
+            CACHE_HITS_TOTAL.inc(cache="layout_snapshot")
+        return snapshot
+
+    def put(self, task_id: str, snapshot: RenderSnapshot) -> None:
+        size = snapshot.nbytes
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(task_id, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[task_id] = snapshot
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def discard(self, task_id: str) -> None:
+        with self._lock:
+            snapshot = self._entries.pop(task_id, None)
+            if snapshot is not None:
+                self._bytes -= snapshot.nbytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def status(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries,
+                "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+
+def dirty_bands(previous: List[PlacedBlock], current: List[PlacedBlock],
+                height: int) -> List[Tuple[int, int]]:
+    """Merged [top, bottom) row ranges that differ between two block placements.
+
+    A block is unchanged when the same content was laid out at the same y in
+    both placements; every other block, old or new, dirties its extent.
+    """
+    old = {(block.key, block.y) for block in previous}
+    new = {(block.key, block.y) for block in current}
+    spans = [block.extent for block in current if (block.key, block.y) not in old]
+    spans += [block.extent for block in previous if (block.key, block.y) not in new]
+
+    bands: List[Tuple[int, int]] = []
+    for top, bottom in sorted(spans):
+        top, bottom = max(0, top), min(height, bottom)
+        if top >= bottom:
+            continue
+        if bands and top <= bands[-1][1]:
+            bands[-1] = (bands[-1][0], max(bands[-1][1], bottom))
+        else:
+            bands.append((top, bottom))
+    return bands
+
+
+LAYOUT_CACHE = LayoutCache()
+LAYOUT_SNAPSHOTS = SnapshotStore()
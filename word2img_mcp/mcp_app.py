@@ -2,17 +2,94 @@ import base64
 import json
 import os
 import asyncio
+import time
+from contextlib import nullcontext
+from dataclasses import replace
 from datetime import datetime
-from typing import Any
+from typing import Any, Optional
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp import types
 
-from .render import ASPECT_RATIO, RenderOptions, render_markdown_text_to_image
+from .admission import AdmissionController, AdmissionPolicy, AdmissionRejected, estimate_render_bytes
+from .async_render import render_markdown_text_to_image_async
+from .document import DOCUMENT_CACHE
+from .render import ASPECT_RATIO, RenderOptions
+from .layout import LAYOUT_SNAPSHOTS
+from .metrics import (
+    BASE64_BYTES_RETURNED_TOTAL,
+    GET_IMAGE_DURATION_SECONDS,
+    RENDERS_IN_FLIGHT,
+    render_metrics,
+    start_metrics_server_from_env,
+)
+from .profiling import RenderProfiler, should_profile
+from .renditions import MAX_RENDITIONS, Rendition, parse_renditions, plan_renditions, resample
+from .retention import RetentionPolicy, RetentionScheduler
+from .storage import storage_driver_from_env
+from .supervisor import SUPERVISOR
+from .templates import TEMPLATES
+from .themes import get_theme_registry
 from .store import ImageStore
+from .timing import STAGE_HISTOGRAMS, StageTimer
+
+# The store is created on first use so that importing this module (and
+# answering list_tools) does not touch the output directory.
+_store: Optional[ImageStore] = None
+
+
+def _get_store() -> ImageStore:
+    """Return the shared ImageStore, creating it lazily."""
+    global _store
+    if _store is None:
+        _store = ImageStore(
+            base_dir=os.path.join(os.getcwd(), "outputs"),
+            storage=storage_driver_from_env()
+        )
+    return _store
+
+
+# Admission control is also created on first use (reads WORD2IMG_ADMISSION_*)
+_admission: Optional[AdmissionController] = None
+
+
+def _get_admission() -> AdmissionController:
+    """Return the shared AdmissionController, creating it lazily."""
+    global _admission
+    if _admission is None:
+        # 增量渲染快照在渲染之间仍占内存，计入准入预算
+        _admission = AdmissionController(AdmissionPolicy.from_env(), reserved=lambda: LAYOUT_SNAPSHOTS.nbytes)
+    return _admission
+
+
+def _client_id(arguments: dict[str, Any]) -> str:
+    """Rate-limit key: the explicit client_id argument, else the MCP session."""
+    client_id = arguments.get("client_id")
+    if client_id:
+        return str(client_id)
+    try:
+        return f"session-{id(server.request_context.session):x}"
+    except LookupError:
+        return "anonymous"
+
+
+def _error_details(e: Exception, tool: str, arguments: dict[str, Any]) -> dict[str, Any]:
+    error_details = {
+        "error": str(e),
+        "error_type": type(e).__name__,
+        "tool": tool,
+        "arguments": arguments
+    }
+    if isinstance(e, AdmissionRejected):
+        error_details["reason"] = e.reason
+        error_details["retry_after"] = e.retry_after
+    return error_details
+
+
+# Retention runs on its own thread once the server starts (see run_server)
+_retention: Optional[RetentionScheduler] = None
 
-_store = ImageStore(base_dir=os.path.join(os.getcwd(), "outputs"))
 
 # Create the server instance
 server = Server("word2img-mcp")
@@ -32,20 +109,42 @@ async def handle_list_tools() -> list[types.Tool]:
                     "bold": {"type": "boolean", "default": False, "description": "是否加粗显示"},
                     "width": {"type": "integer", "default": 1200, "minimum": 300, "maximum": 4000, "description": "图片宽度（像素）"},
                     "height": {"type": "integer", "default": 1600, "minimum": 400, "maximum": 6000, "description": "图片高度（像素），默认按3:4比例计算"},
-                    "background_color": {"type": "string", "default": "#FFFFFF", "description": "背景颜色，支持HEX、RGB、RGBA格式"},
-                    "text_color": {"type": "string", "default": "#000000", "description": "文字颜色，支持HEX、RGB、RGBA格式"},
-                    "accent_color": {"type": "string", "default": "#4682B4", "description": "强调色，用于链接、代码块等"},
-                    "font_family": {"type": "string", "default": "Microsoft YaHei, PingFang SC, Helvetica Neue, Arial, sans-serif", "description": "字体家族"},
-                    "font_size": {"type": "integer", "default": 20, "minimum": 8, "maximum": 48, "description": "基础字体大小（像素）"},
-                    "line_height": {"type": "number", "default": 1.6, "minimum": 1.0, "maximum": 3.0, "description": "行高倍数"},
-                    "header_scale": {"type": "number", "default": 1.5, "minimum": 1.0, "maximum": 3.0, "description": "标题字体缩放比例"},
-                    "theme": {"type": "string", "enum": ["default", "dark", "light", "professional", "casual"], "default": "default", "description": "主题样式"},
-                    "shadow": {"type": "boolean", "default": True, "description": "是否添加文字阴影效果"},
+                    "background_color": {"type": "string", "description": "背景颜色，支持HEX、RGB、RGBA格式（默认取主题配色）"},
+                    "text_color": {"type": "string", "description": "文字颜色，支持HEX、RGB、RGBA格式（默认取主题配色）"},
+                    "accent_color": {"type": "string", "description": "强调色，用于标题、链接、表格等（默认取主题配色）"},
+                    "font_family": {"type": "string", "description": "字体家族（默认取主题设置）"},
+                    "font_size": {"type": "integer", "minimum": 8, "maximum": 48, "description": "基础字体大小（像素，默认取主题设置）"},
+                    "line_height": {"type": "number", "minimum": 1.0, "maximum": 3.0, "description": "行高倍数（默认取主题设置）"},
+                    "header_scale": {"type": "number", "minimum": 1.0, "maximum": 3.0, "description": "标题字体缩放比例（默认取主题设置）"},
+                    "theme": {"type": "string", "default": "default", "description": "主题样式：内置 default、dark、light、professional、casual，另可通过 WORD2IMG_THEME_PATH 加载自定义主题"},
+                    "shadow": {"type": "boolean", "description": "是否添加标题阴影效果（默认取主题设置）"},
                     "watermark": {"type": "boolean", "default": False, "description": "是否添加水印"},
                     "watermark_text": {"type": "string", "default": "Generated by word2img-mcp", "description": "水印文字"},
-                    "output_format": {"type": "string", "enum": ["png", "jpg", "jpeg", "webp"], "default": "png", "description": "输出图片格式"},
-                    "quality": {"type": "integer", "default": 95, "minimum": 1, "maximum": 100, "description": "图片质量（仅JPG/WebP有效）"},
-                    "backend_preference": {"type": "string", "enum": ["auto", "imgkit", "markdown-pdf", "md-to-image", "pil"], "default": "auto", "description": "渲染后端偏好设置"}
+                    "output_format": {"type": "string", "enum": ["png", "jpg", "jpeg", "webp", "avif"], "default": "png", "description": "输出图片格式"},
+                    "quality": {"type": "integer", "default": 95, "minimum": 1, "maximum": 100, "description": "图片质量（仅JPG/WebP/AVIF有效）"},
+                    "encoding_profile": {"type": "string", "enum": ["fast", "balanced", "smallest"], "description": "编码档位：fast 编码最快，smallest 文件最小；默认 balanced（可用 WORD2IMG_ENCODING_PROFILE 修改）"},
+                    "palette": {"type": "string", "enum": ["off", "lossless", "auto"], "description": "PNG 调色板优化：lossless 仅在无损时转为灰度/调色板，auto 对低色彩图片使用 256 色自适应调色板；默认 lossless（可用 WORD2IMG_PALETTE 修改）"},
+                    "backend_preference": {"type": "string", "enum": ["auto", "imgkit", "markdown-pdf", "md-to-image", "pil"], "default": "auto", "description": "渲染后端偏好设置"},
+                    "profile": {"type": "boolean", "default": False, "description": "是否对本次渲染进行性能剖析（cProfile + 峰值内存），报告可通过 get_profile 获取"},
+                    "base_task_id": {"type": "string", "description": "同一文档上一版本的任务ID；PIL 后端会复用其布局和画布，只重绘改动的区域"},
+                    "renditions": {
+                        "type": "array",
+                        "maxItems": MAX_RENDITIONS,
+                        "description": "附加输出（尺寸、格式、质量），与主图存放在同一任务下，可通过 get_image 的 rendition 参数获取。"
+                                       "宽高比相同的输出只按最大尺寸渲染一次再缩放，宽高比不同时重新排版",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "width": {"type": "integer", "minimum": 16, "maximum": 4000, "description": "宽度（像素，默认同主图）"},
+                                "height": {"type": "integer", "minimum": 16, "maximum": 6000, "description": "高度（像素，默认按主图宽高比计算）"},
+                                "format": {"type": "string", "enum": ["png", "jpg", "jpeg", "webp", "avif"], "description": "格式（默认同主图）"},
+                                "quality": {"type": "integer", "minimum": 1, "maximum": 100, "description": "质量（默认同主图）"},
+                                "encoding_profile": {"type": "string", "enum": ["fast", "balanced", "smallest"]},
+                                "palette": {"type": "string", "enum": ["off", "lossless", "auto"]}
+                            }
+                        }
+                    },
+                    "client_id": {"type": "string", "description": "调用方标识，用于按客户端限流（默认按 MCP 会话区分）"}
                 },
                 "required": ["markdown_text"]
             }
@@ -60,7 +159,8 @@ async def handle_list_tools() -> list[types.Tool]:
                     "as_base64": {"type": "boolean", "default": True, "description": "是否返回base64编码（否则返回文件路径）"},
                     "include_metadata": {"type": "boolean", "default": False, "description": "是否包含图片元数据信息"},
                     "show_in_chat": {"type": "boolean", "default": True, "description": "是否在会话中显示图片"},
-                    "include_full_base64": {"type": "boolean", "default": False, "description": "是否包含完整base64数据（大文件可能导致token限制）"}
+                    "include_full_base64": {"type": "boolean", "default": False, "description": "是否包含完整base64数据（大文件可能导致token限制）"},
+                    "rendition": {"type": "string", "description": "附加输出名称（如 600x800.webp，见 submit_markdown 返回的 renditions）；默认返回主图"}
                 },
                 "required": ["task_id"]
             }
@@ -85,11 +185,69 @@ async def handle_list_tools() -> list[types.Tool]:
                     "status": {"type": "string", "enum": ["all", "completed", "failed", "processing"], "default": "all", "description": "任务状态过滤"}
                 }
             }
+        ),
+        types.Tool(
+            name="get_profile",
+            description="获取某个任务的渲染性能剖析报告（需提交时开启 profile 或被服务端采样）",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "task_id": {"type": "string", "description": "任务ID"}
+                },
+                "required": ["task_id"]
+            }
+        ),
+        types.Tool(
+            name="register_template",
+            description="注册 Markdown 模板（{{ 变量名 }} 为占位符），预先完成解析、样式编译和静态区域排版，之后用 render_template 批量生成",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "模板名称，重复注册会覆盖"},
+                    "markdown_template": {"type": "string", "description": "带 {{ 变量名 }} 占位符的 Markdown 文本"},
+                    "theme": {"type": "string", "default": "default", "description": "主题样式"},
+                    "width": {"type": "integer", "default": 1200, "minimum": 300, "maximum": 4000, "description": "图片宽度（像素）"},
+                    "height": {"type": "integer", "minimum": 400, "maximum": 6000, "description": "图片高度（像素），默认按 3:4 计算"},
+                    "align": {"type": "string", "enum": ["center", "left", "right"], "default": "center", "description": "文本对齐方式"},
+                    "background_color": {"type": "string", "description": "背景颜色（默认取主题配色）"},
+                    "text_color": {"type": "string", "description": "文字颜色（默认取主题配色）"},
+                    "accent_color": {"type": "string", "description": "强调色（默认取主题配色）"},
+                    "font_size": {"type": "integer", "minimum": 8, "maximum": 48, "description": "基础字体大小（默认取主题设置）"},
+                    "watermark": {"type": "boolean", "default": False, "description": "是否添加水印"},
+                    "watermark_text": {"type": "string", "default": "Generated by word2img-mcp", "description": "水印文字"}
+                },
+                "required": ["name", "markdown_template"]
+            }
+        ),
+        types.Tool(
+            name="render_template",
+            description="用已注册的模板和变量值生成图片（只替换变量并重绘动态区域），返回任务ID",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "模板名称"},
+                    "variables": {"type": "object", "additionalProperties": {"type": "string"}, "description": "变量值（按纯文本插入）"},
+                    "output_format": {"type": "string", "enum": ["png", "jpg", "jpeg", "webp", "avif"], "default": "png", "description": "输出图片格式"},
+                    "quality": {"type": "integer", "default": 95, "minimum": 1, "maximum": 100, "description": "图片质量（仅JPG/WebP/AVIF有效）"},
+                    "encoding_profile": {"type": "string", "enum": ["fast", "balanced", "smallest"], "description": "编码档位"},
+                    "palette": {"type": "string", "enum": ["off", "lossless", "auto"], "description": "PNG 调色板优化"},
+                    "client_id": {"type": "string", "description": "调用方标识，用于按客户端限流（默认按 MCP 会话区分）"}
+                },
+                "required": ["name", "variables"]
+            }
+        ),
+        types.Tool(
+            name="get_metrics",
+            description="以 Prometheus 文本格式返回渲染吞吐、延迟和缓存等运行指标",
+            inputSchema={
+                "type": "object",
+                "properties": {}
+            }
         )
     ]
 
 @server.call_tool()
-async def handle_call_tool(name: str, arguments: dict[str, Any]) -> list[types.TextContent]:
+async def handle_call_tool(name: str, arguments: dict[str, Any]) -> list[types.TextContent] | types.CallToolResult:
     """Handle tool calls with detailed error information."""
     try:
         if name == "submit_markdown":
@@ -104,9 +262,29 @@ async def handle_call_tool(name: str, arguments: dict[str, Any]) -> list[types.T
         elif name == "list_tasks":
             return await _handle_list_tasks(arguments)
         
+        elif name == "get_profile":
+            return await _handle_get_profile(arguments)
+        
+        elif name == "get_metrics":
+            return await _handle_get_metrics(arguments)
+        
+        elif name == "register_template":
+            return await _handle_register_template(arguments)
+        
+        elif name == "render_template":
+            return await _handle_render_template(arguments)
+        
         else:
             raise ValueError(f"未知工具: {name}")
     
+    except AdmissionRejected as e:
+        # 准入拒绝是预期内的结果：以结构化错误返回，客户端可直接读取 reason / retry_after
+        error_details = _error_details(e, name, arguments)
+        return types.CallToolResult(
+            content=[types.TextContent(type="text", text=json.dumps(error_details, ensure_ascii=False))],
+            structuredContent=error_details,
+            isError=True,
+        )
     except Exception as e:
         # 提供详细的错误信息
         error_details = {
@@ -118,28 +296,43 @@ async def handle_call_tool(name: str, arguments: dict[str, Any]) -> list[types.T
         error_message = f"工具调用失败: {json.dumps(error_details, ensure_ascii=False)}"
         raise ValueError(error_message) from e
 
+def _load_group_images(group_path: str, master: Rendition, members: list[Rendition]) -> list[tuple[Rendition, Any]]:
+    """Decode a group's render and resample it to every member size (runs in a worker thread)."""
+    from PIL import Image
+    master_image = Image.open(group_path)
+    master_image.load()
+    return [(member, resample(master_image, member, master)) for member in members]
+
 async def _handle_submit_markdown(arguments: dict[str, Any]) -> list[types.TextContent]:
     """Handle submit_markdown tool with detailed options."""
+    timer = StageTimer()
+    RENDERS_IN_FLIGHT.inc()
+    admission = None
     try:
         markdown_text = arguments["markdown_text"]
         align = arguments.get("align", "center")
         bold = arguments.get("bold", False)
         width = arguments.get("width", 1200)
         height = arguments.get("height", int(width * ASPECT_RATIO[1] / ASPECT_RATIO[0]))
-        background_color = arguments.get("background_color", "#FFFFFF")
-        text_color = arguments.get("text_color", "#000000")
-        accent_color = arguments.get("accent_color", "#4682B4")
-        font_family = arguments.get("font_family", "Microsoft YaHei, PingFang SC, Helvetica Neue, Arial, sans-serif")
-        font_size = arguments.get("font_size", 20)
-        line_height = arguments.get("line_height", 1.6)
-        header_scale = arguments.get("header_scale", 1.5)
+        # 未指定的样式字段由主题提供（RenderOptions 中为 None）
+        background_color = arguments.get("background_color")
+        text_color = arguments.get("text_color")
+        accent_color = arguments.get("accent_color")
+        font_family = arguments.get("font_family")
+        font_size = arguments.get("font_size")
+        line_height = arguments.get("line_height")
+        header_scale = arguments.get("header_scale")
         theme = arguments.get("theme", "default")
-        shadow = arguments.get("shadow", True)
+        shadow = arguments.get("shadow")
         watermark = arguments.get("watermark", False)
         watermark_text = arguments.get("watermark_text", "Generated by word2img-mcp")
         output_format = arguments.get("output_format", "png")
         quality = arguments.get("quality", 95)
+        encoding_profile = arguments.get("encoding_profile")
+        palette = arguments.get("palette")
         backend_preference = arguments.get("backend_preference", "auto")
+        base_task_id = arguments.get("base_task_id")
+        profiler = RenderProfiler() if should_profile(arguments.get("profile", False)) else None
         
         options = RenderOptions(
             width=width,
@@ -156,14 +349,54 @@ async def _handle_submit_markdown(arguments: dict[str, Any]) -> list[types.TextC
             shadow=shadow,
             watermark=watermark,
             watermark_text=watermark_text,
-            output_format=output_format
+            output_format=output_format,
+            quality=quality,
+            backend_preference=backend_preference,
+            base_task_id=base_task_id
         )
         
-        img_path = render_markdown_text_to_image(markdown_text, options)
+        # 主图与附加输出按宽高比分组，每组只按最大尺寸渲染一次（见 renditions.py）
+        main_rendition = Rendition(width, height, output_format, quality, encoding_profile, palette)
+        extra_renditions = parse_renditions(arguments.get("renditions"), main_rendition)
+        groups = plan_renditions([main_rendition, *extra_renditions])
+        
+        with timer.stage("admission"):
+            # 按估算内存占用排队；超出客户端速率或排队超时则拒绝并给出 retry_after。
+            # 每组的母版图在保存前都驻留内存，因此按所有组母版的总和计费
+            admission = await _get_admission().acquire(
+                _client_id(arguments),
+                sum(estimate_render_bytes(master.width, master.height) for master, _ in groups))
         
-        # Load the generated image
-        from PIL import Image
-        img = Image.open(img_path)
+        rendered = []
+        with timer.stage("render", groups=len(groups)), (profiler or nullcontext()):
+            for master, members in groups:
+                # 主图尺寸沿用原选项（含增量渲染）；其余尺寸复制选项单独渲染
+                render_options = options if master == main_rendition else replace(
+                    options, width=master.width, height=master.height,
+                    base_task_id=options.base_task_id if main_rendition in members else None,
+                    layout_snapshot=None, backend_failures=[])
+                # 异步渲染：客户端取消请求时终止外部渲染进程；CPU 步骤始终在线程池执行，剖析器在工作线程内启用
+                group_path = await render_markdown_text_to_image_async(
+                    markdown_text, render_options, timer=timer, profiler=profiler)
+                rendered.append((master, members, render_options, group_path))
+        
+        # Load the generated images; the main image and renditions are resampled from their group's render
+        rendition_images = []
+        with timer.stage("load_image", renditions=len(extra_renditions)):
+            for master, members, render_options, group_path in rendered:
+                # 解码和缩放是 CPU 密集的，放到线程池执行，不阻塞事件循环
+                images = await asyncio.to_thread(_load_group_images, group_path, master, members)
+                for member, image in images:
+                    extra = {"backend_used": render_options.backend_used}
+                    if member != master:
+                        extra["resampled_from"] = f"{master.width}x{master.height}"
+                    if member == main_rendition:
+                        img, img_path, main_options, main_extra = image, group_path, render_options, extra
+                        # 增量快照必须与主图同尺寸：主图由更大的母版缩放而来时不保存母版画布
+                        snapshot = render_options.layout_snapshot if master == main_rendition else None
+                    else:
+                        rendition_images.append((member, image, extra))
+        rendition_images.sort(key=lambda entry: extra_renditions.index(entry[0]))
         
         # Prepare options for storage
         storage_options = {
@@ -171,31 +404,59 @@ async def _handle_submit_markdown(arguments: dict[str, Any]) -> list[types.TextC
             "bold": bold,
             "width": width,
             "height": height,
-            "background_color": background_color,
-            "text_color": text_color,
-            "accent_color": accent_color,
-            "font_family": font_family,
-            "font_size": font_size,
-            "line_height": line_height,
-            "header_scale": header_scale,
+            "background_color": main_options.background_color,
+            "text_color": main_options.text_color,
+            "accent_color": main_options.accent_color,
+            "font_family": main_options.font_family,
+            "font_size": main_options.font_size,
+            "line_height": main_options.line_height,
+            "header_scale": main_options.header_scale,
             "theme": theme,
-            "shadow": shadow,
+            "shadow": main_options.shadow,
             "watermark": watermark,
             "watermark_text": watermark_text,
             "output_format": output_format,
             "quality": quality,
+            "encoding_profile": encoding_profile,
+            "palette": palette,
             "backend_preference": backend_preference,
-            "backend_used": getattr(options, 'backend_used', 'unknown'),
+            "backend_used": getattr(main_options, 'backend_used', 'unknown'),
             "original_path": img_path
         }
+        if main_options.backend_failures:
+            # 失败或被跳过的后端及终止原因（超时、资源限制等）
+            storage_options["backend_failures"] = main_options.backend_failures
+        if main_options.layout_snapshot is not None:
+            storage_options["layout"] = main_options.layout_snapshot.stats
+        elif base_task_id:
+            storage_options["layout"] = {"base_task_id": base_task_id, "incremental": False,
+                                         "reason": "backend_not_incremental"}
+        if "resampled_from" in main_extra:
+            storage_options["resampled_from"] = main_extra["resampled_from"]
+        if profiler is not None:
+            storage_options["profile"] = profiler.summary()
+        
+        with timer.stage("save_image"):
+            # 编码、哈希和写盘同样在线程池执行
+            task_id = await asyncio.to_thread(
+                _get_store().save_image,
+                img, format=output_format, options=storage_options, timer=timer,
+                quality=quality, encoding_profile=encoding_profile, palette=palette,
+                renditions=rendition_images
+            )
+        if snapshot is not None:
+            LAYOUT_SNAPSHOTS.put(task_id, snapshot)
         
-        task_id = _store.save_image(img, format=output_format, options=storage_options)
+        if profiler is not None and profiler.active:
+            with timer.stage("save_profile"):
+                await asyncio.to_thread(_get_store().save_profile, task_id, profiler)
         
-        # Clean up the temporary file if it's different from the stored one
+        # Clean up the temporary files if they are different from the stored one
         try:
-            stored_path = _store.get_path(task_id)
-            if img_path != stored_path and os.path.exists(img_path):
-                os.remove(img_path)
+            stored_path = _get_store().get_path(task_id)
+            for _, _, _, group_path in rendered:
+                if group_path != stored_path and os.path.exists(group_path):
+                    os.remove(group_path)
         except:
             pass  # Ignore cleanup errors
         
@@ -206,23 +467,33 @@ async def _handle_submit_markdown(arguments: dict[str, Any]) -> list[types.TextC
             "image_size": f"{width}x{height}",
             "format": output_format,
             "created_at": datetime.now().isoformat(),
-            "options": storage_options
+            "options": storage_options,
+            "timings": timer.to_dict()
         }
+        if rendition_images:
+            task_info["renditions"] = [
+                {key: value for key, value in entry.items() if key not in ("path", "encoding")}
+                for entry in (_get_store().get_task_metadata(task_id) or {}).get("renditions", [])
+            ]
+        if profiler is not None:
+            task_info["profile"] = profiler.summary()
         
         return [types.TextContent(type="text", text=json.dumps(task_info, ensure_ascii=False))]
     
+    except AdmissionRejected:
+        raise
     except Exception as e:
-        error_details = {
-            "error": str(e),
-            "error_type": type(e).__name__,
-            "tool": "submit_markdown",
-            "arguments": arguments
-        }
+        error_details = _error_details(e, "submit_markdown", arguments)
         raise ValueError(f"Markdown渲染失败: {json.dumps(error_details, ensure_ascii=False)}") from e
+    finally:
+        if admission is not None:
+            admission.release()
+        RENDERS_IN_FLIGHT.dec()
 
 
 async def _handle_get_image(arguments: dict[str, Any]) -> list[types.TextContent]:
     """Handle get_image tool with size optimization to avoid token limits."""
+    started = time.perf_counter()
     try:
         task_id = arguments["task_id"]
         as_base64 = arguments.get("as_base64", True)
@@ -231,10 +502,16 @@ async def _handle_get_image(arguments: dict[str, Any]) -> list[types.TextContent
         show_in_chat = arguments.get("show_in_chat", True)
         # 新增参数：控制是否包含完整的 base64 数据
         include_full_base64 = arguments.get("include_full_base64", False)
+        rendition = arguments.get("rendition")
         
-        path = _store.get_path(task_id)
-        if not path or not os.path.exists(path):
-            raise ValueError(f"任务ID无效或图片不存在: {task_id}")
+        if rendition:
+            path = _get_store().get_rendition_path(task_id, rendition)
+            if not path or not os.path.exists(path):
+                raise ValueError(f"任务ID无效或附加输出不存在: {task_id} / {rendition}")
+        else:
+            path = _get_store().get_path(task_id)
+            if not path or not os.path.exists(path):
+                raise ValueError(f"任务ID无效或图片不存在: {task_id}")
         
         # 获取文件大小信息
         file_size = os.path.getsize(path)
@@ -334,6 +611,11 @@ async def _handle_get_image(arguments: dict[str, Any]) -> list[types.TextContent
         if include_metadata:
             result["metadata"] = _get_image_metadata(path)
         
+        returned_b64 = sum(len(item.data) for item in content_list if isinstance(item, types.ImageContent))
+        returned_b64 += len(result.get("image_data", "")) + len(result.get("data_url", ""))
+        if returned_b64:
+            BASE64_BYTES_RETURNED_TOTAL.inc(returned_b64)
+        
         content_list.append(types.TextContent(
             type="text", 
             text=json.dumps(result, ensure_ascii=False, indent=2)
@@ -349,6 +631,8 @@ async def _handle_get_image(arguments: dict[str, Any]) -> list[types.TextContent
             "arguments": arguments
         }
         raise ValueError(f"图片获取失败: {json.dumps(error_details, ensure_ascii=False)}") from e
+    finally:
+        GET_IMAGE_DURATION_SECONDS.observe(time.perf_counter() - started)
 
 
 async def _handle_get_render_info(arguments: dict[str, Any]) -> list[types.TextContent]:
@@ -368,13 +652,37 @@ async def _handle_get_render_info(arguments: dict[str, Any]) -> list[types.TextC
                 "width": 1200,
                 "height": 1600,
                 "aspect_ratio": f"{ASPECT_RATIO[0]}:{ASPECT_RATIO[1]}",
-                "supported_formats": ["png", "jpg", "jpeg", "webp"],
+                "supported_formats": ["png", "jpg", "jpeg", "webp", "avif"],
+                "encoding_profiles": ["fast", "balanced", "smallest"],
+                "palette_modes": ["off", "lossless", "auto"],
+                "themes": get_theme_registry().names(),
+                "templates": TEMPLATES.describe(),
                 "max_dimensions": {"width": 4000, "height": 6000}
             }
         }
         
         if detailed:
             info["detailed_backend_info"] = _get_detailed_backend_info()
+            info["stage_timings"] = STAGE_HISTOGRAMS.snapshot()
+        else:
+            info["stage_timings"] = {
+                stage: {key: value for key, value in entry.items() if key != "buckets"}
+                for stage, entry in STAGE_HISTOGRAMS.snapshot().items()
+            }
+        
+        if _retention is not None:
+            info["retention"] = _retention.status()
+        if _store is not None:
+            info["storage"] = _store.storage.status()
+        info["admission"] = _get_admission().status()
+        info["renderer_supervisor"] = SUPERVISOR.status()
+        info["document_cache"] = DOCUMENT_CACHE.status()
+        info["layout_snapshots"] = LAYOUT_SNAPSHOTS.status()
+        
+        from word2img_mcp.remote import remote_status
+        remote = remote_status()
+        if remote:
+            info["remote_api"] = remote
         
         return [types.TextContent(type="text", text=json.dumps(info, ensure_ascii=False))]
     
@@ -394,8 +702,8 @@ async def _handle_list_tasks(arguments: dict[str, Any]) -> list[types.TextConten
         limit = arguments.get("limit", 10)
         status_filter = arguments.get("status", "all")
         
-        tasks = _store.list_tasks(limit, status_filter)
-        stats = _store.get_task_statistics()
+        tasks = _get_store().list_tasks(limit, status_filter)
+        stats = _get_store().get_task_statistics()
         
         result = {
             "tasks": tasks,
@@ -416,6 +724,135 @@ async def _handle_list_tasks(arguments: dict[str, Any]) -> list[types.TextConten
         raise ValueError(f"任务列表获取失败: {json.dumps(error_details, ensure_ascii=False)}") from e
 
 
+async def _handle_get_profile(arguments: dict[str, Any]) -> list[types.TextContent]:
+    """Handle get_profile tool."""
+    try:
+        task_id = arguments["task_id"]
+        
+        profile = _get_store().get_profile_report(task_id)
+        if profile is None:
+            raise ValueError(f"任务没有性能剖析报告: {task_id}")
+        
+        return [types.TextContent(type="text", text=json.dumps(profile, ensure_ascii=False))]
+    
+    except Exception as e:
+        error_details = {
+            "error": str(e),
+            "error_type": type(e).__name__,
+            "tool": "get_profile",
+            "arguments": arguments
+        }
+        raise ValueError(f"性能剖析报告获取失败: {json.dumps(error_details, ensure_ascii=False)}") from e
+
+
+async def _handle_get_metrics(arguments: dict[str, Any]) -> list[types.TextContent]:
+    """Handle get_metrics tool."""
+    try:
+        return [types.TextContent(type="text", text=render_metrics())]
+    
+    except Exception as e:
+        error_details = {
+            "error": str(e),
+            "error_type": type(e).__name__,
+            "tool": "get_metrics",
+            "arguments": arguments
+        }
+        raise ValueError(f"运行指标获取失败: {json.dumps(error_details, ensure_ascii=False)}") from e
+
+
+async def _handle_register_template(arguments: dict[str, Any]) -> list[types.TextContent]:
+    """Handle register_template tool."""
+    try:
+        width = arguments.get("width", 1200)
+        options = RenderOptions(
+            width=width,
+            height=arguments.get("height", int(width * ASPECT_RATIO[1] / ASPECT_RATIO[0])),
+            align=arguments.get("align", "center"),
+            theme=arguments.get("theme", "default"),
+            background_color=arguments.get("background_color"),
+            text_color=arguments.get("text_color"),
+            accent_color=arguments.get("accent_color"),
+            font_size=arguments.get("font_size"),
+            watermark=arguments.get("watermark", False),
+            watermark_text=arguments.get("watermark_text", "Generated by word2img-mcp")
+        )
+        started = time.perf_counter()
+        template = TEMPLATES.register(arguments["name"], arguments["markdown_template"], options)
+        info = template.describe()
+        info["prepare_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return [types.TextContent(type="text", text=json.dumps(info, ensure_ascii=False))]
+    
+    except Exception as e:
+        error_details = {
+            "error": str(e),
+            "error_type": type(e).__name__,
+            "tool": "register_template",
+            "arguments": arguments
+        }
+        raise ValueError(f"模板注册失败: {json.dumps(error_details, ensure_ascii=False)}") from e
+
+
+async def _handle_render_template(arguments: dict[str, Any]) -> list[types.TextContent]:
+    """Handle render_template tool."""
+    timer = StageTimer()
+    RENDERS_IN_FLIGHT.inc()
+    admission = None
+    try:
+        template = TEMPLATES.get(arguments["name"])
+        variables = arguments.get("variables", {})
+        output_format = arguments.get("output_format", "png")
+        quality = arguments.get("quality", 95)
+        encoding_profile = arguments.get("encoding_profile")
+        palette = arguments.get("palette")
+        
+        with timer.stage("admission"):
+            admission = await _get_admission().acquire(
+                _client_id(arguments), estimate_render_bytes(template.options.width, template.options.height))
+        
+        with timer.stage("render"):
+            # 异步渲染：不阻塞事件循环，客户端取消请求时终止 wkhtmltoimage
+            img, backend_used = await template.render_async(variables, timer=timer)
+        
+        storage_options = {
+            "template": template.name,
+            "variables": variables,
+            "theme": template.options.theme,
+            "width": template.options.width,
+            "height": template.options.height,
+            "output_format": output_format,
+            "quality": quality,
+            "encoding_profile": encoding_profile,
+            "palette": palette,
+            "backend_used": backend_used
+        }
+        with timer.stage("save_image"):
+            task_id = _get_store().save_image(
+                img, format=output_format, options=storage_options, timer=timer,
+                quality=quality, encoding_profile=encoding_profile, palette=palette
+            )
+        
+        task_info = {
+            "task_id": task_id,
+            "status": "completed",
+            "image_size": f"{img.width}x{img.height}",
+            "format": output_format,
+            "created_at": datetime.now().isoformat(),
+            "options": storage_options,
+            "timings": timer.to_dict()
+        }
+        return [types.TextContent(type="text", text=json.dumps(task_info, ensure_ascii=False))]
+    
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        error_details = _error_details(e, "render_template", arguments)
+        raise ValueError(f"模板渲染失败: {json.dumps(error_details, ensure_ascii=False)}") from e
+    finally:
+        if admission is not None:
+            admission.release()
+        RENDERS_IN_FLIGHT.dec()
+
+
 def _get_image_metadata(file_path: str) -> dict:
     """Get image metadata information."""
     try:
@@ -451,6 +888,19 @@ def _get_detailed_backend_info() -> dict:
 
 async def run_server() -> None:
     """Run the MCP server."""
+    # 可选：通过 WORD2IMG_METRICS_PORT 在本地端口暴露 /metrics
+    start_metrics_server_from_env()
+    
+    # 启动时编译内置主题并加载 WORD2IMG_THEME_PATH 中的主题文件（文件有误时立即报错）
+    get_theme_registry()
+    
+    # 可选：按 WORD2IMG_RETENTION_* 配置在后台线程清理过期/超额任务
+    global _retention
+    policy = RetentionPolicy.from_env()
+    if policy.enabled and _retention is None:
+        _retention = RetentionScheduler(_get_store(), policy)
+        _retention.start()
+    
     async with stdio_server() as (read_stream, write_stream):
         await server.run(
             read_stream,
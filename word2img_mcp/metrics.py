@@ -0,0 +1,315 @@
+"""
+Process-wide metrics with Prometheus text exposition.
+
+Metrics are exported through the ``get_metrics`` MCP tool and, when
+``WORD2IMG_METRICS_PORT`` is set, over a local HTTP endpoint (``/metrics``).
+
+``word2img_cache_hits_total`` / ``word2img_cache_misses_total`` are labelled
+by cache.  Caches with their own lookup code count directly (``document``,
+``layout``, ``layout_snapshot``); ``functools.lru_cache`` caches (``font``,
+``theme_css``, ``theme_pil``) are registered with ``track_lru_cache`` and
+read from ``cache_info()`` on every scrape.
+"""
+
+import math
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+# 秒级延迟直方图桶
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS_PORT_ENV = "WORD2IMG_METRICS_PORT"
+METRICS_HOST_ENV = "WORD2IMG_METRICS_HOST"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape_label(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Base class holding label handling shared by all metric types."""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {list(self.labelnames)}, got {sorted(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0)]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram in Prometheus layout."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [0] * (len(self.buckets) + 2)
+                self._values[key] = entry
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return int(entry[-1]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        lines = []
+        for key, entry in items:
+            cumulative = 0
+            for i, bound in enumerate(self.buckets):
+                cumulative += entry[i]
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(entry[-2])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(entry[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of named metrics rendered together."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} already registered with a different shape")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collect: Callable[[], None]) -> None:
+        """Register a callback that updates metrics right before each render."""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            collectors = list(self._collectors)
+        for collect in collectors:
+            collect()
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return "\n".join(metric.expose() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+RENDERS_TOTAL = REGISTRY.counter(
+    "word2img_renders_total", "Successful renders by backend.", ["backend"])
+RENDER_BACKEND_FAILURES_TOTAL = REGISTRY.counter(
+    "word2img_render_backend_failures_total", "Failed backend attempts (before falling through).", ["backend"])
+RENDER_FALLBACKS_TOTAL = REGISTRY.counter(
+    "word2img_render_fallbacks_total", "Renders that succeeded only after at least one backend failed.")
+RENDER_FAILURES_TOTAL = REGISTRY.counter(
+    "word2img_render_failures_total", "Renders where every backend failed.")
+RENDER_DURATION_SECONDS = REGISTRY.histogram(
+    "word2img_render_duration_seconds", "Wall time of successful renders by backend.", ["backend"])
+RENDERS_IN_FLIGHT = REGISTRY.gauge(
+    "word2img_renders_in_flight", "submit_markdown requests currently being processed.")
+RENDER_QUEUE_DEPTH = REGISTRY.gauge(
+    "word2img_render_queue_depth", "Render requests queued for admission (not yet rendering).")
+CACHE_HITS_TOTAL = REGISTRY.counter(
+    "word2img_cache_hits_total", "Cache hits by cache name.", ["cache"])
+CACHE_MISSES_TOTAL = REGISTRY.counter(
+    "word2img_cache_misses_total", "Cache misses by cache name.", ["cache"])
+STORE_BYTES_WRITTEN_TOTAL = REGISTRY.counter(
+    "word2img_store_bytes_written_total", "Encoded image bytes written by the ImageStore.", ["format"])
+STORE_DEDUP_HITS_TOTAL = REGISTRY.counter(
+    "word2img_store_dedup_hits_total", "Saved images whose bytes matched an existing blob (no write).", ["format"])
+GET_IMAGE_DURATION_SECONDS = REGISTRY.histogram(
+    "word2img_get_image_duration_seconds", "Latency of get_image requests.")
+BASE64_BYTES_RETURNED_TOTAL = REGISTRY.counter(
+    "word2img_base64_bytes_returned_total", "Base64 characters returned to clients by get_image.")
+
+
+def track_lru_cache(name: str, cached: Any) -> None:
+    """Feed the cache hit/miss counters from a ``functools.lru_cache`` on every scrape."""
+    seen = {"hits": 0, "misses": 0}
+    lock = threading.Lock()
+
+    def collect() -> None:
+        info = cached.cache_info()
+        with lock:
+            if info.hits < seen["hits"] or info.misses < seen["misses"]:
+                # cache_clear() 会把计数归零，之后从零开始累计
+                seen.update(hits=0, misses=0)
+            if info.hits > seen["hits"]:
+                CACHE_HITS_TOTAL.inc(info.hits - seen["hits"], cache=name)
+            if info.misses > seen["misses"]:
+                CACHE_MISSES_TOTAL.inc(info.misses - seen["misses"], cache=name)
+            seen.update(hits=info.hits, misses=info.misses)
+
+    REGISTRY.add_collector(collect)
+
+
+def render_metrics() -> str:
+    """Render the default registry."""
+    return REGISTRY.render()
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+    """Serve /metrics from a daemon thread and return the server."""
+    # http.server 只在启用导出端口时导入，不拖慢服务冷启动
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802 - http.server API
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            # stdout 被 MCP stdio 协议占用，禁止访问日志输出
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, name="word2img-metrics", daemon=True)
+    thread.start()
+    return httpd
+
+
+def start_metrics_server_from_env() -> Optional["ThreadingHTTPServer"]:
+    """Start the HTTP exporter if WORD2IMG_METRICS_PORT is configured."""
+    port = os.environ.get(METRICS_PORT_ENV)
+    if not port:
+        return None
+    return start_metrics_server(int(port), os.environ.get(METRICS_HOST_ENV, "127.0.0.1"))
@@ -0,0 +1,145 @@
+"""
+Opt-in per-render profiling (cProfile + tracemalloc).
+
+A render is profiled when the client passes ``profile=true`` to
+``submit_markdown`` or when it is picked by the server-wide sampling rate
+``WORD2IMG_PROFILE_SAMPLE_RATE`` (0.0 - 1.0).
+
+cProfile only sees the thread that enabled it, so the profile is not enabled
+on the event loop: the renderer's worker-thread steps go through
+``RenderProfiler.call``, which enables it around the step in that thread.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+PROFILE_SAMPLE_RATE_ENV = "WORD2IMG_PROFILE_SAMPLE_RATE"
+
+# 报告中保留的函数/分配条目数
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_TOP_ALLOCATIONS = 20
+
+# cProfile 和 tracemalloc 都是进程级的，同一时间只允许一个剖析会话
+_profile_lock = threading.Lock()
+
+
+def get_profile_sample_rate() -> float:
+    """Read the server-wide sampling rate, clamped to [0, 1]."""
+    try:
+        rate = float(os.environ.get(PROFILE_SAMPLE_RATE_ENV, "0") or 0)
+    except ValueError:
+        return 0.0
+    return min(1.0, max(0.0, rate))
+
+
+def should_profile(requested: bool = False) -> bool:
+    """Decide whether this request gets profiled."""
+    if requested:
+        return True
+    rate = get_profile_sample_rate()
+    return rate > 0 and random.random() < rate
+
+
+class RenderProfiler:
+    """Context manager capturing a cProfile and peak-memory snapshot."""
+
+    def __init__(self, label: str = "render") -> None:
+        self.label = label
+        self.active = False
+        self.skipped_reason: Optional[str] = None
+        self.duration_ms: Optional[float] = None
+        self.peak_memory_bytes: Optional[int] = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._started_tracing = False
+        self._started = 0.0
+        self._calls = 0
+
+    def __enter__(self) -> "RenderProfiler":
+        if not _profile_lock.acquire(blocking=False):
+            self.skipped_reason = "another profiling session is active"
+            return self
+        self.active = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self._profile = cProfile.Profile()
+        self._calls = 0
+        self._started = time.perf_counter()
+        return self
+
+    def call(self, func: Callable, *args: Any) -> Any:
+        """Run ``func`` with cProfile enabled in the calling (worker) thread."""
+        if not self.active or self._profile is None:
+            return func(*args)
+        # 同一次渲染的 CPU 步骤依次执行，同一时间只有一个线程启用该 Profile
+        self._profile.enable()
+        try:
+            return func(*args)
+        finally:
+            self._profile.disable()
+            self._calls += 1
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not self.active:
+            return
+        try:
+            self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+            _, self.peak_memory_bytes = tracemalloc.get_traced_memory()
+            self._snapshot = tracemalloc.take_snapshot()
+            if self._started_tracing:
+                tracemalloc.stop()
+        finally:
+            _profile_lock.release()
+
+    def summary(self) -> Dict[str, Any]:
+        """Short JSON-serializable summary for task responses."""
+        if not self.active:
+            return {"profiled": False, "reason": self.skipped_reason}
+        return {
+            "profiled": True,
+            "duration_ms": self.duration_ms,
+            "peak_memory_bytes": self.peak_memory_bytes
+        }
+
+    def report(self) -> str:
+        """Human-readable report: top functions by cumulative time and top allocations."""
+        if not self.active or self._profile is None:
+            return ""
+        out = io.StringIO()
+        out.write(f"# word2img-mcp profile: {self.label}\n")
+        out.write(f"# generated_at: {datetime.now().isoformat()}\n")
+        out.write(f"# duration_ms: {self.duration_ms}\n")
+        out.write(f"# peak_memory_bytes: {self.peak_memory_bytes}\n\n")
+
+        out.write("## cProfile (sorted by cumulative time)\n")
+        if self._calls:
+            stats = pstats.Stats(self._profile, stream=out)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_FUNCTIONS)
+        else:
+            # 例如 API 后端：渲染全程在远端，本进程没有 CPU 步骤
+            out.write("(no CPU-bound steps ran in this process)\n")
+
+        out.write("\n## tracemalloc (top allocations by line)\n")
+        if self._snapshot is not None:
+            snapshot = self._snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]:
+                out.write(f"{stat}\n")
+        return out.getvalue()
+
+    def dump_stats(self, path: str) -> None:
+        """Write raw pstats data (loadable with pstats/snakeviz)."""
+        if self.active and self._profile is not None and self._calls:
+            self._profile.dump_stats(path)
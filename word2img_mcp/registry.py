@@ -0,0 +1,478 @@
+"""
+Compact on-disk task registry.
+
+Tasks are stored as fixed-width binary records in ``tasks.dat`` (append
+order == creation order) and looked up through ``tasks.idx``, a sorted
+array of ``(task uuid, record number)`` pairs.  Both files are memory-mapped
+and read lazily, so opening a registry with a million tasks costs a couple of
+``mmap`` calls instead of parsing and holding a JSON document.
+
+Records appended after the last index build are kept in a small in-memory
+map and merged into the index once it grows past a fraction of the indexed
+size, keeping index maintenance amortized O(1) per insert.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+REGISTRY_FILENAME = "tasks.dat"
+INDEX_FILENAME = "tasks.idx"
+
+_REGISTRY_MAGIC = b"W2IREG\x00\x00"
+_INDEX_MAGIC = b"W2IIDX\x00\x00"
+REGISTRY_VERSION = 1
+
+# header: magic, version, record size
+_HEADER = struct.Struct("<8sII16x")
+# record: uuid, created_at (epoch), status, flags, format, file_size, relative path
+_RECORD = struct.Struct("<16sdBB6sQ160s")
+# index header: magic, number of records covered; entry: uuid, record number
+_INDEX_HEADER = struct.Struct("<8sQ16x")
+_INDEX_ENTRY = struct.Struct("<16sI")
+
+STATUS_DELETED = "deleted"
+_STATUS_CODES = {STATUS_DELETED: 0, "completed": 1, "failed": 2, "processing": 3}
+_STATUS_NAMES = {code: name for name, code in _STATUS_CODES.items()}
+
+FLAG_HAS_METADATA = 0x01
+FLAG_HAS_PROFILE = 0x02
+
+# 未进入索引的记录超过 max(阈值, 已索引数/8) 时合并重建索引
+INDEX_MERGE_MIN = 4096
+# iter_records 每批在锁内解码的记录数；锁不跨 yield 持有
+ITER_BATCH = 1024
+INDEX_MERGE_RATIO = 8
+
+
+class TaskRecord:
+    """One task entry; ``__slots__`` keeps per-record overhead small."""
+
+    __slots__ = ("task_id", "created_at", "status", "format", "file_size", "path",
+                 "has_metadata", "has_profile")
+
+    def __init__(self, task_id: str, created_at: str, status: str, format: str, file_size: int,
+                 path: Optional[str] = None, has_metadata: bool = True, has_profile: bool = False) -> None:
+        self.task_id = task_id
+        self.created_at = created_at
+        self.status = status
+        self.format = format
+        self.file_size = file_size
+        self.path = path
+        self.has_metadata = has_metadata
+        self.has_profile = has_profile
+
+    def to_dict(self) -> Dict:
+        """Same shape as the legacy tasks.json entries."""
+        result = {
+            "task_id": self.task_id,
+            "created_at": self.created_at,
+            "status": self.status,
+            "format": self.format,
+            "file_size": self.file_size,
+            "has_metadata": self.has_metadata,
+            "path": self.path
+        }
+        if self.has_profile:
+            result["has_profile"] = True
+        return result
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "TaskRecord":
+        return cls(
+            task_id=data["task_id"],
+            created_at=data.get("created_at") or datetime.now().isoformat(),
+            status=data.get("status", "completed"),
+            format=data.get("format", ""),
+            file_size=int(data.get("file_size", 0)),
+            path=data.get("path"),
+            has_metadata=bool(data.get("has_metadata", True)),
+            has_profile=bool(data.get("has_profile", False))
+        )
+
+
+class TaskRegistry:
+    """Memory-mapped fixed-width task registry with a sorted uuid index."""
+
+    def __init__(self, base_dir: str) -> None:
+        self.base_dir = base_dir
+        self.path = os.path.join(base_dir, REGISTRY_FILENAME)
+        self.index_path = os.path.join(base_dir, INDEX_FILENAME)
+        self._lock = threading.RLock()
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._count = 0
+        self._index_map: Optional[mmap.mmap] = None
+        self._indexed = 0
+        self._tail: Dict[bytes, int] = {}
+        # 第一条可能存活的记录号：保留策略按 FIFO 删除时头部会积累墓碑，顺序扫描时跳过
+        # （按配额/LRU 或 delete_task 从中间删除的记录只是普通墓碑）
+        self._head = 0
+        # 存活任务的计数与大小，首次查询时扫描一次，之后随写入增量维护
+        self._stats: Optional[Dict] = None
+        self._open()
+
+    # ------------------------------------------------------------------ files
+
+    def _open(self) -> None:
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) >= _HEADER.size
+        self._file = open(self.path, "r+b" if exists else "w+b")
+        if exists:
+            magic, version, record_size = _HEADER.unpack(self._file.read(_HEADER.size))
+            if magic != _REGISTRY_MAGIC or version != REGISTRY_VERSION or record_size != _RECORD.size:
+                self._file.close()
+                raise ValueError(f"Unsupported task registry format: {self.path}")
+            size = os.fstat(self._file.fileno()).st_size
+            # 丢弃末尾不完整的记录（写入中途崩溃）
+            self._count = (size - _HEADER.size) // _RECORD.size
+            if _HEADER.size + self._count * _RECORD.size != size:
+                self._file.truncate(_HEADER.size + self._count * _RECORD.size)
+        else:
+            self._file.write(_HEADER.pack(_REGISTRY_MAGIC, REGISTRY_VERSION, _RECORD.size))
+            self._file.flush()
+        self._remap()
+        self._open_index()
+
+    def _remap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _open_index(self) -> None:
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+        self._indexed = 0
+        if os.path.exists(self.index_path) and os.path.getsize(self.index_path) >= _INDEX_HEADER.size:
+            with open(self.index_path, "rb") as f:
+                index_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, covered = _INDEX_HEADER.unpack_from(index_map, 0)
+            expected = _INDEX_HEADER.size + covered * _INDEX_ENTRY.size
+            if magic == _INDEX_MAGIC and covered <= self._count and len(index_map) == expected:
+                self._index_map = index_map
+                self._indexed = covered
+            else:
+                index_map.close()
+        # 索引之后追加的记录放入内存尾部映射
+        self._tail = {}
+        for recno in range(self._indexed, self._count):
+            self._tail[self._raw_id(recno)] = recno
+        if len(self._tail) > self._merge_threshold():
+            self._rebuild_index()
+
+    def _merge_threshold(self) -> int:
+        return max(INDEX_MERGE_MIN, self._indexed // INDEX_MERGE_RATIO)
+
+    def _rebuild_index(self) -> None:
+        """Merge the in-memory tail into a new sorted index file."""
+        new_entries = sorted(self._tail.items())
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            out.write(_INDEX_HEADER.pack(_INDEX_MAGIC, self._count))
+            old = self._iter_index_entries()
+            pending = next(old, None)
+            buffer = bytearray()
+            for key, recno in new_entries:
+                while pending is not None and pending[0] < key:
+                    buffer += _INDEX_ENTRY.pack(*pending)
+                    pending = next(old, None)
+                buffer += _INDEX_ENTRY.pack(key, recno)
+                if len(buffer) >= 1 << 20:
+                    out.write(buffer)
+                    buffer.clear()
+            while pending is not None:
+                buffer += _INDEX_ENTRY.pack(*pending)
+                pending = next(old, None)
+            out.write(buffer)
+            del old
+        if self._index_map is not None:
+            # Windows 下不能替换仍被映射的文件
+            self._index_map.close()
+            self._index_map = None
+        os.replace(tmp_path, self.index_path)
+        self._open_index()
+
+    def _iter_index_entries(self) -> Iterator[tuple]:
+        if self._index_map is None:
+            return iter(())
+        return _INDEX_ENTRY.iter_unpack(memoryview(self._index_map)[_INDEX_HEADER.size:])
+
+    def sync(self) -> None:
+        """Flush record writes to stable storage."""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            # 关闭时合并尾部，下次打开无需扫描
+            if self._tail:
+                self._rebuild_index()
+            for handle in (self._map, self._index_map, self._file):
+                if handle is not None:
+                    handle.close()
+            self._map = self._index_map = self._file = None
+
+    # ---------------------------------------------------------------- records
+
+    def _offset(self, recno: int) -> int:
+        return _HEADER.size + recno * _RECORD.size
+
+    def _raw_id(self, recno: int) -> bytes:
+        offset = self._offset(recno)
+        return bytes(self._map[offset:offset + 16])
+
+    def _find(self, task_id: str) -> Optional[int]:
+        try:
+            key = uuid.UUID(task_id).bytes
+        except (ValueError, AttributeError, TypeError):
+            return None
+        recno = self._tail.get(key)
+        if recno is not None:
+            return recno
+        if self._index_map is None:
+            return None
+        lo, hi = 0, self._indexed
+        base = _INDEX_HEADER.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = base + mid * _INDEX_ENTRY.size
+            probe = self._index_map[offset:offset + 16]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                return _INDEX_ENTRY.unpack_from(self._index_map, offset)[1]
+        return None
+
+    def _decode(self, raw: tuple) -> TaskRecord:
+        key, created_ts, status, flags, fmt, file_size, rel_path = raw
+        rel_path = rel_path.rstrip(b"\x00").decode("utf-8")
+        return TaskRecord(
+            task_id=str(uuid.UUID(bytes=key)),
+            created_at=datetime.fromtimestamp(created_ts).isoformat(),
+            status=_STATUS_NAMES.get(status, "unknown"),
+            format=fmt.rstrip(b"\x00").decode("ascii"),
+            file_size=file_size,
+            path=os.path.join(self.base_dir, rel_path) if rel_path else None,
+            has_metadata=bool(flags & FLAG_HAS_METADATA),
+            has_profile=bool(flags & FLAG_HAS_PROFILE)
+        )
+
+    def _encode(self, record: TaskRecord) -> bytes:
+        if record.status not in _STATUS_CODES:
+            raise ValueError(f"Unknown task status: {record.status}")
+        rel_path = b""
+        if record.path:
+            rel_path = os.path.relpath(record.path, self.base_dir).encode("utf-8")
+            if len(rel_path) > 160:
+                raise ValueError(f"Task path too long for registry: {record.path}")
+        fmt = record.format.encode("ascii")
+        if len(fmt) > 6:
+            raise ValueError(f"Task format too long for registry: {record.format}")
+        flags = (FLAG_HAS_METADATA if record.has_metadata else 0) | (FLAG_HAS_PROFILE if record.has_profile else 0)
+        return _RECORD.pack(
+            uuid.UUID(record.task_id).bytes,
+            datetime.fromisoformat(record.created_at).timestamp(),
+            _STATUS_CODES[record.status],
+            flags,
+            fmt,
+            int(record.file_size),
+            rel_path
+        )
+
+    def _read(self, recno: int) -> TaskRecord:
+        if self._offset(recno) + _RECORD.size > len(self._map):
+            self._remap()
+        return self._decode(_RECORD.unpack_from(self._map, self._offset(recno)))
+
+    # ------------------------------------------------------------------- API
+
+    def __len__(self) -> int:
+        """Number of live (non-deleted) tasks."""
+        with self._lock:
+            return sum(self._statistics()["counts"].values())
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+    def get(self, task_id: str) -> Optional[TaskRecord]:
+        with self._lock:
+            recno = self._find(task_id)
+            if recno is None:
+                return None
+            record = self._read(recno)
+            return None if record.status == STATUS_DELETED else record
+
+    def add(self, record: TaskRecord) -> None:
+        self.add_many([record])
+
+    def add_many(self, records: Iterable[TaskRecord]) -> int:
+        """Append records; existing task ids are updated in place."""
+        with self._lock:
+            added = 0
+            buffer = bytearray()
+            new_keys: List[bytes] = []
+            for record in records:
+                data = self._encode(record)
+                recno = self._find(record.task_id)
+                if recno is not None:
+                    self._tally(_RECORD.unpack_from(self._map, self._offset(recno)), -1)
+                    self._write_at(recno, data)
+                    self._tally(_RECORD.unpack(data), 1)
+                    self._head = min(self._head, recno)
+                    continue
+                buffer += data
+                self._tally(_RECORD.unpack(data), 1)
+                new_keys.append(uuid.UUID(record.task_id).bytes)
+                added += 1
+            if buffer:
+                self._file.seek(self._offset(self._count))
+                self._file.write(buffer)
+                self._file.flush()
+                for key in new_keys:
+                    self._tail[key] = self._count
+                    self._count += 1
+                self._remap()
+                if len(self._tail) > self._merge_threshold():
+                    self._rebuild_index()
+            return added
+
+    def _write_at(self, recno: int, data: bytes) -> None:
+        self._file.seek(self._offset(recno))
+        self._file.write(data)
+        self._file.flush()
+
+    def update(self, task_id: str, **fields) -> Optional[TaskRecord]:
+        """Rewrite one record in place with the given field changes."""
+        with self._lock:
+            recno = self._find(task_id)
+            if recno is None:
+                return None
+            record = self._read(recno)
+            if record.status == STATUS_DELETED:
+                return None
+            old = _RECORD.unpack_from(self._map, self._offset(recno))
+            for name, value in fields.items():
+                setattr(record, name, value)
+            data = self._encode(record)
+            self._write_at(recno, data)
+            self._tally(old, -1)
+            self._tally(_RECORD.unpack(data), 1)
+            return record
+
+    def delete(self, task_id: str) -> bool:
+        """Tombstone a task; its slot is kept so record numbers stay stable."""
+        return self.update(task_id, status=STATUS_DELETED) is not None
+
+    def _iter_raw(self, live_only: bool = True, reverse: bool = False) -> Iterator[tuple]:
+        if self._offset(self._count) > len(self._map):
+            self._remap()
+        if reverse:
+            view = memoryview(self._map)[_HEADER.size:self._offset(self._count)]
+            for recno in range(self._count - 1, self._head - 1, -1):
+                raw = _RECORD.unpack_from(view, recno * _RECORD.size)
+                if not live_only or raw[2] != 0:
+                    yield raw
+        else:
+            view = memoryview(self._map)[self._offset(self._head):self._offset(self._count)]
+            at_head = True
+            for raw in _RECORD.iter_unpack(view):
+                if raw[2] == 0:
+                    if at_head:
+                        self._head += 1
+                    if live_only:
+                        continue
+                else:
+                    at_head = False
+                yield raw
+
+    def _raw_range(self, start: int, stop: int) -> List[tuple]:
+        """Raw records ``start`` to ``stop`` (caller holds the lock)."""
+        if self._offset(stop) > len(self._map):
+            self._remap()
+        return list(_RECORD.iter_unpack(self._map[self._offset(start):self._offset(stop)]))
+
+    def iter_records(self, newest_first: bool = False, status: Optional[str] = None) -> Iterator[TaskRecord]:
+        """Iterate live records in creation order (or reverse).
+
+        Records are decoded in batches of ``ITER_BATCH`` under the lock and
+        yielded after it is released, so a slow consumer does not block
+        writers.  Tasks added after iteration started are not included.
+        """
+        code = _STATUS_CODES.get(status) if status else None
+        with self._lock:
+            head, count = self._head, self._count
+        if newest_first:
+            bounds = [(max(head, stop - ITER_BATCH), stop) for stop in range(count, head, -ITER_BATCH)]
+        else:
+            bounds = [(start, min(count, start + ITER_BATCH)) for start in range(head, count, ITER_BATCH)]
+        for start, stop in bounds:
+            with self._lock:
+                batch = [self._decode(raw) for raw in self._raw_range(start, stop)
+                         if raw[2] != 0 and (code is None or raw[2] == code)]
+            if newest_first:
+                batch.reverse()
+            yield from batch
+
+    def statistics(self) -> Dict:
+        """Counts by status and format, and the total size of live tasks."""
+        with self._lock:
+            stats = self._statistics()
+            return {"counts": dict(stats["counts"]), "formats": dict(stats["formats"]),
+                    "total_size": stats["total_size"]}
+
+    def _statistics(self) -> Dict:
+        """Live-task aggregates, built by one pass over the mapped records on first use (caller holds the lock)."""
+        if self._stats is None:
+            self._stats = {"counts": {}, "formats": {}, "total_size": 0}
+            for raw in self._iter_raw(live_only=True):
+                self._tally(raw, 1)
+        return self._stats
+
+    def _tally(self, raw: tuple, sign: int) -> None:
+        """Add (``sign`` 1) or remove (-1) one raw record from the aggregates, if they are built."""
+        if self._stats is None or raw[2] == 0:
+            return
+        for bucket, key in ((self._stats["counts"], _STATUS_NAMES.get(raw[2], "unknown")),
+                            (self._stats["formats"], raw[4].rstrip(b"\x00").decode("ascii"))):
+            bucket[key] = bucket.get(key, 0) + sign
+            if not bucket[key]:
+                del bucket[key]
+        self._stats["total_size"] += sign * raw[5]
+
+    def import_json(self, tasks: Dict[str, Dict]) -> Tuple[int, Dict[str, Dict]]:
+        """Import legacy tasks.json entries; returns (imported count, rejected entries).
+
+        Entries with non-UUID ids are skipped.  Entries the registry cannot
+        store (unknown status, over-long path or format, bad dates) are
+        returned as ``{task_id: {"entry": ..., "error": ...}}`` instead of
+        failing the whole import.
+        """
+        records = []
+        rejected: Dict[str, Dict] = {}
+        for task_id, entry in tasks.items():
+            try:
+                uuid.UUID(task_id)
+            except ValueError:
+                continue
+            try:
+                data = dict(entry)
+                data["task_id"] = task_id
+                record = TaskRecord.from_dict(data)
+                # 先编码一次，确认能写入定长记录
+                self._encode(record)
+            except (TypeError, ValueError, UnicodeError) as e:
+                rejected[task_id] = {"entry": entry, "error": str(e)}
+                continue
+            records.append(record)
+        records.sort(key=lambda record: record.created_at)
+        return self.add_many(records), rejected
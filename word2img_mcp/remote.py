@@ -0,0 +1,789 @@
+"""
+HTTP client for the md-to-image render API backend.
+
+One client per endpoint list is shared by every render in the process:
+
+* a pooled keep-alive session (requests for the sync renderer, httpx for
+  the async one), so consecutive renders reuse TCP connections;
+* a concurrency limit: at most ``max_concurrency`` requests are in flight
+  per endpoint, further renders wait (within their deadline) for a slot;
+* retries with exponential backoff and jitter on connection errors,
+  timeouts and 429/502/503/504, honouring ``Retry-After``; a retry goes to
+  a different endpoint when there is one;
+* separate timeouts per stage: ``connect_timeout`` for the TCP/TLS
+  handshake, ``read_timeout`` for each socket read (time to first byte and
+  between chunks), and ``total_timeout`` as a deadline covering queueing,
+  every attempt, backoff sleeps and the download;
+* the response body is streamed to a temporary file in chunks and renamed
+  into place, so large images are never held in memory and a failed
+  download never leaves a partial file behind.
+
+With several endpoints (a comma-separated WORD2IMG_RENDER_API_URL) the
+client also balances load across them:
+
+* each request goes to the healthy endpoint with the fewest outstanding
+  requests (ties broken by recent latency);
+* an endpoint is ejected after ``unhealthy_after`` consecutive failures or
+  a failed health probe (GET ``health_path`` on the same host every
+  ``health_interval`` seconds) and readmitted when a probe succeeds; when
+  every endpoint is ejected, all of them are tried again;
+* hedged requests: when an attempt has not finished after ``hedge_after``
+  seconds (by default the p95 of recent latencies), the same request is
+  also sent to another idle endpoint and the first response wins.  Hedges
+  are capped at ``hedge_budget`` of all requests so a slow farm is not
+  flooded with duplicates.
+
+``render_api_stub.py`` in the repository root is a local stand-in for the
+API (configurable latency and failure rate) for development and tests.
+
+Configuration:
+    WORD2IMG_RENDER_API_URL              endpoint(s), comma-separated (default http://localhost:3000/convert)
+    WORD2IMG_RENDER_API_CONNECT_TIMEOUT  seconds (default 3)
+    WORD2IMG_RENDER_API_READ_TIMEOUT     seconds (default 30)
+    WORD2IMG_RENDER_API_TOTAL_TIMEOUT    seconds (default 60)
+    WORD2IMG_RENDER_API_CONCURRENCY      in-flight requests per endpoint (default 16)
+    WORD2IMG_RENDER_API_POOL_SIZE        keep-alive connections per endpoint (default 16)
+    WORD2IMG_RENDER_API_RETRIES          retries after the first attempt (default 2)
+    WORD2IMG_RENDER_API_HEALTH_PATH      health probe path, empty disables probing (default /health)
+    WORD2IMG_RENDER_API_HEALTH_INTERVAL  seconds between probes (default 5)
+    WORD2IMG_RENDER_API_HEDGE_MS         hedge delay: "auto" (p95), "0" to disable, or milliseconds (default auto)
+"""
+
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlsplit, urlunsplit
+
+from .metrics import REGISTRY
+
+if TYPE_CHECKING:
+    import httpx
+    import requests
+
+RENDER_API_URL_ENV = "WORD2IMG_RENDER_API_URL"
+RENDER_API_CONNECT_TIMEOUT_ENV = "WORD2IMG_RENDER_API_CONNECT_TIMEOUT"
+RENDER_API_READ_TIMEOUT_ENV = "WORD2IMG_RENDER_API_READ_TIMEOUT"
+RENDER_API_TOTAL_TIMEOUT_ENV = "WORD2IMG_RENDER_API_TOTAL_TIMEOUT"
+RENDER_API_CONCURRENCY_ENV = "WORD2IMG_RENDER_API_CONCURRENCY"
+RENDER_API_POOL_SIZE_ENV = "WORD2IMG_RENDER_API_POOL_SIZE"
+RENDER_API_RETRIES_ENV = "WORD2IMG_RENDER_API_RETRIES"
+RENDER_API_HEALTH_PATH_ENV = "WORD2IMG_RENDER_API_HEALTH_PATH"
+RENDER_API_HEALTH_INTERVAL_ENV = "WORD2IMG_RENDER_API_HEALTH_INTERVAL"
+RENDER_API_HEDGE_MS_ENV = "WORD2IMG_RENDER_API_HEDGE_MS"
+
+DEFAULT_RENDER_API_URL = "http://localhost:3000/convert"
+RETRY_STATUSES = (429, 502, 503, 504)
+CHUNK_SIZE = 64 * 1024
+# 自适应对冲延迟所用的延迟样本窗口，样本不足时不对冲
+LATENCY_WINDOW = 256
+HEDGE_MIN_SAMPLES = 20
+
+REMOTE_REQUESTS_TOTAL = REGISTRY.counter(
+    "word2img_remote_requests_total", "Render API attempts by outcome (ok, retry, error).", ["outcome"])
+REMOTE_REQUEST_DURATION_SECONDS = REGISTRY.histogram(
+    "word2img_remote_request_duration_seconds",
+    "Wall time of one render API attempt, including the download.", ["endpoint"])
+REMOTE_REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "word2img_remote_requests_in_flight", "Render API requests currently in flight.", ["endpoint"])
+REMOTE_ENDPOINT_HEALTHY = REGISTRY.gauge(
+    "word2img_remote_endpoint_healthy", "1 while a render API endpoint is in rotation, 0 while ejected.",
+    ["endpoint"])
+REMOTE_HEDGES_TOTAL = REGISTRY.counter(
+    "word2img_remote_hedges_total", "Hedged render API attempts sent, and how many of them won.", ["outcome"])
+
+
+class RemoteRenderError(RuntimeError):
+    """The render API failed after all retries, or the deadline expired."""
+
+
+@dataclass(frozen=True)
+class RemoteRenderConfig:
+    urls: Tuple[str, ...] = (DEFAULT_RENDER_API_URL,)
+    connect_timeout: float = 3.0
+    read_timeout: float = 30.0
+    total_timeout: float = 60.0
+    max_concurrency: int = 16
+    pool_size: int = 16
+    retries: int = 2
+    backoff_base: float = 0.2
+    backoff_max: float = 5.0
+    health_path: str = "/health"
+    health_interval: float = 5.0
+    unhealthy_after: int = 2
+    # None: 自适应（近期延迟的 p95）；0: 不对冲
+    hedge_after: Optional[float] = None
+    hedge_budget: float = 0.1
+
+
+def parse_endpoints(urls: Union[str, Sequence[str], None]) -> Tuple[str, ...]:
+    """Normalise a comma-separated string or a list of URLs into a tuple."""
+    if urls is None:
+        return ()
+    if isinstance(urls, str):
+        urls = urls.split(",")
+    return tuple(dict.fromkeys(url.strip() for url in urls if url and url.strip()))
+
+
+def _hedge_after_from_env() -> Optional[float]:
+    value = os.environ.get(RENDER_API_HEDGE_MS_ENV, "auto").strip().lower()
+    if value in ("", "auto"):
+        return None
+    return max(0.0, float(value)) / 1000
+
+
+def remote_config_from_env(urls: Union[str, Sequence[str], None] = None) -> RemoteRenderConfig:
+    """Build the client configuration from WORD2IMG_RENDER_API_* (``urls`` overrides the endpoints)."""
+    return RemoteRenderConfig(
+        urls=parse_endpoints(urls) or parse_endpoints(os.environ.get(RENDER_API_URL_ENV))
+        or (DEFAULT_RENDER_API_URL,),
+        connect_timeout=float(os.environ.get(RENDER_API_CONNECT_TIMEOUT_ENV, "3")),
+        read_timeout=float(os.environ.get(RENDER_API_READ_TIMEOUT_ENV, "30")),
+        total_timeout=float(os.environ.get(RENDER_API_TOTAL_TIMEOUT_ENV, "60")),
+        max_concurrency=max(1, int(os.environ.get(RENDER_API_CONCURRENCY_ENV, "16"))),
+        pool_size=max(1, int(os.environ.get(RENDER_API_POOL_SIZE_ENV, "16"))),
+        retries=max(0, int(os.environ.get(RENDER_API_RETRIES_ENV, "2"))),
+        health_path=os.environ.get(RENDER_API_HEALTH_PATH_ENV, "/health"),
+        health_interval=max(0.1, float(os.environ.get(RENDER_API_HEALTH_INTERVAL_ENV, "5"))),
+        hedge_after=_hedge_after_from_env(),
+    )
+
+
+class Endpoint:
+    """One render API endpoint and its load, health and latency state (guarded by the pool lock)."""
+
+    def __init__(self, url: str, health_path: str) -> None:
+        self.url = url
+        parts = urlsplit(url)
+        self.health_url = urlunsplit(parts._replace(path=health_path, query="", fragment="")) \
+            if health_path else None
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.latencies: "deque[float]" = deque(maxlen=LATENCY_WINDOW)
+        self.ewma: Optional[float] = None
+        self.checked_at = 0.0
+
+    def status(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.failures,
+            "latency_ewma_ms": round(self.ewma * 1000, 2) if self.ewma is not None else None,
+            "latency_p95_ms": round(_percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        }
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class EndpointPool:
+    """Least-outstanding-requests balancing, passive/active health and hedge policy for a set of endpoints.
+
+    Shared by the sync and async clients of the same configuration, so both
+    see the same load and health.
+    """
+
+    def __init__(self, config: RemoteRenderConfig) -> None:
+        self.config = config
+        self.endpoints = [Endpoint(url, config.health_path) for url in config.urls]
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hedges = 0
+        for endpoint in self.endpoints:
+            REMOTE_ENDPOINT_HEALTHY.set(1, endpoint=endpoint.url)
+
+    @property
+    def probing(self) -> bool:
+        """Active health probes only make sense with somewhere else to send traffic."""
+        return len(self.endpoints) > 1 and bool(self.config.health_path)
+
+    def begin_request(self) -> None:
+        with self._lock:
+            self._requests += 1
+
+    def acquire(self, exclude: Sequence[Endpoint] = (), fallback: bool = True) -> Optional[Endpoint]:
+        """Reserve the least-loaded healthy endpoint not in ``exclude``.
+
+        With ``fallback`` an excluded (or, if none is healthy, any) endpoint
+        is returned rather than None.
+        """
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.healthy]
+            candidates = [e for e in healthy if e not in exclude]
+            if not candidates:
+                if not fallback:
+                    return None
+                # 全部被摘除时退回到所有端点，而不是直接失败
+                candidates = healthy or self.endpoints
+            endpoint = min(candidates, key=lambda e: (e.outstanding, e.ewma or 0.0, random.random()))
+            endpoint.outstanding += 1
+        REMOTE_REQUESTS_IN_FLIGHT.inc(endpoint=endpoint.url)
+        return endpoint
+
+    def abandon(self, endpoint: Endpoint) -> None:
+        """Return a reservation that never sent a request (no latency or health signal)."""
+        REMOTE_REQUESTS_IN_FLIGHT.dec(endpoint=endpoint.url)
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    def release(self, endpoint: Endpoint, duration: float, ok: Optional[bool]) -> None:
+        """Return a reservation; ``ok`` None means the outcome says nothing about the endpoint's health."""
+        REMOTE_REQUESTS_IN_FLIGHT.dec(endpoint=endpoint.url)
+        REMOTE_REQUEST_DURATION_SECONDS.observe(duration, endpoint=endpoint.url)
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.latencies.append(duration)
+                endpoint.ewma = duration if endpoint.ewma is None else 0.8 * endpoint.ewma + 0.2 * duration
+                endpoint.failures = 0
+            elif ok is False:
+                endpoint.failures += 1
+                if endpoint.failures < self.config.unhealthy_after or len(self.endpoints) == 1:
+                    return
+            else:
+                return
+        self._set_health(endpoint, bool(ok))
+
+    def _set_health(self, endpoint: Endpoint, healthy: bool) -> None:
+        with self._lock:
+            changed = endpoint.healthy != healthy
+            endpoint.healthy = healthy
+            if healthy:
+                endpoint.failures = 0
+        if changed:
+            REMOTE_ENDPOINT_HEALTHY.set(1 if healthy else 0, endpoint=endpoint.url)
+            print(f"{'✅' if healthy else '⚠️ '} 渲染 API 端点{'恢复' if healthy else '已摘除'}: {endpoint.url}",
+                  file=sys.stderr)
+
+    def due_for_probe(self) -> List[Endpoint]:
+        """Endpoints whose last probe is older than ``health_interval`` (marked as probed)."""
+        now = time.monotonic()
+        with self._lock:
+            due = [e for e in self.endpoints if now - e.checked_at >= self.config.health_interval]
+            for endpoint in due:
+                endpoint.checked_at = now
+        return due
+
+    def record_probe(self, endpoint: Endpoint, healthy: bool) -> None:
+        self._set_health(endpoint, healthy)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging an attempt, or None when hedging is off."""
+        if len(self.endpoints) < 2 or self.config.hedge_after == 0:
+            return None
+        if self.config.hedge_after is not None:
+            return self.config.hedge_after
+        with self._lock:
+            samples = sorted(d for e in self.endpoints for d in e.latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return _percentile(samples, 0.95)
+
+    def try_hedge(self, primary: Endpoint, reserve: Callable[[Endpoint], bool]) -> Optional[Endpoint]:
+        """Reserve a second endpoint for a hedge if the budget allows and one is idle.
+
+        ``reserve`` takes the client's concurrency slot for the chosen
+        endpoint without waiting; when it cannot, no hedge is sent.
+        """
+        with self._lock:
+            if self._hedges >= max(1.0, self.config.hedge_budget * self._requests):
+                return None
+        endpoint = self.acquire(exclude=(primary,), fallback=False)
+        if endpoint is None:
+            return None
+        if not reserve(endpoint):
+            self.abandon(endpoint)
+            return None
+        with self._lock:
+            self._hedges += 1
+        REMOTE_HEDGES_TOTAL.inc(outcome="sent")
+        return endpoint
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "endpoints": [endpoint.status() for endpoint in self.endpoints],
+                "requests": self._requests,
+                "hedges": self._hedges,
+            }
+
+
+class _Cancelled(Exception):
+    """Internal: another hedged attempt already won."""
+
+
+class _Retry(Exception):
+    """Internal: this attempt failed in a way worth retrying."""
+
+    def __init__(self, reason: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+class _Attempts:
+    """Deadline, attempt counting and backoff shared by the sync and async clients."""
+
+    def __init__(self, config: RemoteRenderConfig) -> None:
+        self.config = config
+        self.deadline = time.monotonic() + config.total_timeout
+        self.attempt = 0
+        self.last_error = ""
+
+    def remaining(self) -> float:
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise RemoteRenderError(f"渲染 API 超过总超时 {self.config.total_timeout}s: {self.last_error}")
+        return remaining
+
+    def give_up(self, message: str) -> RemoteRenderError:
+        REMOTE_REQUESTS_TOTAL.inc(outcome="error")
+        return RemoteRenderError(message)
+
+    def timeouts(self) -> Tuple[float, float]:
+        remaining = self.remaining()
+        return min(self.config.connect_timeout, remaining), min(self.config.read_timeout, remaining)
+
+    def backoff(self, error: _Retry) -> float:
+        """Delay before the next attempt; raises when retries or time are exhausted."""
+        self.last_error = str(error)
+        if self.attempt > self.config.retries:
+            raise self.give_up(f"渲染 API 重试 {self.config.retries} 次后仍失败: {error}")
+        delay = min(self.config.backoff_max, self.config.backoff_base * (2 ** (self.attempt - 1)))
+        delay = random.uniform(delay / 2, delay)
+        if error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        if delay >= self.deadline - time.monotonic():
+            raise self.give_up(f"渲染 API 在总超时 {self.config.total_timeout}s 内无法重试: {error}")
+        REMOTE_REQUESTS_TOTAL.inc(outcome="retry")
+        return delay
+
+
+def _tmp_path(output_file: str) -> str:
+    return f"{output_file}.{uuid.uuid4().hex}.part"
+
+
+def _discard(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _discard_result(future: Future) -> None:
+    # 对冲中落败（或已改名的胜者）的临时文件；胜者已 os.replace，这里删除是空操作
+    if not future.cancelled() and future.exception() is None:
+        _discard(future.result()[0])
+
+
+def _health_signal(status_code: int) -> Optional[bool]:
+    # 429 是对方主动限流，不说明端点不健康
+    return None if status_code == 429 else False
+
+
+class RemoteRenderClient:
+    """Blocking client (requests) with a pooled keep-alive session."""
+
+    def __init__(self, config: RemoteRenderConfig, pool: Optional[EndpointPool] = None) -> None:
+        self.config = config
+        self.pool = pool or get_endpoint_pool(config)
+        # 每个端点独立的并发槽位
+        self._slots = {endpoint.url: threading.BoundedSemaphore(config.max_concurrency)
+                       for endpoint in self.pool.endpoints}
+        self._session: Optional["requests.Session"] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._prober: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> "requests.Session":
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    # 重试由本客户端控制（退避、总超时），连接池本身不重试
+                    adapter = HTTPAdapter(pool_connections=len(self.config.urls), pool_maxsize=self.config.pool_size,
+                                          max_retries=0, pool_block=False)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # 每个在途请求（含对冲）都持有一个并发槽位，线程数与槽位数相同即可
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.config.max_concurrency * len(self.config.urls),
+                        thread_name_prefix="word2img-remote")
+        return self._executor
+
+    def render_to_file(self, payload: Dict[str, Any], output_file: str) -> Dict[str, Any]:
+        """POST ``payload`` and stream the image into ``output_file``; returns attempt statistics."""
+        import requests
+
+        self._start_prober()
+        self.pool.begin_request()
+        attempts = _Attempts(self.config)
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self.pool.acquire(exclude=tried)
+            if not self._slots[endpoint.url].acquire(timeout=attempts.remaining()):
+                self.pool.abandon(endpoint)
+                raise RemoteRenderError(f"等待渲染 API 并发槽位超时（上限 {self.config.max_concurrency}/端点）")
+            attempts.attempt += 1
+            tried.append(endpoint)
+            try:
+                winner, size = self._hedged(endpoint, payload, output_file, attempts, tried)
+                REMOTE_REQUESTS_TOTAL.inc(outcome="ok")
+                return {"attempts": attempts.attempt, "bytes": size, "endpoint": winner.url}
+            except _Retry as e:
+                delay = attempts.backoff(e)
+            except requests.RequestException as e:
+                delay = attempts.backoff(_Retry(f"{type(e).__name__}: {e}"))
+            except RemoteRenderError:
+                REMOTE_REQUESTS_TOTAL.inc(outcome="error")
+                raise
+            time.sleep(delay)
+
+    def _hedged(self, endpoint: Endpoint, payload: Dict[str, Any], output_file: str, attempts: _Attempts,
+                tried: List[Endpoint]) -> Tuple[Endpoint, int]:
+        """Run one attempt, hedging it on a second endpoint if it is slow; the first success wins."""
+        cancelled = threading.Event()
+        delay = self.pool.hedge_delay()
+        if delay is None:
+            tmp_path, size = self._attempt(endpoint, payload, output_file, attempts, cancelled)
+            os.replace(tmp_path, output_file)
+            return endpoint, size
+
+        futures = {self.executor.submit(self._attempt, endpoint, payload, output_file, attempts, cancelled): endpoint}
+        try:
+            done, _ = wait_futures(futures, timeout=min(delay, attempts.remaining()))
+            if not done:
+                hedge = self.pool.try_hedge(endpoint, lambda e: self._slots[e.url].acquire(blocking=False))
+                if hedge is not None:
+                    tried.append(hedge)
+                    futures[self.executor.submit(self._attempt, hedge, payload, output_file, attempts,
+                                                 cancelled)] = hedge
+            pending, error = set(futures), None
+            while pending:
+                done, pending = wait_futures(pending, timeout=attempts.remaining(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+                    tmp_path, size = future.result()
+                    os.replace(tmp_path, output_file)
+                    if futures[future] is not endpoint:
+                        REMOTE_HEDGES_TOTAL.inc(outcome="won")
+                    return futures[future], size
+            raise error
+        finally:
+            cancelled.set()
+            for future in futures:
+                future.add_done_callback(_discard_result)
+
+    def _attempt(self, endpoint: Endpoint, payload: Dict[str, Any], output_file: str, attempts: _Attempts,
+                 cancelled: threading.Event) -> Tuple[str, int]:
+        """One POST into a temporary file; releases the concurrency slot and the endpoint reservation."""
+        import requests
+
+        started = time.perf_counter()
+        ok: Optional[bool] = None
+        try:
+            with self.session.post(endpoint.url, json=payload, stream=True, timeout=attempts.timeouts()) as response:
+                if response.status_code in RETRY_STATUSES:
+                    # 读完响应体，连接才能放回连接池复用
+                    response.content
+                    ok = _health_signal(response.status_code)
+                    raise _Retry(f"HTTP {response.status_code} ({endpoint.url})",
+                                 _retry_after(response.headers.get("Retry-After")))
+                if response.status_code != 200:
+                    raise RemoteRenderError(f"API调用失败: {response.status_code} - {response.text[:500]}")
+                tmp_path = _tmp_path(output_file)
+                size = 0
+                try:
+                    with open(tmp_path, "wb") as f:
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            if cancelled.is_set():
+                                raise _Cancelled()
+                            f.write(chunk)
+                            size += len(chunk)
+                            attempts.remaining()
+                except BaseException:
+                    _discard(tmp_path)
+                    raise
+                ok = True
+                return tmp_path, size
+        except requests.RequestException:
+            ok = False if not cancelled.is_set() else None
+            raise
+        finally:
+            self.pool.release(endpoint, time.perf_counter() - started, ok)
+            self._slots[endpoint.url].release()
+
+    def _start_prober(self) -> None:
+        if self._prober is not None or not self.pool.probing:
+            return
+        with self._lock:
+            if self._prober is None:
+                self._prober = threading.Thread(target=self._probe_loop, name="word2img-remote-health", daemon=True)
+                self._prober.start()
+
+    def _probe_loop(self) -> None:
+        while True:
+            for endpoint in self.pool.due_for_probe():
+                self.pool.record_probe(endpoint, self._probe(endpoint))
+            if self._closed.wait(self.config.health_interval):
+                return
+
+    def _probe(self, endpoint: Endpoint) -> bool:
+        try:
+            timeout = self.config.connect_timeout
+            with self.session.get(endpoint.health_url, timeout=(timeout, timeout)) as response:
+                return response.status_code == 200
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+class AsyncRemoteRenderClient:
+    """Async client (httpx) with the same retry, timeout, balancing and hedging policy."""
+
+    def __init__(self, config: RemoteRenderConfig, pool: Optional[EndpointPool] = None) -> None:
+        self.config = config
+        self.pool = pool or get_endpoint_pool(config)
+        self._slots = {endpoint.url: asyncio.Semaphore(config.max_concurrency) for endpoint in self.pool.endpoints}
+        self._client: Optional["httpx.AsyncClient"] = None
+        self._prober: Optional[asyncio.Task] = None
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None or self._client.is_closed:
+            import httpx
+
+            endpoints = len(self.config.urls)
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.config.max_concurrency * endpoints,
+                                    max_keepalive_connections=self.config.pool_size * endpoints),
+            )
+        return self._client
+
+    async def render_to_file(self, payload: Dict[str, Any], output_file: str) -> Dict[str, Any]:
+        import httpx
+
+        self._start_prober()
+        self.pool.begin_request()
+        attempts = _Attempts(self.config)
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self.pool.acquire(exclude=tried)
+            try:
+                await asyncio.wait_for(self._slots[endpoint.url].acquire(), attempts.remaining())
+            except BaseException as e:
+                self.pool.abandon(endpoint)
+                if isinstance(e, TimeoutError):
+                    raise RemoteRenderError(
+                        f"等待渲染 API 并发槽位超时（上限 {self.config.max_concurrency}/端点）") from None
+                raise
+            attempts.attempt += 1
+            tried.append(endpoint)
+            try:
+                winner, size = await self._hedged(endpoint, payload, output_file, attempts, tried)
+                REMOTE_REQUESTS_TOTAL.inc(outcome="ok")
+                return {"attempts": attempts.attempt, "bytes": size, "endpoint": winner.url}
+            except _Retry as e:
+                delay = attempts.backoff(e)
+            except httpx.HTTPError as e:
+                delay = attempts.backoff(_Retry(f"{type(e).__name__}: {e}"))
+            except RemoteRenderError:
+                REMOTE_REQUESTS_TOTAL.inc(outcome="error")
+                raise
+            await asyncio.sleep(delay)
+
+    async def _hedged(self, endpoint: Endpoint, payload: Dict[str, Any], output_file: str, attempts: _Attempts,
+                      tried: List[Endpoint]) -> Tuple[Endpoint, int]:
+        delay = self.pool.hedge_delay()
+        if delay is None:
+            tmp_path, size = await self._attempt(endpoint, payload, output_file, attempts)
+            os.replace(tmp_path, output_file)
+            return endpoint, size
+
+        tasks = {asyncio.ensure_future(self._attempt(endpoint, payload, output_file, attempts)): endpoint}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=min(delay, attempts.remaining()))
+            if not done:
+                # 槽位空闲时 acquire 不会挂起，检查与占用之间没有其他协程插入
+                hedge = self.pool.try_hedge(endpoint, lambda e: not self._slots[e.url].locked())
+                if hedge is not None:
+                    await self._slots[hedge.url].acquire()
+                    tried.append(hedge)
+                    tasks[asyncio.ensure_future(self._attempt(hedge, payload, output_file, attempts))] = hedge
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=attempts.remaining(),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    tmp_path, size = task.result()
+                    os.replace(tmp_path, output_file)
+                    if tasks[task] is not endpoint:
+                        REMOTE_HEDGES_TOTAL.inc(outcome="won")
+                    return tasks[task], size
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(result, tuple):
+                    _discard(result[0])
+
+    async def _attempt(self, endpoint: Endpoint, payload: Dict[str, Any], output_file: str,
+                       attempts: _Attempts) -> Tuple[str, int]:
+        import httpx
+
+        started = time.perf_counter()
+        ok: Optional[bool] = None
+        try:
+            connect, read = attempts.timeouts()
+            timeout = httpx.Timeout(read, connect=connect, pool=attempts.remaining())
+            async with self.client.stream("POST", endpoint.url, json=payload, timeout=timeout) as response:
+                if response.status_code in RETRY_STATUSES:
+                    await response.aread()
+                    ok = _health_signal(response.status_code)
+                    raise _Retry(f"HTTP {response.status_code} ({endpoint.url})",
+                                 _retry_after(response.headers.get("Retry-After")))
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", "replace")
+                    raise RemoteRenderError(f"API调用失败: {response.status_code} - {body[:500]}")
+                tmp_path = _tmp_path(output_file)
+                size = 0
+                try:
+                    with open(tmp_path, "wb") as f:
+                        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                            f.write(chunk)
+                            size += len(chunk)
+                            attempts.remaining()
+                except BaseException:
+                    _discard(tmp_path)
+                    raise
+                ok = True
+                return tmp_path, size
+        except httpx.HTTPError:
+            ok = False
+            raise
+        finally:
+            self.pool.release(endpoint, time.perf_counter() - started, ok)
+            self._slots[endpoint.url].release()
+
+    def _start_prober(self) -> None:
+        if self.pool.probing and (self._prober is None or self._prober.done()):
+            self._prober = asyncio.ensure_future(self._probe_loop())
+
+    async def _probe_loop(self) -> None:
+        while True:
+            due = self.pool.due_for_probe()
+            for endpoint, healthy in zip(due, await asyncio.gather(*(self._probe(e) for e in due))):
+                self.pool.record_probe(endpoint, healthy)
+            await asyncio.sleep(self.config.health_interval)
+
+    async def _probe(self, endpoint: Endpoint) -> bool:
+        try:
+            response = await self.client.get(endpoint.health_url, timeout=self.config.connect_timeout)
+            return response.status_code == 200
+        except Exception:
+            return False
+
+    async def aclose(self) -> None:
+        if self._prober is not None:
+            self._prober.cancel()
+            self._prober = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_pools: Dict[RemoteRenderConfig, EndpointPool] = {}
+_clients: Dict[RemoteRenderConfig, RemoteRenderClient] = {}
+_clients_lock = threading.Lock()
+# 异步客户端的连接池和信号量属于某个事件循环，按循环分别缓存
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[RemoteRenderConfig, AsyncRemoteRenderClient]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def get_endpoint_pool(config: RemoteRenderConfig) -> EndpointPool:
+    """The process-wide endpoint state for ``config`` (shared by sync and async clients)."""
+    with _clients_lock:
+        pool = _pools.get(config)
+        if pool is None:
+            pool = _pools[config] = EndpointPool(config)
+        return pool
+
+
+def get_remote_client(urls: Union[str, Sequence[str], None] = None) -> RemoteRenderClient:
+    """The process-wide blocking client for ``urls`` (configured from the environment)."""
+    config = remote_config_from_env(urls)
+    pool = get_endpoint_pool(config)
+    with _clients_lock:
+        client = _clients.get(config)
+        if client is None:
+            client = _clients[config] = RemoteRenderClient(config, pool)
+        return client
+
+
+def get_async_remote_client(urls: Union[str, Sequence[str], None] = None) -> AsyncRemoteRenderClient:
+    """The async client for ``urls`` on the running event loop."""
+    config = remote_config_from_env(urls)
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(config)
+    if client is None:
+        client = clients[config] = AsyncRemoteRenderClient(config, get_endpoint_pool(config))
+    return client
+
+
+async def close_async_remote_clients() -> None:
+    """Close the async clients of the running event loop."""
+    for client in _async_clients.pop(asyncio.get_running_loop(), {}).values():
+        await client.aclose()
+
+
+def remote_status() -> List[Dict[str, Any]]:
+    """Load, health and latency of every render API endpoint set used so far."""
+    with _clients_lock:
+        pools = list(_pools.values())
+    return [pool.status() for pool in pools]
@@ -1,37 +1,59 @@
 from __future__ import annotations
-import asyncio
 import base64
+import importlib.util
 import json
 import os
 import re
+import shutil
+import sys
 import subprocess
 import tempfile
-from dataclasses import dataclass
+import uuid
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Optional, Tuple, Dict, Any, Union
 from datetime import datetime
-# 延迟导入 requests，避免在未安装时阻断其他后端
-try:
-    import requests  # type: ignore
-    REQUESTS_AVAILABLE = True
-except Exception:
-    REQUESTS_AVAILABLE = False
 
-# 尝试导入PIL作为备选方案
-try:
-    from PIL import Image, ImageDraw, ImageFont
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
+from .document import DOCUMENT_CACHE, ParsedDocument
+from .encoding import encode_image
+from .layout import (
+    LAYOUT_CACHE,
+    LAYOUT_SNAPSHOTS,
+    BlockLayout,
+    PlacedBlock,
+    RenderSnapshot,
+    dirty_bands,
+    segment_key,
+)
+from .remote import DEFAULT_RENDER_API_URL, RENDER_API_URL_ENV, get_remote_client, parse_endpoints
+from .supervisor import SUPERVISOR
+from .table_layout import draw_table, layout_table
+from .text_layout import break_runs, break_text, glyph_metrics, has_cjk
+from .themes import get_theme, pil_style, render_css
+from .metrics import (
+    RENDER_BACKEND_FAILURES_TOTAL,
+    RENDER_DURATION_SECONDS,
+    RENDER_FAILURES_TOTAL,
+    RENDER_FALLBACKS_TOTAL,
+    RENDERS_TOTAL,
+    track_lru_cache,
+)
+from .timing import StageTimer
 
-# 尝试导入imgkit和markdown
-try:
-    import imgkit
-    import markdown
-    from markdown.extensions import codehilite, fenced_code, tables
-    IMGKIT_AVAILABLE = True
-except ImportError:
-    IMGKIT_AVAILABLE = False
+# 可选依赖延迟导入：这里只探测是否安装（find_spec 不执行模块代码），
+# requests / Pillow / imgkit / markdown 在首次使用对应后端时才真正导入，
+# 以缩短 MCP 服务冷启动时间。
+def _module_available(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+REQUESTS_AVAILABLE = _module_available("requests")
+PIL_AVAILABLE = _module_available("PIL")
+IMGKIT_AVAILABLE = _module_available("imgkit") and _module_available("markdown_it")
 
 # 默认配置
 ASPECT_RATIO = (3, 4)
@@ -45,6 +67,11 @@ DEFAULT_ACCENT_COLOR = (70, 130, 180)  # 钢蓝色
 SIDE_MARGIN_RATIO = 0.08
 TOP_BOTTOM_MARGIN_RATIO = 0.08
 
+# PIL 后端：行内代码/代码块字号比例、分隔线粗细、引用竖线宽度
+CODE_FONT_SCALE = 0.9
+RULE_THICKNESS = 2
+QUOTE_BAR_WIDTH = 4
+
 # 渲染后端优先级
 BACKEND_PRIORITY = [
     "imgkit-wkhtmltopdf",
@@ -53,8 +80,16 @@ BACKEND_PRIORITY = [
     "pil"
 ]
 
+# backend_preference 参数对应的后端（排在默认顺序之前尝试）
+BACKEND_PREFERENCES = {
+    "imgkit": ("imgkit-wkhtmltopdf",),
+    "markdown-pdf": ("markdown-pdf-cli",),
+    "md-to-image": ("md-to-image-cli", "md-to-image-api"),
+    "pil": ("pil-fallback",),
+}
+
 # 支持的输出格式
-SUPPORTED_FORMATS = ["png", "jpg", "jpeg", "webp"]
+SUPPORTED_FORMATS = ["png", "jpg", "jpeg", "webp", "avif"]
 
 # 最大尺寸限制
 MAX_WIDTH = 4000
@@ -68,21 +103,32 @@ class RenderOptions:
     height: int = 1600
     align: str = "center"
     bold: bool = False
-    background_color: str = "#FFFFFF"
-    text_color: str = "#000000"
-    accent_color: str = "#4682B4"
-    font_family: str = "Microsoft YaHei, PingFang SC, Helvetica Neue, Arial, sans-serif"
-    font_size: int = 20
-    line_height: float = 1.6
-    header_scale: float = 1.5
+    # 样式字段为 None 时取所选主题的值（见 themes.py）
+    background_color: Optional[str] = None
+    text_color: Optional[str] = None
+    accent_color: Optional[str] = None
+    font_family: Optional[str] = None
+    font_size: Optional[int] = None
+    line_height: Optional[float] = None
+    header_scale: Optional[float] = None
     theme: str = "default"
-    shadow: bool = True
+    shadow: Optional[bool] = None
     watermark: bool = False
     watermark_text: str = "Generated by word2img-mcp"
     output_format: str = "png"
     quality: int = 95
     backend_preference: str = "auto"
     backend_used: Optional[str] = None
+    # 增量渲染：上一版本的任务ID；PIL 后端渲染完成后把快照放在 layout_snapshot 中
+    base_task_id: Optional[str] = None
+    layout_snapshot: Optional[RenderSnapshot] = field(default=None, repr=False)
+    # 本次渲染中失败或被跳过的后端及原因（timeout、memory_limit 等，见 supervisor.py），随任务元数据保存
+    backend_failures: List[Dict[str, Any]] = field(default_factory=list, repr=False)
+    
+    def __post_init__(self) -> None:
+        for name, value in get_theme(self.theme).option_defaults().items():
+            if getattr(self, name) is None:
+                setattr(self, name, value)
 
 def get_available_backends() -> List[str]:
     """Get list of available rendering backends."""
@@ -189,28 +235,92 @@ class MarkdownRenderer:
     """Markdown渲染器 - 支持多种后端"""
     
     def __init__(self):
+        self._timer: Optional[StageTimer] = None
         self.backends = ['imgkit-wkhtmltopdf', 'markdown-pdf-cli', 'md-to-image-cli', 'md-to-image-api', 'pil-fallback']
-        self.md_to_image_api_url = "http://localhost:3000/convert"  # 可配置的API地址
+        # md-to-image API 端点列表（WORD2IMG_RENDER_API_URL，逗号分隔；多个端点时负载均衡，见 remote.py）
+        self.md_to_image_api_urls = list(parse_endpoints(os.environ.get(RENDER_API_URL_ENV))) or [DEFAULT_RENDER_API_URL]
+    
+    def render(self, text: str, options: RenderOptions, timer: Optional[StageTimer] = None) -> str:
+        """渲染Markdown为图片，逐个尝试后端并记录每次尝试的耗时"""
+        timer = timer or StageTimer()
+        self._timer = timer
+        failed_attempts = 0
+        try:
+            for backend in self._backend_order(text, options):
+                skipped = SUPERVISOR.skip(backend)
+                if skipped is not None:
+                    # 刚被强制终止过的后端暂停一段时间，直接尝试下一个
+                    self._record_failure(options, backend, skipped, 0.0)
+                    continue
+                attempt = {}
+                try:
+                    with timer.stage(f"render.{backend}", backend=backend) as attempt:
+                        if backend == 'imgkit-wkhtmltopdf':
+                            path = self._render_with_imgkit(text, options)
+                        elif backend == 'markdown-pdf-cli':
+                            path = self._render_with_markdown_pdf(text, options)
+                        elif backend == 'md-to-image-cli':
+                            path = self._render_with_cli(text, options)
+                        elif backend == 'md-to-image-api':
+                            path = self._render_with_api(text, options)
+                        elif backend == 'pil-fallback':
+                            path = self._render_with_pil(text, options)
+                        else:
+                            continue
+                    options.backend_used = backend
+                    RENDERS_TOTAL.inc(backend=backend)
+                    RENDER_DURATION_SECONDS.observe(attempt["duration_ms"] / 1000, backend=backend)
+                    if failed_attempts:
+                        RENDER_FALLBACKS_TOTAL.inc()
+                    return path
+                except Exception as e:
+                    failed_attempts += 1
+                    RENDER_BACKEND_FAILURES_TOTAL.inc(backend=backend)
+                    self._record_failure(options, backend, e, attempt.get("duration_ms", 0.0))
+                    continue
+        finally:
+            self._timer = None
+        
+        RENDER_FAILURES_TOTAL.inc()
+        raise RuntimeError(f"所有渲染后端都失败了: {self._failure_summary(options)}")
     
-    def render(self, text: str, options: RenderOptions) -> str:
-        """渲染Markdown为图片"""
-        for backend in self.backends:
-            try:
-                if backend == 'imgkit-wkhtmltopdf':
-                    return self._render_with_imgkit(text, options)
-                elif backend == 'markdown-pdf-cli':
-                    return self._render_with_markdown_pdf(text, options)
-                elif backend == 'md-to-image-cli':
-                    return self._render_with_cli(text, options)
-                elif backend == 'md-to-image-api':
-                    return self._render_with_api(text, options)
-                elif backend == 'pil-fallback':
-                    return self._render_with_pil(text, options)
-            except Exception as e:
-                print(f"⚠️  {backend} 渲染失败: {e}")
-                continue
+    def _document(self, text: str) -> ParsedDocument:
+        """解析后的文档（按文本哈希缓存，所有后端共用一次解析，见 document.py）"""
+        with self._stage("render.parse"):
+            return DOCUMENT_CACHE.get(text)
+    
+    def _backend_order(self, text: str, options: RenderOptions) -> List[str]:
+        """按 backend_preference 调整后端尝试顺序：偏好的后端排在最前，其余按默认顺序作为回退
         
-        raise RuntimeError("所有渲染后端都失败了")
+        PIL 后端不显示图片和原始 HTML；偏好 pil 但文档含有这些内容时仍按默认顺序。
+        """
+        preferred = BACKEND_PREFERENCES.get(options.backend_preference, ())
+        if preferred == ('pil-fallback',) and not self._document(text).pil_faithful:
+            preferred = ()
+        first = [backend for backend in preferred if backend in self.backends]
+        return first + [backend for backend in self.backends if backend not in first]
+    
+    @staticmethod
+    def _failure_summary(options: RenderOptions) -> str:
+        return ", ".join(f"{f['backend']}={f['reason']}" for f in options.backend_failures)
+    
+    def _record_failure(self, options: RenderOptions, backend: str, error: Exception, duration_ms: float) -> None:
+        """记录失败（或被跳过）的后端尝试及原因"""
+        reason = getattr(error, "reason", None) or getattr(error.__cause__, "reason", None) or "error"
+        options.backend_failures.append({
+            "backend": backend,
+            "reason": reason,
+            "error": str(error)[:500],
+            "duration_ms": round(duration_ms, 3)
+        })
+        if reason != "suspended":
+            print(f"⚠️  {backend} 渲染失败: {error}", file=sys.stderr)
+    
+    def _stage(self, name: str):
+        """当前渲染的子阶段计时（未在 render 中调用时不记录）"""
+        if self._timer is None:
+            return nullcontext()
+        return self._timer.stage(name)
     
     def _render_with_imgkit(self, text: str, options: RenderOptions) -> str:
         """使用imgkit/wkhtmltopdf渲染"""
@@ -218,11 +328,41 @@ class MarkdownRenderer:
             raise RuntimeError("imgkit不可用")
         
         # 将Markdown转换为HTML
-        html_content = self._markdown_to_html(text, options)
+        with self._stage("render.imgkit.markdown_to_html"):
+            html_content = self._markdown_to_html(text, options)
+        
+        return self._render_html_with_imgkit(html_content, options)
+    
+    def _output_file(self, prefix: str, suffix: str) -> Path:
+        # 并发渲染相同文本时文件名不能冲突
+        output_dir = Path("outputs")
+        output_dir.mkdir(exist_ok=True)
+        return output_dir / f"{prefix}_{os.getpid()}_{uuid.uuid4().hex[:12]}.{suffix}"
+    
+    def _render_html_with_imgkit(self, html_content: str, options: RenderOptions) -> str:
+        """用 wkhtmltoimage 把完整 HTML 渲染为图片文件"""
+        if not IMGKIT_AVAILABLE:
+            raise RuntimeError("imgkit不可用")
         
-        # 配置 wkhtmltopdf 可执行文件路径
-        config = imgkit.config()
-        # 尝试常见的 wkhtmltopdf 安装路径
+        # 生成输出文件路径
+        output_file = self._output_file("imgkit", options.output_format)
+        
+        try:
+            # 直接调用 wkhtmltoimage（参数与 imgkit.from_string 一致），由进程监管施加超时和资源限制
+            with self._stage("render.imgkit.wkhtmltoimage"):
+                SUPERVISOR.run(self._wkhtmltoimage_command(output_file, options), "imgkit-wkhtmltopdf",
+                               input=html_content.encode("utf-8"))
+            
+            if output_file.exists():
+                return str(output_file)
+            else:
+                raise RuntimeError("图片文件未生成")
+                
+        except Exception as e:
+            raise RuntimeError(f"imgkit渲染失败: {e}") from e
+    
+    def _find_wkhtmltoimage(self) -> Optional[str]:
+        """在常见安装路径中查找 wkhtmltoimage"""
         possible_paths = [
             r"C:\Program Files\wkhtmltopdf\bin\wkhtmltoimage.exe",
             r"C:\Program Files (x86)\wkhtmltopdf\bin\wkhtmltoimage.exe",
@@ -230,61 +370,33 @@ class MarkdownRenderer:
             "/usr/bin/wkhtmltoimage",
             "wkhtmltoimage"  # 如果在 PATH 中
         ]
-        
-        wkhtmltoimage_path = None
         for path in possible_paths:
             if os.path.exists(path):
-                wkhtmltoimage_path = path
-                break
-        
-        if wkhtmltoimage_path:
-            config = imgkit.config(wkhtmltoimage=wkhtmltoimage_path)
-        
-        # 设置wkhtmltoimage选项 (注意：wkhtmltoimage 支持的参数与 wkhtmltopdf 不同)
-        wkhtmltoimage_options = {
+                return path
+        return None
+    
+    def _wkhtmltoimage_command(self, output_file: Path, options: RenderOptions) -> List[str]:
+        """wkhtmltoimage 命令行：HTML 从 stdin 读入"""
+        wkhtmltoimage_path = self._find_wkhtmltoimage() or shutil.which("wkhtmltoimage")
+        if wkhtmltoimage_path is None:
+            raise RuntimeError("未找到 wkhtmltoimage")
+        cmd = [wkhtmltoimage_path, "--quiet"]
+        for name, value in self._wkhtmltoimage_options(options).items():
+            cmd += [f"--{name}", str(value)]
+        return cmd + ["-", str(output_file)]
+    
+    def _wkhtmltoimage_options(self, options: RenderOptions) -> Dict[str, Any]:
+        """wkhtmltoimage 选项 (注意：wkhtmltoimage 支持的参数与 wkhtmltopdf 不同)"""
+        return {
             'width': options.width,
             'height': options.height,
-            'quality': 95,
+            'quality': options.quality,
             'format': options.output_format.upper() if options.output_format.lower() in ['png', 'jpg', 'jpeg'] else 'PNG',
         }
-        
-        # 生成输出文件路径
-        output_dir = Path("outputs")
-        output_dir.mkdir(exist_ok=True)
-        output_file = output_dir / f"imgkit_{os.getpid()}_{hash(text[:100]) % 10000}.{options.output_format}"
-        
-        try:
-            # 使用imgkit渲染为图片
-            imgkit.from_string(
-                html_content,
-                str(output_file),
-                options=wkhtmltoimage_options,
-                config=config
-            )
-            
-            if output_file.exists():
-                return str(output_file)
-            else:
-                raise RuntimeError("图片文件未生成")
-                
-        except Exception as e:
-            raise RuntimeError(f"imgkit渲染失败: {e}")
     
     def _markdown_to_html(self, text: str, options: RenderOptions) -> str:
-        """将Markdown转换为带样式的HTML"""
-        # 配置markdown扩展
-        extensions = [
-            'markdown.extensions.tables',
-            'markdown.extensions.fenced_code',
-            'markdown.extensions.codehilite',
-            'markdown.extensions.nl2br',
-            'markdown.extensions.toc',
-            'markdown.extensions.attr_list',
-        ]
-        
-        # 转换markdown为HTML
-        md = markdown.Markdown(extensions=extensions)
-        html_body = md.convert(text)
+        """将Markdown转换为带样式的HTML（正文来自缓存的解析结果）"""
+        html_body = self._document(text).html
         
         # 生成完整的HTML文档
         html_template = f"""
@@ -310,156 +422,12 @@ class MarkdownRenderer:
         return html_template.strip()
     
     def _generate_css(self, options: RenderOptions) -> str:
-        """生成CSS样式"""
-        bg_color = options.background_color
-        text_color = options.text_color
-        accent_color = options.accent_color
-        
-        text_align = options.align
-        if text_align == "center":
-            text_align = "center"
-        elif text_align == "right":
-            text_align = "right"
-        else:
-            text_align = "left"
-        
-        css = f"""
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            font-family: {options.font_family};
-            font-size: {options.font_size}px;
-            line-height: {options.line_height};
-            color: {text_color};
-            background-color: {bg_color};
-            width: {options.width}px;
-            min-height: {options.height}px;
-            margin: 0;
-            padding: 0;
-        }}
-        
-        .container {{
-            padding: {int(options.height * TOP_BOTTOM_MARGIN_RATIO)}px {int(options.width * SIDE_MARGIN_RATIO)}px;
-            text-align: {text_align};
-            height: 100%;
-            width: 100%;
-            box-sizing: border-box;
-        }}
-        
-        h1, h2, h3, h4, h5, h6 {{
-            color: {accent_color};
-            margin: 0.5em 0;
-            font-weight: bold;
-        }}
-        
-        h1 {{ font-size: {int(options.font_size * options.header_scale * 2)}px; }}
-        h2 {{ font-size: {int(options.font_size * options.header_scale * 1.7)}px; }}
-        h3 {{ font-size: {int(options.font_size * options.header_scale * 1.4)}px; }}
-        h4 {{ font-size: {int(options.font_size * options.header_scale * 1.2)}px; }}
-        h5 {{ font-size: {int(options.font_size * options.header_scale * 1.1)}px; }}
-        h6 {{ font-size: {int(options.font_size * options.header_scale)}px; }}
-        
-        p {{
-            margin: 0.6em 0;
-            text-align: {text_align};
-        }}
-        
-        strong, b {{
-            font-weight: bold;
-            color: {accent_color};
-        }}
-        
-        em, i {{
-            font-style: italic;
-        }}
-        
-        ul, ol {{
-            margin: 0.5em 0;
-            padding-left: 2em;
-        }}
-        
-        li {{
-            margin: 0.3em 0;
-        }}
-        
-        blockquote {{
-            border-left: 4px solid {accent_color};
-            margin: 1em 0;
-            padding: 0.5em 1em;
-            background: rgba({options.accent_color[0]}, {options.accent_color[1]}, {options.accent_color[2]}, 0.1);
-            font-style: italic;
-        }}
-        
-        code {{
-            background-color: rgba(0, 0, 0, 0.1);
-            padding: 2px 4px;
-            border-radius: 3px;
-            font-family: 'Consolas', 'Monaco', 'Courier New', monospace;
-            font-size: {int(options.font_size * 0.9)}px;
-        }}
-        
-        pre {{
-            background-color: rgba(0, 0, 0, 0.1);
-            padding: 1em;
-            border-radius: 5px;
-            overflow-x: auto;
-            margin: 1em 0;
-        }}
-        
-        pre code {{
-            background: none;
-            padding: 0;
-        }}
-        
-        table {{
-            border-collapse: collapse;
-            width: 100%;
-            margin: 1em 0;
-        }}
-        
-        th, td {{
-            border: 1px solid {accent_color};
-            padding: 0.5em 1em;
-            text-align: left;
-        }}
-        
-        th {{
-            background-color: {accent_color};
-            color: {bg_color};
-            font-weight: bold;
-        }}
-        
-        hr {{
-            border: none;
-            height: 2px;
-            background-color: {accent_color};
-            margin: 1.5em 0;
-        }}
-        
-        a {{
-            color: {accent_color};
-            text-decoration: underline;
-        }}
-        
-        img {{
-            max-width: 100%;
-            height: auto;
-            margin: 1em 0;
-        }}
-        """
-        
-        if options.shadow:
-            css += f"""
-        h1, h2, h3, h4, h5, h6 {{
-            text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.3);
-        }}
-            """
-        
-        return css
+        """生成CSS样式：主题预编译的 CSS + 本次渲染的页面尺寸"""
+        return render_css(
+            options,
+            top_margin=int(options.height * TOP_BOTTOM_MARGIN_RATIO),
+            side_margin=int(options.width * SIDE_MARGIN_RATIO)
+        )
     
     def _generate_watermark(self, options: RenderOptions) -> str:
         """生成水印HTML"""
@@ -487,76 +455,14 @@ class MarkdownRenderer:
             md_file = f.name
         
         try:
-            # 生成输出文件路径
-            output_dir = Path("outputs")
-            output_dir.mkdir(exist_ok=True)
-            
             # 先生成PDF
-            pdf_file = output_dir / f"md_pdf_{os.getpid()}_{hash(text[:100]) % 10000}.pdf"
-            
-            # 构建命令
-            cmd = [
-                'npx', 'markdown-pdf',
-                md_file,
-                '--out', str(pdf_file),
-                '--paper-format', 'A4',
-                '--paper-orientation', 'portrait'
-            ]
-            
-            # 执行命令
-            result = subprocess.run(
-                cmd, 
-                capture_output=True, 
-                text=True, 
-                check=True,
-                timeout=60  # 60秒超时
-            )
+            pdf_file = self._output_file("md_pdf", "pdf")
             
-            if not pdf_file.exists():
-                raise RuntimeError("PDF文件未生成")
-            
-            # 如果输出格式是PDF，直接返回
-            if options.output_format.lower() == 'pdf':
-                return str(pdf_file)
-            
-            # 否则需要将PDF转换为图片
-            # 这里可以使用PIL来转换PDF到图片
-            if PIL_AVAILABLE:
-                try:
-                    from pdf2image import convert_from_path  # type: ignore
-                    images = convert_from_path(str(pdf_file))
-                    if images:
-                        # 取第一页
-                        img = images[0]
-                        # 调整尺寸
-                        img = img.resize((options.width, options.height), Image.Resampling.LANCZOS)
-                        
-                        # 保存为指定格式
-                        output_file = output_dir / f"md_pdf_{os.getpid()}_{hash(text[:100]) % 10000}.{options.output_format}"
-                        if options.output_format.lower() == 'png':
-                            img.save(output_file, format="PNG", optimize=True)
-                        else:
-                            img.save(output_file, format="JPEG", quality=95, optimize=True)
-                        
-                        # 清理PDF文件
-                        try:
-                            os.unlink(pdf_file)
-                        except:
-                            pass
-                        
-                        return str(output_file)
-                except ImportError:
-                    print("⚠️  pdf2image不可用，无法转换PDF到图片")
-                    # 如果没有pdf2image，返回PDF文件路径
-                    return str(pdf_file)
+            # 执行命令（超时、资源限制和进程组清理见 supervisor.py）
+            SUPERVISOR.run(self._markdown_pdf_command(md_file, pdf_file), "markdown-pdf-cli")
             
-            # 如果PIL不可用，返回PDF文件路径
-            return str(pdf_file)
-                
-        except subprocess.TimeoutExpired:
-            raise RuntimeError("渲染超时")
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"CLI执行失败: {e.stderr}")
+            output_file = self._output_file("md_pdf", options.output_format)
+            return self._pdf_to_image(pdf_file, output_file, options)
         finally:
             # 清理临时文件
             try:
@@ -564,6 +470,55 @@ class MarkdownRenderer:
             except:
                 pass
     
+    def _markdown_pdf_command(self, md_file: str, pdf_file: Path) -> List[str]:
+        return [
+            'npx', 'markdown-pdf',
+            md_file,
+            '--out', str(pdf_file),
+            '--paper-format', 'A4',
+            '--paper-orientation', 'portrait'
+        ]
+    
+    def _pdf_to_image(self, pdf_file: Path, output_file: Path, options: RenderOptions) -> str:
+        """把 markdown-pdf 生成的 PDF 首页转换为图片；无法转换时返回 PDF 路径"""
+        if not pdf_file.exists():
+            raise RuntimeError("PDF文件未生成")
+        
+        # 如果输出格式是PDF，直接返回
+        if options.output_format.lower() == 'pdf':
+            return str(pdf_file)
+        
+        # 否则需要将PDF转换为图片
+        # 这里可以使用PIL来转换PDF到图片
+        if PIL_AVAILABLE:
+            try:
+                from pdf2image import convert_from_path  # type: ignore
+                from PIL import Image
+                images = convert_from_path(str(pdf_file))
+                if images:
+                    # 取第一页
+                    img = images[0]
+                    # 调整尺寸
+                    img = img.resize((options.width, options.height), Image.Resampling.LANCZOS)
+                    
+                    # 保存为指定格式；中间文件随后由 ImageStore 重新编码，这里用最快的编码参数
+                    encode_image(img, output_file, options.output_format, options.quality, "fast")
+                    
+                    # 清理PDF文件
+                    try:
+                        os.unlink(pdf_file)
+                    except:
+                        pass
+                    
+                    return str(output_file)
+            except ImportError:
+                print("⚠️  pdf2image不可用，无法转换PDF到图片", file=sys.stderr)
+                # 如果没有pdf2image，返回PDF文件路径
+                return str(pdf_file)
+        
+        # 如果PIL不可用，返回PDF文件路径
+        return str(pdf_file)
+    
     def _render_with_cli(self, text: str, options: RenderOptions) -> str:
         """使用md-to-image CLI渲染"""
         # 创建临时Markdown文件
@@ -573,41 +528,15 @@ class MarkdownRenderer:
         
         try:
             # 生成输出文件路径
-            output_dir = Path("outputs")
-            output_dir.mkdir(exist_ok=True)
-            output_file = output_dir / f"md_cli_{os.getpid()}_{hash(text[:100]) % 10000}.{options.output_format}"
-            
-            # 构建命令
-            cmd = [
-                'md-to-image',
-                md_file,
-                '--output', str(output_file),
-                '--width', str(options.width),
-                '--height', str(options.height)
-            ]
+            output_file = self._output_file("md_cli", options.output_format)
             
-            # 添加主题选项
-            if options.theme != "default":
-                cmd.extend(['--theme', options.theme])
-            
-            # 执行命令
-            result = subprocess.run(
-                cmd, 
-                capture_output=True, 
-                text=True, 
-                check=True,
-                timeout=60  # 60秒超时
-            )
+            # 执行命令（超时、资源限制和进程组清理见 supervisor.py）
+            SUPERVISOR.run(self._cli_command(md_file, output_file, options), "md-to-image-cli")
             
             if output_file.exists():
                 return str(output_file)
             else:
                 raise RuntimeError("输出文件未生成")
-                
-        except subprocess.TimeoutExpired:
-            raise RuntimeError("渲染超时")
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"CLI执行失败: {e.stderr}")
         finally:
             # 清理临时文件
             try:
@@ -615,325 +544,386 @@ class MarkdownRenderer:
             except:
                 pass
     
+    def _cli_command(self, md_file: str, output_file: Path, options: RenderOptions) -> List[str]:
+        cmd = [
+            'md-to-image',
+            md_file,
+            '--output', str(output_file),
+            '--width', str(options.width),
+            '--height', str(options.height)
+        ]
+        
+        # 添加主题选项
+        if options.theme != "default":
+            cmd.extend(['--theme', options.theme])
+        return cmd
+    
     def _render_with_api(self, text: str, options: RenderOptions) -> str:
         """使用HTTP API渲染"""
         if not REQUESTS_AVAILABLE:
             raise RuntimeError("requests 不可用，无法使用 md-to-image API 后端")
+        output_file = self._output_file("md_api", options.output_format)
         try:
-            # 准备请求数据
-            payload = {
-                'markdown': text,
-                'format': options.output_format,
-                'width': options.width,
-                'height': options.height,
-                'theme': options.theme,
-                'background': options.background,
-                'text_color': options.text_color,
-                'accent_color': options.accent_color
-            }
-            
-            # 发送请求
-            response = requests.post(
-                self.md_to_image_api_url,
-                json=payload,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                # 保存返回的图片
-                output_dir = Path("outputs")
-                output_dir.mkdir(exist_ok=True)
-                output_file = output_dir / f"md_api_{os.getpid()}_{hash(text[:100]) % 10000}.{options.output_format}"
-                
-                with open(output_file, 'wb') as f:
-                    f.write(response.content)
-                
-                return str(output_file)
-            else:
-                raise RuntimeError(f"API调用失败: {response.status_code} - {response.text}")
-                
+            # 共享的长连接会话：并发上限、重试退避、分阶段超时，响应流式写入文件
+            with self._stage("render.api.request"):
+                get_remote_client(self.md_to_image_api_urls).render_to_file(
+                    self._api_payload(text, options), str(output_file))
+            return str(output_file)
         except Exception as e:
             raise RuntimeError(f"API请求失败: {e}")
     
+    def _api_payload(self, text: str, options: RenderOptions) -> Dict[str, Any]:
+        """md-to-image API 请求体"""
+        return {
+            'markdown': text,
+            'format': options.output_format,
+            'width': options.width,
+            'height': options.height,
+            'theme': options.theme,
+            'background': options.background_color,
+            'text_color': options.text_color,
+            'accent_color': options.accent_color
+        }
+    
     def _render_with_pil(self, text: str, options: RenderOptions) -> str:
-        """使用PIL作为备选方案"""
+        """使用PIL作为备选方案
+        
+        块布局按内容缓存；指定 base_task_id 且其快照仍在内存中时，只重绘发生变化的水平条带。
+        """
         if not PIL_AVAILABLE:
             raise RuntimeError("PIL不可用")
         
-        # 解析Markdown
-        segments = self._parse_markdown(text)
+        # 解析Markdown（与其他后端共用缓存的解析结果）
+        with self._stage("render.pil.parse"):
+            segments = self._parse_markdown(text)
+        
+        with self._stage("render.pil.layout"):
+            blocks = self._layout_pil_segments(segments, options, self._pil_top_offset(options))
+        
+        canvas_key = self._pil_canvas_key(options)
+        base = LAYOUT_SNAPSHOTS.get(options.base_task_id) if options.base_task_id else None
+        stats: Dict[str, Any] = {"base_task_id": options.base_task_id, "blocks": len(blocks), "incremental": False}
+        if base is not None and base.canvas_key == canvas_key:
+            with self._stage("render.pil.draw_incremental"):
+                img = base.image.copy()
+                bands = dirty_bands(base.blocks, blocks, options.height)
+                for top, bottom in bands:
+                    # 条带在独立画布上完整重绘后整体贴回，避免在旧像素上叠加抗锯齿
+                    band, band_draw = self._new_pil_canvas(options, bottom - top)
+                    affected = [block for block in blocks if block.extent[1] > top and block.extent[0] < bottom]
+                    self._draw_pil_blocks(band_draw, affected, origin_y=top)
+                    self._draw_pil_watermark(band_draw, options, origin_y=top)
+                    img.paste(band, (0, top))
+            stats.update(incremental=True, dirty_bands=len(bands),
+                         redrawn_rows=sum(bottom - top for top, bottom in bands))
+        else:
+            if options.base_task_id:
+                stats["reason"] = "snapshot_missing" if base is None else "canvas_changed"
+            with self._stage("render.pil.draw"):
+                img, draw = self._new_pil_canvas(options)
+                self._draw_pil_blocks(draw, blocks)
+                self._draw_pil_watermark(draw, options)
+        options.layout_snapshot = RenderSnapshot(canvas_key, img, blocks, stats)
+        
+        # 保存图片
+        output_file = self._output_file("pil", options.output_format)
+        
+        # 中间文件随后由 ImageStore 重新编码，这里用最快的编码参数
+        with self._stage("render.pil.encode"):
+            encode_image(img, output_file, options.output_format, options.quality, "fast")
         
-        # 创建图片
-        img = Image.new("RGB", (options.width, options.height), options.background)
-        draw = ImageDraw.Draw(img)
+        return str(output_file)
+    
+    def _new_pil_canvas(self, options: RenderOptions, height: Optional[int] = None):
+        """按主题背景色创建画布（height 用于局部重绘的条带）"""
+        from PIL import Image, ImageDraw
+        img = Image.new("RGB", (options.width, options.height if height is None else height),
+                        pil_style(options).background)
+        return img, ImageDraw.Draw(img)
+    
+    def _pil_top_offset(self, options: RenderOptions) -> int:
+        return int(options.height * TOP_BOTTOM_MARGIN_RATIO)
+    
+    def _pil_canvas_key(self, options: RenderOptions) -> Tuple:
+        """决定快照能否复用的画布参数：尺寸、样式、对齐和水印"""
+        return (options.width, options.height, pil_style(options), options.align,
+                options.watermark, options.watermark_text)
+    
+    def _draw_pil_segments(self, draw, segments: List[Dict], options: RenderOptions, y_offset: int,
+                           layout_cache=None) -> int:
+        """从 y_offset 开始依次绘制段落，返回绘制后的 y 坐标
         
+        layout_cache 为块布局缓存（映射），默认使用进程级 LAYOUT_CACHE；模板传入自己的缓存。
+        """
+        blocks = self._layout_pil_segments(segments, options, y_offset, layout_cache)
+        self._draw_pil_blocks(draw, blocks)
+        return blocks[-1].y + blocks[-1].layout.height if blocks else y_offset
+    
+    def _layout_pil_segments(self, segments: List[Dict], options: RenderOptions, y_offset: int,
+                             layout_cache=None) -> List[PlacedBlock]:
+        """为每个段落取得（或计算并缓存）布局，并从 y_offset 起依次排列"""
+        cache = LAYOUT_CACHE if layout_cache is None else layout_cache
+        # 主题预编译的颜色/字号/间距表
+        style = pil_style(options)
+        placed = []
+        for segment in segments:
+            key = (segment_key(segment), style, options.width, options.align)
+            layout = cache.get(key)
+            if layout is None:
+                layout = self._layout_block(segment, options, style)
+                cache[key] = layout
+            placed.append(PlacedBlock(key, y_offset, layout))
+            y_offset += layout.height
+        return placed
+    
+    def _layout_block(self, segment: Dict, options: RenderOptions, style) -> BlockLayout:
+        """计算单个段落的字体、换行、位置与高度（含段落间距）"""
         # 计算基础字体大小
-        base_font_size = max(16, min(80, options.font_size))
+        base_font_size = max(16, min(80, style.body_size))
         
-        y_offset = int(options.height * TOP_BOTTOM_MARGIN_RATIO)
         x_left = int(options.width * SIDE_MARGIN_RATIO)
         max_width = int(options.width * (1 - 2 * SIDE_MARGIN_RATIO))
-        
-        for segment in segments:
-            # 处理表格
-            if segment.get('is_table'):
-                font_size = base_font_size - 4
-                font = self._load_font(font_size, False)
-                table_height = self._render_table(draw, segment['table_data'], font, 
-                                               x_left, y_offset, max_width, options.text_color)
-                y_offset += table_height + int(base_font_size * 0.6)
-                continue
-            
-            # 根据段落类型确定字体大小和样式
-            if segment.get('is_header'):
-                font_size = min(base_font_size + (4 - segment['header_level']) * 8, 80)
-                is_bold = True
-            elif segment.get('is_bold'):
-                font_size = base_font_size
-                is_bold = True
-            else:
-                font_size = base_font_size
-                is_bold = False
-            
-            # 加载字体
-            font = self._load_font(font_size, is_bold)
-            
-            # 文字换行处理
-            wrapped_lines = self._wrap_text(draw, segment['text'], font, max_width)
-            
-            # 绘制文本
-            line_height = font.getbbox("Hg")[3] - font.getbbox("Hg")[1]
-            line_spacing = int(font_size * 0.3)
-            
-            if options.align == "center":
-                # 计算整个文本块的宽度，以此居中整个段落
-                max_line_width = max(self._measure_text(draw, line, font)[0] for line in wrapped_lines) if wrapped_lines else 0
-                block_x = (options.width - max_line_width) // 2
-                
-                for line in wrapped_lines:
-                    draw.text((block_x, y_offset), line, fill=options.text_color, font=font)
-                    y_offset += line_height + line_spacing
+        kind = segment['kind']
+        
+        # 处理表格：列宽按内容分配，单元格内自动换行
+        if kind == 'table':
+            font_size = base_font_size - 4
+            table = layout_table(segment['table_data'], self._load_font(font_size, False),
+                                 self._load_font(font_size, True), max_width)
+            return BlockLayout(
+                kind="table", lines=(), font_size=font_size, bold=False, color=style.text, x=x_left,
+                line_advance=table.line_advance if table else 0,
+                height=(table.height if table else 0) + style.paragraph_spacing,
+                table=table, header_color=style.table_header)
+        
+        # 分隔线
+        if kind == 'rule':
+            top = style.paragraph_spacing
+            return BlockLayout(
+                kind="rule", lines=(), font_size=base_font_size, bold=False, color=style.accent, x=x_left,
+                line_advance=0, height=top * 2 + RULE_THICKNESS,
+                rects=((x_left, top, x_left + max_width, top + RULE_THICKNESS - 1, style.accent),))
+        
+        # 列表和引用向右缩进，引用左侧画竖线
+        quote = segment.get('quote', 0)
+        quote_step = int(base_font_size * 1.2)
+        text_x = x_left + segment.get('indent', 0) * int(base_font_size * 1.5) + quote * quote_step
+        text_width = max(base_font_size, max_width - (text_x - x_left))
+        
+        if kind == 'code':
+            font_size = int(base_font_size * CODE_FONT_SCALE)
+            # 等宽字体大多不含中文，含中文的代码块用正文字体
+            mono = not has_cjk(segment['text'])
+            font_key = (font_size, False, False, mono)
+            metrics = glyph_metrics(self._load_font(*font_key))
+            padding = base_font_size // 2
+            lines = break_text(segment['text'], metrics, text_width - 2 * padding)
+            line_advance = int(font_size * 1.4)
+            box_height = padding * 2 + line_advance * len(lines)
+            rects = [(text_x, 0, text_x + text_width, box_height, style.code_background)]
+            return BlockLayout(
+                kind="code", lines=tuple(((0, line, "", 0),) for line in lines), font_size=font_size, bold=False,
+                color=style.text, x=text_x + padding, line_advance=line_advance,
+                height=box_height + style.paragraph_spacing, text_top=padding,
+                run_styles=(("", font_key, style.text, 0),),
+                rects=tuple(self._quote_rects(quote, x_left, x_left + max_width, quote_step, box_height, style) + rects))
+        
+        # 标题与段落：按行内样式分段排版
+        shadow = None
+        if kind == 'heading':
+            font_size = min(style.heading_sizes[segment['level'] - 1], 80)
+            is_bold = True
+            color = style.heading
+            shadow = style.shadow
+        else:
+            font_size = base_font_size
+            is_bold = False
+            color = style.text
+        
+        runs = segment['runs']
+        marker = segment.get('marker')
+        # 斜体、等宽字体大多不含中文，含中文的段落只用粗细区分
+        plain_fonts = has_cjk(segment['text'])
+        font_keys: Dict[str, Tuple] = {}
+        
+        def metrics_for(flags: str):
+            key = font_keys.get(flags)
+            if key is None:
+                mono = 'c' in flags and not plain_fonts
+                key = font_keys[flags] = (int(font_size * CODE_FONT_SCALE) if 'c' in flags else font_size,
+                                          is_bold or 'b' in flags, 'i' in flags and not plain_fonts, mono)
+            return glyph_metrics(self._load_font(*key))
+        
+        base_metrics = metrics_for("")
+        lines = break_runs(runs, metrics_for, text_width)
+        if marker:
+            # 项目符号放在缩进区内，与首行对齐
+            marker_width = int(base_metrics.width(marker))
+            gap = int(base_metrics.width(" "))
+            lines[0].insert(0, (-marker_width - gap, marker, "", marker_width))
+        
+        if options.align == "center" and kind in ('heading', 'paragraph') and not quote and text_x == x_left:
+            # 计算整个文本块的宽度，以此居中整个段落
+            max_line_width = max((line[-1][0] + line[-1][3] for line in lines if line), default=0)
+            block_x = (options.width - max_line_width) // 2
+        else:
+            # 左对齐
+            block_x = text_x
+        
+        # 行距与 CSS 的 line-height 一致
+        line_advance = int(font_size * style.line_height)
+        spacing = style.paragraph_spacing if not marker else max(2, int(base_font_size * 0.3))
+        text_height = line_advance * len(lines)
+        
+        run_styles = []
+        for flags, key in font_keys.items():
+            metrics = glyph_metrics(self._load_font(*key))
+            if 'l' in flags:
+                run_color = style.accent
+            elif 'b' in flags and kind != 'heading':
+                run_color = style.strong
             else:
-                # 左对齐
-                for line in wrapped_lines:
-                    draw.text((x_left, y_offset), line, fill=options.text_color, font=font)
-                    y_offset += line_height + line_spacing
-            
-            # 段落间距
-            y_offset += int(font_size * 0.4)
-        
-        # 添加水印
+                run_color = color
+            # 不同字号的片段按基线对齐
+            run_styles.append((flags, key, run_color, base_metrics.ascent - metrics.ascent))
+        dy = {flags: offset for flags, _, _, offset in run_styles}
+        
+        rects = self._quote_rects(quote, x_left, x_left + max_width, quote_step, text_height, style)
+        for index, line in enumerate(lines):
+            top = index * line_advance
+            for px, text, flags, width in line:
+                if not flags:
+                    continue
+                x0 = block_x + px
+                if 'c' in flags:
+                    code_top = top + dy[flags]
+                    rects.append((x0 - 3, code_top, x0 + width + 3,
+                                  code_top + glyph_metrics(self._load_font(*font_keys[flags])).ascent + 4,
+                                  style.code_background))
+                if 'l' in flags:
+                    baseline = top + base_metrics.ascent
+                    rects.append((x0, baseline + 2, x0 + width, baseline + 2, style.accent))
+                if 's' in flags:
+                    middle = top + base_metrics.ascent * 2 // 3
+                    rects.append((x0, middle, x0 + width, middle + 1, color))
+        
+        return BlockLayout(
+            kind="text", lines=tuple(tuple(line) for line in lines), font_size=font_size, bold=is_bold,
+            color=color, x=block_x, line_advance=line_advance, height=text_height + spacing, shadow=shadow,
+            run_styles=tuple(run_styles), rects=tuple(rects))
+    
+    @staticmethod
+    def _quote_rects(depth: int, x_left: int, x_right: int, step: int, height: int, style) -> List[Tuple]:
+        """引用块的浅色底和左侧竖线（每层一条）"""
+        if not depth:
+            return []
+        rects = [(x_left, 0, x_right, height, style.quote_background)]
+        for level in range(depth):
+            bar_x = x_left + level * step
+            rects.append((bar_x, 0, bar_x + QUOTE_BAR_WIDTH - 1, height, style.accent))
+        return rects
+    
+    def _draw_pil_blocks(self, draw, blocks: List[PlacedBlock], origin_y: int = 0) -> None:
+        """按布局绘制块；origin_y 为画布顶部对应的页面 y 坐标"""
+        for block in blocks:
+            layout = block.layout
+            y = block.y - origin_y
+            if layout.kind == "table":
+                if layout.table is not None:
+                    draw_table(draw, layout.table, layout.x, y, self._load_font(layout.font_size, False),
+                               self._load_font(layout.font_size, True), layout.color, layout.header_color)
+                continue
+            # 先画底色、竖线、下划线等矩形，再画文字
+            for x0, y0, x1, y1, fill in layout.rects:
+                draw.rectangle((x0, y + y0, x1, y + y1), fill=fill)
+            styles = {flags: (self._load_font(*font_key), color, dy)
+                      for flags, font_key, color, dy in layout.run_styles}
+            y += layout.text_top
+            for line in layout.lines:
+                for px, text, flags, _ in line:
+                    font, color, dy = styles[flags]
+                    if layout.shadow:
+                        draw.text((layout.x + px + 2, y + dy + 2), text, fill=layout.shadow, font=font)
+                    draw.text((layout.x + px, y + dy), text, fill=color, font=font)
+                y += layout.line_advance
+    
+    def _draw_pil_watermark(self, draw, options: RenderOptions, origin_y: int = 0) -> None:
+        """添加水印"""
         if options.watermark:
             watermark_font = self._load_font(12, False)
-            draw.text((options.width - 150, options.height - 40), 
+            draw.text((options.width - 150, options.height - 40 - origin_y), 
                      options.watermark_text, fill=(128, 128, 128), font=watermark_font)
-        
-        # 保存图片
-        output_dir = Path("outputs")
-        output_dir.mkdir(exist_ok=True)
-        output_file = output_dir / f"pil_{os.getpid()}_{hash(text[:100]) % 10000}.{options.output_format}"
-        
-        if options.output_format.lower() == 'png':
-            img.save(output_file, format="PNG", optimize=True)
-        else:
-            img.save(output_file, format="JPEG", quality=95, optimize=True)
-        
-        return str(output_file)
     
-    def _load_font(self, size: int, bold: bool = False):
-        """加载字体"""
-        font_candidates = [
-            "C:\\Windows\\Fonts\\msyh.ttc",  # 微软雅黑
-            "C:\\Windows\\Fonts\\msyhbd.ttc",  # 微软雅黑粗体
-            "C:\\Windows\\Fonts\\simhei.ttf",  # 黑体
-            "C:\\Windows\\Fonts\\simsun.ttc",  # 宋体
-            "C:\\Windows\\Fonts\\simkai.ttf",  # 楷体
-            "C:\\Windows\\Fonts\\simfang.ttf",  # 仿宋
-            "/System/Library/Fonts/PingFang.ttc",
-            "/System/Library/Fonts/STHeiti Light.ttc",
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
-        ]
-        
-        if bold:
-            bold_candidates = [
-                "C:\\Windows\\Fonts\\msyhbd.ttc",
-                "C:\\Windows\\Fonts\\simhei.ttf",
-            ]
-            for path in bold_candidates:
-                if os.path.exists(path):
-                    try:
-                        return ImageFont.truetype(path, size)
-                    except Exception:
-                        continue
-        
-        for path in font_candidates:
-            if os.path.exists(path):
-                try:
-                    return ImageFont.truetype(path, size)
-                except Exception:
-                    continue
-        
-        try:
-            return ImageFont.load_default(size=size)
-        except:
-            return ImageFont.load_default()
+    def _load_font(self, size: int, bold: bool = False, italic: bool = False, mono: bool = False):
+        """加载字体（按字号和样式缓存，避免每个段落重复查找和打开字体文件）"""
+        return _load_font_cached(size, bold, italic, mono)
     
     def _parse_markdown(self, text: str) -> List[Dict]:
-        """解析Markdown文本"""
-        segments = []
-        lines = text.split('\n')
-        i = 0
-        
-        while i < len(lines):
-            line = lines[i].strip()
-            if not line:
-                i += 1
-                continue
-            
-            # 处理标题
-            if line.startswith('#'):
-                header_match = re.match(r'^(#{1,6})\s*(.*)', line)
-                if header_match:
-                    level = len(header_match.group(1))
-                    text_content = header_match.group(2)
-                    segments.append({
-                        'text': text_content,
-                        'is_header': True,
-                        'header_level': level
-                    })
-                    i += 1
-                    continue
-            
-            # 检测表格
-            if '|' in line:
-                table_data = []
-                while i < len(lines) and lines[i].strip():
-                    table_line = lines[i].strip()
-                    if '|' in table_line:
-                        cells = [cell.strip() for cell in table_line.split('|')]
-                        if cells and not cells[0]:
-                            cells = cells[1:]
-                        if cells and not cells[-1]:
-                            cells = cells[:-1]
-                        
-                        if not all('-' in cell or not cell.strip() for cell in cells):
-                            table_data.append(cells)
-                    else:
-                        break
-                    i += 1
-                
-                if table_data:
-                    segments.append({
-                        'text': "",
-                        'is_table': True,
-                        'table_data': table_data
-                    })
-                continue
-            
-            # 处理加粗文本
-            parts = re.split(r'(\*\*[^*]+\*\*)', line)
-            for part in parts:
-                if part.startswith('**') and part.endswith('**') and len(part) > 4:
-                    bold_text = part[2:-2]
-                    if bold_text.strip():
-                        segments.append({
-                            'text': bold_text,
-                            'is_bold': True
-                        })
-                elif part.strip():
-                    segments.append({
-                        'text': part
-                    })
-            
-            i += 1
-        
-        return segments
-    
-    def _wrap_text(self, draw, text: str, font, max_width: int) -> List[str]:
-        """文本换行"""
-        lines = []
-        current = ""
-        for ch in text.replace('\r', ''):
-            if ch == '\n':
-                lines.append(current)
-                current = ""
+        """解析Markdown文本为段落列表（markdown-it-py，见 document.py）"""
+        return list(self._document(text).segments)
+
+# 各样式的候选字体，依次尝试；都不可用时退回常规字体
+_MONO_FONTS = [
+    "C:\\Windows\\Fonts\\consola.ttf",
+    "/System/Library/Fonts/Menlo.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSansMono.ttf",
+]
+_MONO_BOLD_FONTS = [
+    "C:\\Windows\\Fonts\\consolab.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSansMono-Bold.ttf",
+]
+_ITALIC_FONTS = [
+    "C:\\Windows\\Fonts\\ariali.ttf",
+    "/System/Library/Fonts/Supplemental/Arial Italic.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Oblique.ttf",
+]
+_BOLD_FONTS = [
+    "C:\\Windows\\Fonts\\msyhbd.ttc",
+    "C:\\Windows\\Fonts\\simhei.ttf",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+]
+_REGULAR_FONTS = [
+    "C:\\Windows\\Fonts\\msyh.ttc",  # 微软雅黑
+    "C:\\Windows\\Fonts\\msyhbd.ttc",  # 微软雅黑粗体
+    "C:\\Windows\\Fonts\\simhei.ttf",  # 黑体
+    "C:\\Windows\\Fonts\\simsun.ttc",  # 宋体
+    "C:\\Windows\\Fonts\\simkai.ttf",  # 楷体
+    "C:\\Windows\\Fonts\\simfang.ttf",  # 仿宋
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Light.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+]
+
+@lru_cache(maxsize=64)
+def _load_font_cached(size: int, bold: bool = False, italic: bool = False, mono: bool = False):
+    """加载字体"""
+    from PIL import ImageFont
+    candidates = []
+    if mono:
+        candidates += (_MONO_BOLD_FONTS if bold else []) + _MONO_FONTS
+    elif italic:
+        candidates += _ITALIC_FONTS
+    if bold:
+        candidates += _BOLD_FONTS
+    candidates += _REGULAR_FONTS
+    
+    for path in candidates:
+        if os.path.exists(path):
+            try:
+                return ImageFont.truetype(path, size)
+            except Exception:
                 continue
-            probe = current + ch
-            w, _ = self._measure_text(draw, probe, font)
-            if w <= max_width:
-                current = probe
-            else:
-                if current:
-                    lines.append(current)
-                    current = ch
-                else:
-                    lines.append(probe)
-                    current = ""
-        if current:
-            lines.append(current)
-        return lines
-    
-    def _measure_text(self, draw, text: str, font) -> Tuple[int, int]:
-        """测量文本尺寸"""
-        try:
-            bbox = draw.textbbox((0, 0), text, font=font)
-            return bbox[2] - bbox[0], bbox[3] - bbox[1]
-        except Exception:
-            bbox = font.getbbox(text)
-            return bbox[2] - bbox[0], bbox[3] - bbox[1]
-    
-    def _render_table(self, draw, table_data: List[List[str]], font,
-                     start_x: int, start_y: int, max_width: int, text_color: Tuple[int, int, int]) -> int:
-        """渲染表格"""
-        if not table_data:
-            return 0
-        
-        col_count = max(len(row) for row in table_data) if table_data else 0
-        col_widths = []
-        
-        for col in range(col_count):
-            max_col_width = 0
-            for row in table_data:
-                if col < len(row):
-                    cell_text = row[col]
-                    w, _ = self._measure_text(draw, cell_text, font)
-                    max_col_width = max(max_col_width, w)
-            col_widths.append(max_col_width)
-        
-        padding = 20
-        total_table_width = sum(col_widths) + padding * (col_count - 1)
-        
-        if total_table_width > max_width:
-            scale_factor = max_width / total_table_width
-            col_widths = [int(w * scale_factor) for w in col_widths]
-            total_table_width = max_width
-        
-        line_height = font.getbbox("Hg")[3] - font.getbbox("Hg")[1]
-        row_height = line_height + 10
-        
-        current_y = start_y
-        for row_idx, row in enumerate(table_data):
-            current_x = start_x
-            
-            for col_idx in range(col_count):
-                if col_idx < len(row):
-                    cell_text = row[col_idx]
-                    
-                    if row_idx == 0:
-                        cell_font = self._load_font(font.size, bold=True)
-                    else:
-                        cell_font = font
-                    
-                    draw.text((current_x, current_y), cell_text, fill=text_color, font=cell_font)
-                
-                if col_idx < len(col_widths):
-                    current_x += col_widths[col_idx] + padding
-            
-            current_y += row_height
-        
-        return current_y - start_y
+    
+    try:
+        return ImageFont.load_default(size=size)
+    except:
+        return ImageFont.load_default()
+
+track_lru_cache("font", _load_font_cached)
 
-def render_markdown_text_to_image(md_text: str, options: Optional[RenderOptions] = None) -> str:
+def render_markdown_text_to_image(md_text: str, options: Optional[RenderOptions] = None,
+                                  timer: Optional[StageTimer] = None) -> str:
     """渲染Markdown文本为图片文件"""
     if options is None:
         options = RenderOptions()
@@ -942,7 +932,7 @@ def render_markdown_text_to_image(md_text: str, options: Optional[RenderOptions]
     renderer = MarkdownRenderer()
     
     # 渲染图片
-    return renderer.render(md_text, options)
+    return renderer.render(md_text, options, timer=timer)
 
 # 保留原有的接口兼容性
 def render_markdown_text_to_image_legacy(md_text: str, options: Optional[RenderOptions] = None):
@@ -0,0 +1,143 @@
+"""
+Output renditions: several sizes and formats of one render under one task.
+
+A ``submit_markdown`` call may ask for extra renditions next to its main
+image, e.g. a 600x800 WebP for chat and a 300x400 JPEG thumbnail of a
+1200x1600 PNG card.  ``plan_renditions`` groups all requested outputs by
+aspect ratio:
+
+* each group is rendered once, at the size of its largest member (the
+  "master"); the other members are downsampled from it with Lanczos
+  filtering, so text stays crisp and nothing is ever upscaled;
+* outputs that differ only in format or quality share the same pixels and
+  are only encoded again;
+* an output with a different aspect ratio changes the line width, so it
+  starts a group of its own and is laid out again.  The parsed document and
+  the PIL block layouts are cached (document.py, layout.py), so that render
+  does not parse the Markdown again.
+
+The main image stays the task's image; the others are stored next to it
+and listed under "renditions" in the task metadata (see store.py).
+"""
+
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from .encoding import PALETTE_MODES
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# 每个任务最多的附加尺寸数，以及附加尺寸的边长范围（缩略图可以小于主图的下限）
+MAX_RENDITIONS = 8
+MIN_RENDITION_SIZE = 16
+MAX_RENDITION_WIDTH = 4000
+MAX_RENDITION_HEIGHT = 6000
+RENDITION_FORMATS = ("png", "jpg", "jpeg", "webp", "avif")
+ENCODING_PROFILES = ("fast", "balanced", "smallest")
+
+
+@dataclass(frozen=True)
+class Rendition:
+    """One requested output: pixel size and encoder settings."""
+
+    width: int
+    height: int
+    format: str
+    quality: int
+    encoding_profile: Optional[str] = None
+    palette: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        """Identifier within a task, also the file suffix: "600x800.webp"."""
+        return f"{self.width}x{self.height}.{self.format}"
+
+    @property
+    def area(self) -> int:
+        return self.width * self.height
+
+
+def parse_renditions(raw: Optional[Sequence[Dict[str, Any]]], main: Rendition) -> List[Rendition]:
+    """Validate the ``renditions`` argument; unset fields default to the main image's.
+
+    A rendition with only a width keeps the main image's aspect ratio.
+    """
+    if not raw:
+        return []
+    if not isinstance(raw, (list, tuple)):
+        raise ValueError("renditions 必须是数组")
+    if len(raw) > MAX_RENDITIONS:
+        raise ValueError(f"renditions 最多 {MAX_RENDITIONS} 项")
+    renditions: List[Rendition] = []
+    seen = {main.name}
+    for index, entry in enumerate(raw):
+        if not isinstance(entry, dict):
+            raise ValueError(f"renditions[{index}] 必须是对象")
+        width = entry.get("width", main.width)
+        height = entry.get("height")
+        if height is None:
+            height = max(1, round(width * main.height / main.width))
+        rendition = Rendition(
+            width=width,
+            height=height,
+            format=entry.get("format", main.format),
+            quality=entry.get("quality", main.quality),
+            encoding_profile=entry.get("encoding_profile", main.encoding_profile),
+            palette=entry.get("palette", main.palette))
+        _validate(rendition, f"renditions[{index}]")
+        if rendition.name in seen:
+            raise ValueError(f"renditions[{index}] 与已有输出重复: {rendition.name}")
+        seen.add(rendition.name)
+        renditions.append(rendition)
+    return renditions
+
+
+def _validate(rendition: Rendition, where: str) -> None:
+    for field_name, limit in (("width", MAX_RENDITION_WIDTH), ("height", MAX_RENDITION_HEIGHT)):
+        value = getattr(rendition, field_name)
+        if not isinstance(value, int) or isinstance(value, bool) or not MIN_RENDITION_SIZE <= value <= limit:
+            raise ValueError(f"{where}.{field_name} 必须是 {MIN_RENDITION_SIZE}-{limit} 之间的整数")
+    if rendition.format not in RENDITION_FORMATS:
+        raise ValueError(f"{where}.format 不支持: {rendition.format}")
+    if not isinstance(rendition.quality, int) or not 1 <= rendition.quality <= 100:
+        raise ValueError(f"{where}.quality 必须是 1-100 之间的整数")
+    if rendition.encoding_profile is not None and rendition.encoding_profile not in ENCODING_PROFILES:
+        raise ValueError(f"{where}.encoding_profile 不支持: {rendition.encoding_profile}")
+    if rendition.palette is not None and rendition.palette not in PALETTE_MODES:
+        raise ValueError(f"{where}.palette 不支持: {rendition.palette}")
+
+
+def same_aspect(master: Rendition, other: Rendition) -> bool:
+    """True when scaling ``master`` to ``other``'s width gives its height to within a pixel."""
+    return abs(other.height * master.width - other.width * master.height) <= master.width
+
+
+def plan_renditions(outputs: Sequence[Rendition]) -> List[Tuple[Rendition, List[Rendition]]]:
+    """Group ``outputs`` by aspect ratio: [(master, members)], largest output of each group first."""
+    groups: List[Tuple[Rendition, List[Rendition]]] = []
+    for output in sorted(outputs, key=lambda r: r.area, reverse=True):
+        for master, members in groups:
+            if same_aspect(master, output):
+                members.append(output)
+                break
+        else:
+            groups.append((output, [output]))
+    return groups
+
+
+def resample(image: "Image.Image", rendition: Rendition, master: Rendition) -> "Image.Image":
+    """``image``, the render of ``master``, at the size of ``rendition`` (downsampled with Lanczos)."""
+    if image.size == (master.width, master.height):
+        size = (rendition.width, rendition.height)
+    else:
+        # 外部后端输出的尺寸与请求不同（例如按内容高度截图）：按宽度等比缩放
+        size = (rendition.width, max(1, round(image.height * rendition.width / image.width)))
+    if image.size == size:
+        return image
+    from PIL import Image
+
+    if image.mode == "P":
+        # 调色板图片先转回 RGB(A)，否则缩放只能取最近邻
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
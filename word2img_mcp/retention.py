@@ -0,0 +1,194 @@
+"""
+Background retention for the ImageStore.
+
+Tasks are expired by age and evicted by a total-size quota.  Both walk the
+task registry in creation order (its natural on-disk order), so a sweep
+stops at the first task that is young enough instead of scanning the
+output directory.  Quota eviction is LRU: a task's recency is its last
+``get_path`` access in this process, or its creation time if it has not
+been read since startup.
+
+Configuration (all optional; retention is off unless a limit is set):
+    WORD2IMG_RETENTION_MAX_AGE_HOURS   expire tasks older than this
+    WORD2IMG_RETENTION_MAX_BYTES       keep stored image bytes under this
+    WORD2IMG_RETENTION_INTERVAL_SECONDS  sweep interval (default 300)
+"""
+
+import heapq
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from .metrics import REGISTRY
+
+if TYPE_CHECKING:
+    from .store import ImageStore
+
+RETENTION_MAX_AGE_ENV = "WORD2IMG_RETENTION_MAX_AGE_HOURS"
+RETENTION_MAX_BYTES_ENV = "WORD2IMG_RETENTION_MAX_BYTES"
+RETENTION_INTERVAL_ENV = "WORD2IMG_RETENTION_INTERVAL_SECONDS"
+
+# 每批删除的任务数；批与批之间释放注册表锁，不阻塞渲染写入
+RETENTION_BATCH_SIZE = 500
+
+RETENTION_REMOVED_TOTAL = REGISTRY.counter(
+    "word2img_retention_removed_tasks_total", "Tasks removed by retention.", ["reason"])
+RETENTION_RECLAIMED_BYTES_TOTAL = REGISTRY.counter(
+    "word2img_retention_reclaimed_bytes_total", "Bytes reclaimed by retention (images, metadata, renditions).")
+
+
+@dataclass
+class RetentionPolicy:
+    """Limits applied by each retention sweep."""
+
+    max_age_hours: Optional[float] = None
+    max_total_bytes: Optional[int] = None
+    interval_seconds: float = 300.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_hours is not None or self.max_total_bytes is not None
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        max_age = os.environ.get(RETENTION_MAX_AGE_ENV)
+        max_bytes = os.environ.get(RETENTION_MAX_BYTES_ENV)
+        interval = os.environ.get(RETENTION_INTERVAL_ENV)
+        return cls(
+            max_age_hours=float(max_age) if max_age else None,
+            max_total_bytes=int(max_bytes) if max_bytes else None,
+            interval_seconds=float(interval) if interval else 300.0
+        )
+
+
+class RetentionEngine:
+    """Runs expiry and quota eviction against one ImageStore."""
+
+    def __init__(self, store: "ImageStore", policy: RetentionPolicy) -> None:
+        self.store = store
+        self.policy = policy
+
+    def run_once(self) -> Dict[str, Any]:
+        """Run one sweep and return a report of what was removed."""
+        started = time.perf_counter()
+        report = {
+            "expired_tasks": 0,
+            "evicted_tasks": 0,
+            "reclaimed_bytes": 0,
+            "started_at": datetime.now().isoformat()
+        }
+        if self.policy.max_age_hours is not None:
+            count, reclaimed = self._expire(datetime.now() - timedelta(hours=self.policy.max_age_hours))
+            report["expired_tasks"] = count
+            report["reclaimed_bytes"] += reclaimed
+            RETENTION_REMOVED_TOTAL.inc(count, reason="expired")
+        if self.policy.max_total_bytes is not None:
+            count, reclaimed = self._enforce_quota(self.policy.max_total_bytes)
+            report["evicted_tasks"] = count
+            report["reclaimed_bytes"] += reclaimed
+            RETENTION_REMOVED_TOTAL.inc(count, reason="quota")
+        RETENTION_RECLAIMED_BYTES_TOTAL.inc(report["reclaimed_bytes"])
+        report["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return report
+
+    def _expire(self, cutoff: datetime) -> Tuple[int, int]:
+        cutoff_iso = cutoff.isoformat()
+        removed = reclaimed = 0
+        while True:
+            batch: List[str] = []
+            for record in self.store.iter_task_records(newest_first=False):
+                # 创建顺序遍历：遇到第一个未过期任务即可停止
+                if record.created_at >= cutoff_iso:
+                    break
+                batch.append(record.task_id)
+                if len(batch) >= RETENTION_BATCH_SIZE:
+                    break
+            for task_id in batch:
+                reclaimed += self.store.delete_task(task_id)
+            removed += len(batch)
+            if len(batch) < RETENTION_BATCH_SIZE:
+                return removed, reclaimed
+
+    def _enforce_quota(self, max_total_bytes: int) -> Tuple[int, int]:
+        excess = self.store.total_image_bytes() - max_total_bytes
+        if excess <= 0:
+            return 0, 0
+
+        # 按创建顺序流式遍历；近期被访问过的任务按访问时间放入堆中，
+        # 与流合并得到 LRU 顺序，无需对全部任务排序
+        victims: List[str] = []
+        selected = 0
+        accessed: List[Tuple[float, str, int]] = []
+        for record in self.store.iter_task_records(newest_first=False):
+            created_ts = datetime.fromisoformat(record.created_at).timestamp()
+            while accessed and accessed[0][0] <= created_ts and selected < excess:
+                _, task_id, size = heapq.heappop(accessed)
+                victims.append(task_id)
+                selected += size
+            if selected >= excess:
+                break
+            last_access = self.store.last_access(record.task_id)
+            if last_access is not None and last_access > created_ts:
+                heapq.heappush(accessed, (last_access, record.task_id, record.file_size))
+                continue
+            victims.append(record.task_id)
+            selected += record.file_size
+        while accessed and selected < excess:
+            _, task_id, size = heapq.heappop(accessed)
+            victims.append(task_id)
+            selected += size
+
+        reclaimed = 0
+        for task_id in victims:
+            reclaimed += self.store.delete_task(task_id)
+        return len(victims), reclaimed
+
+
+class RetentionScheduler:
+    """Runs RetentionEngine sweeps on a daemon thread, off the event loop."""
+
+    def __init__(self, store: "ImageStore", policy: RetentionPolicy) -> None:
+        self.engine = RetentionEngine(store, policy)
+        self.policy = policy
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self.total_reclaimed_bytes = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None or not self.policy.enabled:
+            return
+        self._thread = threading.Thread(target=self._run, name="word2img-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.last_report = self.engine.run_once()
+                self.total_reclaimed_bytes += self.last_report["reclaimed_bytes"]
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            self._stop.wait(self.policy.interval_seconds)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.policy.enabled,
+            "running": self._thread is not None,
+            "max_age_hours": self.policy.max_age_hours,
+            "max_total_bytes": self.policy.max_total_bytes,
+            "interval_seconds": self.policy.interval_seconds,
+            "total_reclaimed_bytes": self.total_reclaimed_bytes,
+            "last_report": self.last_report,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,382 @@
+"""
+Storage drivers for the ImageStore.
+
+The ImageStore always writes a task's files under its local ``base_dir``
+first; a driver then publishes them (image and metadata JSON) to where the
+fleet reads them from.  Keys are paths relative to ``base_dir`` with
+forward slashes, e.g. ``ab/cd/<task_id>.json`` or ``blobs/12/34/<sha256>.png``.
+
+Drivers:
+    LocalStorageDriver   no copy (base_dir is the storage), or a mirror
+                         directory such as a shared mount
+    S3StorageDriver      any S3-compatible endpoint (AWS, MinIO, the
+                         ``s3_standin.py`` server in the repository root);
+                         requires boto3 (the "s3" extra)
+
+Uploads run on a small thread pool so ``submit_markdown`` returns as soon as
+the local write is done.  A failed upload is retried with exponential
+backoff and jitter (WORD2IMG_STORAGE_UPLOAD_RETRIES times); one that still
+fails is counted, reported in ``status()["last_error"]`` and kept in
+``failed_uploads``; those are submitted again by ``retry_failed()``, which
+the next upload triggers once ``FAILED_UPLOAD_RETRY_INTERVAL`` has passed.  A file missing locally (for example after the
+local copy was removed) is fetched back from the driver on ``get_path``.
+
+Configuration:
+    WORD2IMG_STORAGE                   "local" (default) or "s3"
+    WORD2IMG_STORAGE_LOCAL_ROOT        mirror directory for the local driver
+    WORD2IMG_STORAGE_UPLOAD_RETRIES    retries of a failed upload (default 3)
+    WORD2IMG_S3_BUCKET                 bucket (required for s3)
+    WORD2IMG_S3_PREFIX                 key prefix inside the bucket
+    WORD2IMG_S3_ENDPOINT_URL           e.g. http://127.0.0.1:9000 for MinIO
+    WORD2IMG_S3_REGION                 region name
+    WORD2IMG_S3_MULTIPART_THRESHOLD_MB multipart upload above this size (default 8)
+    WORD2IMG_S3_UPLOAD_WORKERS         background upload threads (default 4)
+    WORD2IMG_S3_MAX_POOL_CONNECTIONS   pooled HTTP connections (default 32)
+"""
+
+import mimetypes
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional, Set
+
+from .metrics import REGISTRY
+
+STORAGE_ENV = "WORD2IMG_STORAGE"
+STORAGE_LOCAL_ROOT_ENV = "WORD2IMG_STORAGE_LOCAL_ROOT"
+STORAGE_UPLOAD_RETRIES_ENV = "WORD2IMG_STORAGE_UPLOAD_RETRIES"
+S3_BUCKET_ENV = "WORD2IMG_S3_BUCKET"
+S3_PREFIX_ENV = "WORD2IMG_S3_PREFIX"
+S3_ENDPOINT_URL_ENV = "WORD2IMG_S3_ENDPOINT_URL"
+S3_REGION_ENV = "WORD2IMG_S3_REGION"
+S3_MULTIPART_THRESHOLD_ENV = "WORD2IMG_S3_MULTIPART_THRESHOLD_MB"
+S3_UPLOAD_WORKERS_ENV = "WORD2IMG_S3_UPLOAD_WORKERS"
+S3_MAX_POOL_CONNECTIONS_ENV = "WORD2IMG_S3_MAX_POOL_CONNECTIONS"
+
+MB = 1024 * 1024
+
+# 上传失败后的重试退避：base * 2^n（带抖动），最长 max 秒
+UPLOAD_RETRY_BASE_DELAY = 1.0
+UPLOAD_RETRY_MAX_DELAY = 30.0
+# 重试后仍失败的上传，至少间隔这么久随下一次上传重新提交
+FAILED_UPLOAD_RETRY_INTERVAL = 60.0
+
+STORAGE_UPLOADS_TOTAL = REGISTRY.counter(
+    "word2img_storage_uploads_total", "Objects uploaded by the storage driver.", ["driver", "status"])
+STORAGE_UPLOAD_BYTES_TOTAL = REGISTRY.counter(
+    "word2img_storage_upload_bytes_total", "Bytes uploaded by the storage driver.", ["driver"])
+STORAGE_UPLOAD_DURATION_SECONDS = REGISTRY.histogram(
+    "word2img_storage_upload_duration_seconds", "Time to upload one object.", ["driver"])
+STORAGE_UPLOADS_PENDING = REGISTRY.gauge(
+    "word2img_storage_uploads_pending", "Uploads queued or in progress.", ["driver"])
+
+
+class StorageDriver:
+    """Publishes files from the local store and fetches them back.
+
+    Subclasses implement ``upload``/``download``/``delete``; ``submit`` runs
+    ``upload`` on the driver's thread pool.
+    """
+
+    name = "base"
+    # Local-only drivers never need to download or delete anything remotely
+    remote = False
+
+    def __init__(self, upload_workers: int = 4, upload_retries: Optional[int] = None) -> None:
+        self.upload_workers = upload_workers
+        self.upload_retries = int(os.environ.get(STORAGE_UPLOAD_RETRIES_ENV, "3")) \
+            if upload_retries is None else upload_retries
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Set[Future] = set()
+        self._lock = threading.Lock()
+        self.uploaded = 0
+        self.failed = 0
+        self.retried = 0
+        self.last_error: Optional[str] = None
+        # 重试后仍失败的上传（key -> 本地路径），等待 retry_failed 重新发布
+        self.failed_uploads: Dict[str, str] = {}
+        self._failed_retried_at = 0.0
+
+    def upload(self, key: str, path: str) -> None:
+        raise NotImplementedError
+
+    def download(self, key: str, path: str) -> bool:
+        """Fetch ``key`` into ``path``; False if the object does not exist."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        raise NotImplementedError
+
+    def submit(self, key: str, path: str) -> Optional[Future]:
+        """Upload in the background; returns the future (None if nothing to do)."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.upload_workers, thread_name_prefix=f"word2img-{self.name}-upload")
+            future = self._executor.submit(self._upload_tracked, key, path)
+            self._pending.add(future)
+        STORAGE_UPLOADS_PENDING.inc(driver=self.name)
+        future.add_done_callback(self._upload_done)
+        if self.failed_uploads and time.monotonic() - self._failed_retried_at >= FAILED_UPLOAD_RETRY_INTERVAL:
+            self.retry_failed()
+        return future
+
+    def _upload_tracked(self, key: str, path: str) -> None:
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                self.upload(key, path)
+                break
+            except FileNotFoundError as e:
+                # 本地文件已被删除（任务已删除），重试没有意义
+                self._upload_failed(key, None, e)
+                raise
+            except Exception as e:
+                if attempt >= self.upload_retries:
+                    self._upload_failed(key, path, e)
+                    raise
+                attempt += 1
+                self.retried += 1
+                STORAGE_UPLOADS_TOTAL.inc(driver=self.name, status="retried")
+                delay = min(UPLOAD_RETRY_MAX_DELAY, UPLOAD_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                time.sleep(delay * random.uniform(0.5, 1.0))
+        with self._lock:
+            self.failed_uploads.pop(key, None)
+        self.uploaded += 1
+        STORAGE_UPLOADS_TOTAL.inc(driver=self.name, status="ok")
+        STORAGE_UPLOAD_BYTES_TOTAL.inc(os.path.getsize(path), driver=self.name)
+        STORAGE_UPLOAD_DURATION_SECONDS.observe(time.perf_counter() - started, driver=self.name)
+
+    def _upload_failed(self, key: str, path: Optional[str], error: Exception) -> None:
+        self.failed += 1
+        self.last_error = f"{key}: {type(error).__name__}: {error}"
+        STORAGE_UPLOADS_TOTAL.inc(driver=self.name, status="failed")
+        if path is not None:
+            with self._lock:
+                self.failed_uploads[key] = path
+
+    def retry_failed(self) -> int:
+        """Resubmit uploads that failed after all retries; returns how many were queued."""
+        with self._lock:
+            failed, self.failed_uploads = self.failed_uploads, {}
+            self._failed_retried_at = time.monotonic()
+        for key, path in failed.items():
+            self.submit(key, path)
+        return len(failed)
+
+    def _upload_done(self, future: Future) -> None:
+        with self._lock:
+            self._pending.discard(future)
+        STORAGE_UPLOADS_PENDING.dec(driver=self.name)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Wait for queued uploads to finish."""
+        with self._lock:
+            pending = list(self._pending)
+        if pending:
+            wait(pending, timeout=timeout)
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "driver": self.name,
+            "remote": self.remote,
+            "pending_uploads": pending,
+            "uploaded": self.uploaded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "awaiting_retry": len(self.failed_uploads),
+            "last_error": self.last_error
+        }
+
+
+class LocalStorageDriver(StorageDriver):
+    """Local filesystem storage.
+
+    Without ``root`` the store's own ``base_dir`` is the storage and every
+    operation is a no-op.  With ``root`` (e.g. a shared mount) files are
+    mirrored there atomically.
+    """
+
+    name = "local"
+
+    def __init__(self, root: Optional[str] = None, upload_workers: int = 2) -> None:
+        super().__init__(upload_workers)
+        self.root = root
+        self.remote = root is not None
+
+    def _target(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def submit(self, key: str, path: str) -> Optional[Future]:
+        if self.root is None:
+            return None
+        return super().submit(key, path)
+
+    def upload(self, key: str, path: str) -> None:
+        if self.root is None:
+            return
+        target = self._target(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, target)
+
+    def download(self, key: str, path: str) -> bool:
+        if self.root is None:
+            return os.path.exists(path)
+        source = self._target(key)
+        if not os.path.exists(source):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+        return True
+
+    def delete(self, key: str) -> None:
+        if self.root is None:
+            return
+        try:
+            os.remove(self._target(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key: str) -> str:
+        return os.path.abspath(self._target(key)) if self.root else key
+
+
+class S3StorageDriver(StorageDriver):
+    """S3-compatible object storage through boto3.
+
+    One client (thread-safe, with a pooled connection manager) is shared by
+    all upload threads.  Objects above ``multipart_threshold`` bytes are sent
+    as multipart uploads with parts uploaded in parallel.
+    """
+
+    name = "s3"
+    remote = True
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region_name: Optional[str] = None, multipart_threshold: int = 8 * MB,
+                 multipart_chunksize: int = 8 * MB, max_pool_connections: int = 32,
+                 upload_workers: int = 4) -> None:
+        super().__init__(upload_workers)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.endpoint_url = endpoint_url
+        self.region_name = region_name
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.max_pool_connections = max_pool_connections
+        self._client_instance = None
+        self._transfer_config = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def _client(self):
+        # boto3 只在第一次真正访问对象存储时导入
+        if self._client_instance is None:
+            with self._client_lock:
+                if self._client_instance is None:
+                    import boto3
+                    from boto3.s3.transfer import TransferConfig
+                    from botocore.config import Config
+
+                    self._transfer_config = TransferConfig(
+                        multipart_threshold=self.multipart_threshold,
+                        multipart_chunksize=self.multipart_chunksize,
+                        max_concurrency=max(1, self.max_pool_connections // max(1, self.upload_workers)),
+                        use_threads=True
+                    )
+                    self._client_instance = boto3.session.Session().client(
+                        "s3",
+                        endpoint_url=self.endpoint_url,
+                        region_name=self.region_name,
+                        config=Config(
+                            max_pool_connections=self.max_pool_connections,
+                            retries={"max_attempts": 5, "mode": "standard"},
+                            s3={"addressing_style": "path"} if self.endpoint_url else None
+                        )
+                    )
+        return self._client_instance
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def upload(self, key: str, path: str) -> None:
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self._client.upload_file(
+            path, self.bucket, self._key(key),
+            ExtraArgs={"ContentType": content_type},
+            Config=self._transfer_config
+        )
+
+    def download(self, key: str, path: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            self._client.download_file(self.bucket, self._key(key), tmp_path, Config=self._transfer_config)
+        except ClientError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        os.replace(tmp_path, path)
+        return True
+
+    def delete(self, key: str) -> None:
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def url(self, key: str) -> str:
+        return f"s3://{self.bucket}/{self._key(key)}"
+
+    def status(self) -> Dict[str, Any]:
+        status = super().status()
+        status.update({
+            "bucket": self.bucket,
+            "prefix": self.prefix,
+            "endpoint_url": self.endpoint_url,
+            "multipart_threshold": self.multipart_threshold
+        })
+        return status
+
+
+def storage_driver_from_env() -> StorageDriver:
+    """Build the driver selected by WORD2IMG_STORAGE (local by default)."""
+    kind = os.environ.get(STORAGE_ENV, "local").lower()
+    if kind == "local":
+        return LocalStorageDriver(os.environ.get(STORAGE_LOCAL_ROOT_ENV) or None)
+    if kind == "s3":
+        bucket = os.environ.get(S3_BUCKET_ENV)
+        if not bucket:
+            raise ValueError(f"{S3_BUCKET_ENV} must be set when {STORAGE_ENV}=s3")
+        return S3StorageDriver(
+            bucket=bucket,
+            prefix=os.environ.get(S3_PREFIX_ENV, ""),
+            endpoint_url=os.environ.get(S3_ENDPOINT_URL_ENV) or None,
+            region_name=os.environ.get(S3_REGION_ENV) or None,
+            multipart_threshold=int(float(os.environ.get(S3_MULTIPART_THRESHOLD_ENV, "8")) * MB),
+            upload_workers=int(os.environ.get(S3_UPLOAD_WORKERS_ENV, "4")),
+            max_pool_connections=int(os.environ.get(S3_MAX_POOL_CONNECTIONS_ENV, "32"))
+        )
+    raise ValueError(f"Unknown {STORAGE_ENV}: {kind!r} (expected 'local' or 's3')")
@@ -1,88 +1,274 @@
 import base64
 import hashlib
+import io
 import json
 import os
+import sys
+import time
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Optional, List, Any
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, List, Any, Sequence, Tuple
 
-from PIL import Image
+from .encoding import encode_image, reduce_colors
+from .metrics import STORE_BYTES_WRITTEN_TOTAL, STORE_DEDUP_HITS_TOTAL
+from .journal import JournaledTaskRegistry
+from .registry import TaskRecord
+from .storage import LocalStorageDriver, StorageDriver
+from .timing import StageTimer
+
+if TYPE_CHECKING:
+	from PIL import Image
+
+	from .profiling import RenderProfiler
+	from .renditions import Rendition
 
 
 class ImageStore:
 	"""Image storage manager with task management, statistics, and detailed error handling."""
 	
-	def __init__(self, base_dir: Optional[str] = None) -> None:
+	def __init__(self, base_dir: Optional[str] = None, deduplicate: bool = True,
+	             storage: Optional[StorageDriver] = None) -> None:
 		self.base_dir = base_dir or os.path.join(os.getcwd(), "outputs")
 		os.makedirs(self.base_dir, exist_ok=True)
+		# Identical encoded images share one blob under blobs/; each task file is a hard link to it
+		self.deduplicate = deduplicate
+		self._blobs_dir = os.path.join(self.base_dir, "blobs")
+		# Files are written locally first, then published by the storage driver in the background
+		self.storage = storage or LocalStorageDriver()
 		self._tasks_file = os.path.join(self.base_dir, "tasks.json")
-		self._tasks: Dict[str, Dict] = {}
-		self._load_tasks()
-	
-	def _load_tasks(self) -> None:
-		"""Load tasks from JSON file."""
-		if os.path.exists(self._tasks_file):
-			try:
-				with open(self._tasks_file, "r", encoding="utf-8") as f:
-					self._tasks = json.load(f)
-			except (json.JSONDecodeError, FileNotFoundError):
-				self._tasks = {}
-		else:
-			self._tasks = {}
-	
-	def _save_tasks(self) -> None:
-		"""Save tasks to JSON file."""
+		# The registry is opened on first access, not at construction time
+		self._registry_instance: Optional[JournaledTaskRegistry] = None
+		# Last get_path time per task (this process only), used for LRU eviction
+		self._last_access: Dict[str, float] = {}
+	
+	@property
+	def _registry(self) -> JournaledTaskRegistry:
+		if self._registry_instance is None:
+			self._registry_instance = JournaledTaskRegistry(self.base_dir)
+			self._migrate_legacy_tasks()
+		return self._registry_instance
+	
+	def _migrate_legacy_tasks(self) -> None:
+		"""Import a legacy tasks.json into the registry once, then set it aside."""
+		if not os.path.exists(self._tasks_file):
+			return
 		try:
-			with open(self._tasks_file, "w", encoding="utf-8") as f:
-				json.dump(self._tasks, f, ensure_ascii=False, indent=2)
-		except Exception as e:
-			raise ValueError(f"Failed to save tasks: {str(e)}") from e
+			with open(self._tasks_file, "r", encoding="utf-8") as f:
+				tasks = json.load(f)
+		except (json.JSONDecodeError, UnicodeDecodeError):
+			# Keep the damaged file for inspection instead of silently dropping it
+			os.replace(self._tasks_file, self._tasks_file + ".corrupt")
+			return
+		if not isinstance(tasks, dict):
+			os.replace(self._tasks_file, self._tasks_file + ".corrupt")
+			return
+		_, rejected = self._registry_instance.import_json(tasks)
+		if rejected:
+			# Entries the registry cannot hold are set aside for inspection, not retried on every start
+			with open(self._tasks_file + ".rejected", "w", encoding="utf-8") as f:
+				json.dump(rejected, f, ensure_ascii=False, indent=2)
+			print(f"⚠️  tasks.json 中有 {len(rejected)} 个任务无法导入，已保存到 {self._tasks_file}.rejected",
+			      file=sys.stderr)
+		os.replace(self._tasks_file, self._tasks_file + ".migrated")
+	
+	def close(self) -> None:
+		"""Finish pending uploads and release the registry's file handles and mappings."""
+		self.storage.close()
+		if self._registry_instance is not None:
+			self._registry_instance.close()
+			self._registry_instance = None
+	
+	def _task_dir(self, task_id: str, create: bool = False) -> str:
+		"""Shard directory for a task: <base>/<id[0:2]>/<id[2:4]>."""
+		directory = os.path.join(self.base_dir, task_id[:2], task_id[2:4])
+		if create:
+			os.makedirs(directory, exist_ok=True)
+		return directory
+	
+	def _task_file(self, task_id: str, suffix: str, create_dir: bool = False) -> str:
+		"""Sharded path of one of a task's files, e.g. suffix ".json"."""
+		return os.path.join(self._task_dir(task_id, create=create_dir), f"{task_id}{suffix}")
+	
+	def _existing_task_file(self, task_id: str, suffix: str) -> Optional[str]:
+		"""Sharded path if present, else the pre-sharding flat path if present."""
+		for path in (self._task_file(task_id, suffix), os.path.join(self.base_dir, f"{task_id}{suffix}")):
+			if os.path.exists(path):
+				return path
+		return None
+	
+	def _storage_key(self, path: str) -> str:
+		"""Storage driver key of a local file: its path relative to base_dir."""
+		return os.path.relpath(path, self.base_dir).replace(os.sep, "/")
+	
+	def _blob_path(self, digest: str, format: str) -> str:
+		"""Content-addressed blob path: <base>/blobs/<d[0:2]>/<d[2:4]>/<sha256>.<ext>."""
+		return os.path.join(self._blobs_dir, digest[:2], digest[2:4], f"{digest}.{format}")
 	
-	def save_image(self, image: Image.Image, format: str = "jpg", options: Optional[Dict] = None) -> str:
-		"""Save image with detailed metadata and return task ID."""
+	def _write_blob(self, data: bytes, digest: str, format: str, path: str) -> bool:
+		"""Place ``data`` at ``path``, hard-linking an existing blob when possible.
+		
+		Returns True when no image bytes were written (the blob already existed).
+		The link count of the blob inode is the reference count of the content.
+		On a filesystem without hard links ``path`` gets a private copy and no
+		blob is kept.
+		"""
+		blob_path = self._blob_path(digest, format)
+		try:
+			os.link(blob_path, path)
+			return True
+		except FileNotFoundError:
+			pass
+		except OSError:
+			return self._write_private_copy(data, path)
+		
+		os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+		tmp_path = f"{blob_path}.{uuid.uuid4().hex}.tmp"
+		with open(tmp_path, "wb") as f:
+			f.write(data)
+		# Publish exclusively: replacing an existing blob would give it a new inode and
+		# detach the tasks already linked to the old one from the link-count refcount
+		try:
+			os.link(tmp_path, blob_path)
+			written = True
+		except FileExistsError:
+			# A concurrent writer published the same digest first; link to its blob
+			written = False
+		except OSError:
+			# Filesystem without hard links (EPERM, EXDEV, ENOTSUP, ...)
+			return self._write_private_copy(data, path)
+		finally:
+			os.remove(tmp_path)
+		try:
+			os.link(blob_path, path)
+		except OSError:
+			return self._write_private_copy(data, path)
+		return not written
+	
+	@staticmethod
+	def _write_private_copy(data: bytes, path: str) -> bool:
+		"""Store ``data`` at ``path`` outside the blob refcount; returns False (bytes were written)."""
+		with open(path, "wb") as f:
+			f.write(data)
+		return False
+	
+	def _release_blob(self, digest: str, format: str) -> int:
+		"""Drop a blob once no task links to it; returns bytes reclaimed."""
+		blob_path = self._blob_path(digest, format)
+		try:
+			stat = os.stat(blob_path)
+			if stat.st_nlink > 1:
+				return 0
+			os.remove(blob_path)
+			return stat.st_size
+		except FileNotFoundError:
+			return 0
+	
+	def save_image(self, image: "Image.Image", format: str = "jpg", options: Optional[Dict] = None,
+	               timer: Optional[StageTimer] = None, quality: Optional[int] = None,
+	               encoding_profile: Optional[str] = None, palette: Optional[str] = None,
+	               renditions: Optional[Sequence[Tuple["Rendition", "Image.Image", Dict[str, Any]]]] = None) -> str:
+		"""Save image with detailed metadata and return task ID.
+		
+		``quality`` and ``encoding_profile`` select the encoder settings and
+		``palette`` the PNG colour reduction (see encoding.py); what was applied
+		is stored under "encoding".
+		``renditions`` are extra sizes/formats of the same render, as
+		(rendition, image, extra metadata) triples; each is written next to the
+		task image as <task_id>.<rendition name> and listed under "renditions".
+		Stage durations (encode, registry rewrite, metadata write) are recorded on
+		``timer``; everything it holds at metadata time is stored under "timings".
+		"""
+		timer = timer or StageTimer()
 		try:
 			task_id = str(uuid.uuid4())
-			filename = f"{task_id}.{format}"
-			path = os.path.join(self.base_dir, filename)
+			path = self._task_file(task_id, f".{format}", create_dir=True)
 			
-			# Save image with quality settings
-			if format.lower() in ["jpg", "jpeg"]:
-				image.save(path, format=format.upper(), quality=95, subsampling=0, optimize=True)
-			else:
-				image.save(path, format=format.upper())
+			source_mode = image.mode
+			reduction = None
+			if format.lower() == "png":
+				with timer.stage("store.reduce_colors") as entry:
+					image, reduction = reduce_colors(image, palette)
+					entry["reduced"] = reduction is not None
 			
-			# Get file size
-			file_size = os.path.getsize(path)
+			# Encode in memory so identical images can be detected before any write
+			with timer.stage("store.encode", format=format) as entry:
+				buffer = io.BytesIO()
+				encoding = encode_image(image, buffer, format, quality=quality, profile=encoding_profile)
+				encoding["palette"] = reduction
+				entry["profile"] = encoding["profile"]
+				data = buffer.getvalue()
+				digest = hashlib.sha256(data).hexdigest()
 			
-			# Save metadata
+			file_size = len(data)
+			with timer.stage("store.write_blob") as entry:
+				if self.deduplicate:
+					deduplicated = self._write_blob(data, digest, format, path)
+				else:
+					with open(path, "wb") as f:
+						f.write(data)
+					deduplicated = False
+				entry["deduplicated"] = deduplicated
+			# Deduplicated content is published once under its blob key; a private copy under its own key
+			shared = self.deduplicate and os.stat(path).st_nlink > 1
+			image_key = self._storage_key(self._blob_path(digest, format) if shared else path)
+			if deduplicated:
+				STORE_DEDUP_HITS_TOTAL.inc(format=format.lower())
+			else:
+				STORE_BYTES_WRITTEN_TOTAL.inc(file_size, format=format.lower())
+			rendition_entries = [
+				self._write_rendition(task_id, rendition, rendition_image, extra, timer)
+				for rendition, rendition_image, extra in renditions or ()
+			]
 			created_at = datetime.now().isoformat()
-			metadata = {
-				"task_id": task_id,
-				"created_at": created_at,
-				"format": format,
-				"file_size": file_size,
-				"status": "completed",
-				"options": options or {},
-				"image_size": f"{image.width}x{image.height}",
-				"mode": image.mode
-			}
-			
-			metadata_file = os.path.join(self.base_dir, f"{task_id}.json")
-			with open(metadata_file, "w", encoding="utf-8") as f:
-				json.dump(metadata, f, ensure_ascii=False, indent=2)
 			
 			# Update tasks registry
-			self._tasks[task_id] = {
-				"task_id": task_id,
-				"created_at": created_at,
-				"status": "completed",
-				"format": format,
-				"file_size": file_size,
-				"has_metadata": True,
-				"path": path
-			}
-			self._save_tasks()
+			with timer.stage("store.write_registry"):
+				self._registry.add(TaskRecord(
+					task_id=task_id,
+					created_at=created_at,
+					status="completed",
+					format=format,
+					file_size=file_size,
+					path=path,
+					has_metadata=True
+				))
+			
+			# Save metadata
+			with timer.stage("store.write_metadata"):
+				metadata = {
+					"task_id": task_id,
+					"created_at": created_at,
+					"format": format,
+					"file_size": file_size,
+					"content_sha256": digest,
+					"deduplicated": deduplicated,
+					"status": "completed",
+					"options": options or {},
+					"image_size": f"{image.width}x{image.height}",
+					"mode": source_mode,
+					"encoding": encoding,
+					"timings": timer.to_dict(),
+					"storage": {
+						"driver": self.storage.name,
+						"key": image_key,
+						"url": self.storage.url(image_key)
+					}
+				}
+				if rendition_entries:
+					metadata["renditions"] = rendition_entries
+				
+				metadata_file = self._task_file(task_id, ".json")
+				with open(metadata_file, "w", encoding="utf-8") as f:
+					json.dump(metadata, f, ensure_ascii=False, indent=2)
+			
+			# Uploads are queued; the response does not wait for the network
+			with timer.stage("store.publish", driver=self.storage.name):
+				if not deduplicated:
+					self.storage.submit(image_key, path)
+				for entry in rendition_entries:
+					self.storage.submit(entry["storage"]["key"], entry["path"])
+				self.storage.submit(self._storage_key(metadata_file), metadata_file)
 			
 			return task_id
 			
@@ -95,23 +281,82 @@ class ImageStore:
 			}
 			raise ValueError(f"Failed to save image: {json.dumps(error_details, ensure_ascii=False)}") from e
 	
+	def _write_rendition(self, task_id: str, rendition: "Rendition", image: "Image.Image",
+	                     extra: Dict[str, Any], timer: StageTimer) -> Dict[str, Any]:
+		"""Encode and write one rendition of a task; returns its metadata entry.
+		
+		Renditions are private files (not content-addressed): they are derived
+		from one task's render and are not shared between tasks.
+		"""
+		path = self._task_file(task_id, f".{rendition.name}")
+		reduction = None
+		with timer.stage("store.encode_rendition", rendition=rendition.name) as entry:
+			if rendition.format.lower() == "png":
+				image, reduction = reduce_colors(image, rendition.palette)
+			buffer = io.BytesIO()
+			encoding = encode_image(image, buffer, rendition.format, quality=rendition.quality,
+			                        profile=rendition.encoding_profile)
+			encoding["palette"] = reduction
+			entry["profile"] = encoding["profile"]
+			data = buffer.getvalue()
+		with open(path, "wb") as f:
+			f.write(data)
+		STORE_BYTES_WRITTEN_TOTAL.inc(len(data), format=rendition.format.lower())
+		key = self._storage_key(path)
+		return {
+			"name": rendition.name,
+			"width": rendition.width,
+			"height": rendition.height,
+			"format": rendition.format,
+			"quality": rendition.quality,
+			"file_size": len(data),
+			"content_sha256": hashlib.sha256(data).hexdigest(),
+			"path": path,
+			"encoding": encoding,
+			**extra,
+			"storage": {
+				"driver": self.storage.name,
+				"key": key,
+				"url": self.storage.url(key)
+			}
+		}
+	
+	def get_rendition_path(self, task_id: str, name: str) -> Optional[str]:
+		"""Local path of one of a task's renditions (fetched from storage if needed), or None."""
+		metadata = self.get_task_metadata(task_id) or {}
+		for rendition in metadata.get("renditions", []):
+			if rendition.get("name") != name:
+				continue
+			path = rendition["path"]
+			key = rendition.get("storage", {}).get("key")
+			if os.path.exists(path) or (self.storage.remote and key and self.storage.download(key, path)):
+				self._last_access[task_id] = time.time()
+				return path
+			return None
+		return None
+	
 	def get_path(self, task_id: str) -> Optional[str]:
 		"""Get file path for task ID with validation."""
 		try:
-			if task_id not in self._tasks:
+			record = self._registry.get(task_id)
+			if record is None:
 				return None
 			
-			path = self._tasks[task_id].get("path")
-			if path and os.path.exists(path):
-				return path
+			# The exact path is recorded at write time: a single stat
+			path = record.path
+			if path:
+				if os.path.exists(path) or self._fetch_image(task_id, path):
+					self._last_access[task_id] = time.time()
+					return path
+				return None
 			
-			# Fallback: search for file with task_id
+			# Legacy records without a path: search for file with task_id
 			for ext in ["png", "jpg", "jpeg", "webp"]:
-				path = os.path.join(self.base_dir, f"{task_id}.{ext}")
-				if os.path.exists(path):
+				path = self._existing_task_file(task_id, f".{ext}")
+				if path:
 					# Update task record
-					self._tasks[task_id]["path"] = path
-					self._save_tasks()
+					self._registry.update(task_id, path=path)
+					self._last_access[task_id] = time.time()
 					return path
 			
 			return None
@@ -125,11 +370,23 @@ class ImageStore:
 			}
 			raise ValueError(f"Failed to get image path: {json.dumps(error_details, ensure_ascii=False)}") from e
 	
+	def _fetch_image(self, task_id: str, path: str) -> bool:
+		"""Restore a task image missing locally from the storage driver."""
+		if not self.storage.remote:
+			return False
+		metadata = self.get_task_metadata(task_id) or {}
+		key = metadata.get("storage", {}).get("key")
+		return bool(key) and self.storage.download(key, path)
+	
 	def get_task_metadata(self, task_id: str) -> Optional[Dict]:
 		"""Get detailed task metadata."""
 		try:
-			metadata_file = os.path.join(self.base_dir, f"{task_id}.json")
-			if os.path.exists(metadata_file):
+			metadata_file = self._existing_task_file(task_id, ".json")
+			if metadata_file is None and self.storage.remote:
+				metadata_file = self._task_file(task_id, ".json")
+				if not self.storage.download(self._storage_key(metadata_file), metadata_file):
+					metadata_file = None
+			if metadata_file:
 				with open(metadata_file, "r", encoding="utf-8") as f:
 					return json.load(f)
 			return None
@@ -143,17 +400,65 @@ class ImageStore:
 			}
 			raise ValueError(f"Failed to get task metadata: {json.dumps(error_details, ensure_ascii=False)}") from e
 	
+	def save_profile(self, task_id: str, profiler: "RenderProfiler") -> Dict[str, str]:
+		"""Store a render profile next to the task (text report + raw pstats)."""
+		try:
+			report_path = self._task_file(task_id, ".profile.txt", create_dir=True)
+			stats_path = self._task_file(task_id, ".prof")
+			with open(report_path, "w", encoding="utf-8") as f:
+				f.write(profiler.report())
+			profiler.dump_stats(stats_path)
+			
+			self._registry.update(task_id, has_profile=True)
+			
+			return {"report_path": report_path, "stats_path": stats_path}
+			
+		except Exception as e:
+			error_details = {
+				"error": str(e),
+				"error_type": type(e).__name__,
+				"operation": "save_profile",
+				"task_id": task_id
+			}
+			raise ValueError(f"Failed to save profile: {json.dumps(error_details, ensure_ascii=False)}") from e
+	
+	def get_profile_report(self, task_id: str) -> Optional[Dict[str, Any]]:
+		"""Get the stored profile report for a task, if one was captured."""
+		try:
+			report_path = self._existing_task_file(task_id, ".profile.txt")
+			if report_path is None:
+				return None
+			with open(report_path, "r", encoding="utf-8") as f:
+				report = f.read()
+			stats_path = self._existing_task_file(task_id, ".prof")
+			return {
+				"task_id": task_id,
+				"report": report,
+				"report_path": report_path,
+				"stats_path": stats_path
+			}
+			
+		except Exception as e:
+			error_details = {
+				"error": str(e),
+				"error_type": type(e).__name__,
+				"operation": "get_profile_report",
+				"task_id": task_id
+			}
+			raise ValueError(f"Failed to get profile report: {json.dumps(error_details, ensure_ascii=False)}") from e
+	
 	def list_tasks(self, limit: int = 10, status_filter: str = "all") -> List[Dict]:
 		"""List tasks with filtering and detailed information."""
 		try:
 			tasks_list = []
+			status = None if status_filter == "all" else status_filter
 			
-			for task_id, task_info in self._tasks.items():
-				if status_filter != "all" and task_info.get("status") != status_filter:
-					continue
+			# Registry order is creation order, so newest-first needs no sort
+			for record in self._registry.iter_records(newest_first=True, status=status):
+				task_info = record.to_dict()
 				
 				# Add detailed metadata if available
-				metadata = self.get_task_metadata(task_id)
+				metadata = self.get_task_metadata(record.task_id)
 				if metadata:
 					task_info.update(metadata)
 				
@@ -162,9 +467,6 @@ class ImageStore:
 				if len(tasks_list) >= limit:
 					break
 			
-			# Sort by creation time (newest first)
-			tasks_list.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-			
 			return tasks_list
 			
 		except Exception as e:
@@ -180,19 +482,14 @@ class ImageStore:
 	def get_task_statistics(self) -> Dict[str, Any]:
 		"""Get comprehensive task statistics."""
 		try:
-			total = len(self._tasks)
-			completed = sum(1 for task in self._tasks.values() if task.get("status") == "completed")
-			failed = sum(1 for task in self._tasks.values() if task.get("status") == "failed")
-			processing = sum(1 for task in self._tasks.values() if task.get("status") == "processing")
-			
-			# Calculate total file size and format distribution
-			total_size = 0
-			formats = {}
-			for task in self._tasks.values():
-				if "file_size" in task:
-					total_size += task["file_size"]
-				if "format" in task:
-					formats[task["format"]] = formats.get(task["format"], 0) + 1
+			stats = self._registry.statistics()
+			counts = stats["counts"]
+			total = sum(counts.values())
+			completed = counts.get("completed", 0)
+			failed = counts.get("failed", 0)
+			processing = counts.get("processing", 0)
+			total_size = stats["total_size"]
+			formats = stats["formats"]
 			
 			return {
 				"total_tasks": total,
@@ -203,7 +500,8 @@ class ImageStore:
 				"average_file_size": total_size / total if total > 0 else 0,
 				"formats": formats,
 				"last_updated": datetime.now().isoformat(),
-				"storage_directory": self.base_dir
+				"storage_directory": self.base_dir,
+				"journal": self._registry.wal_status()
 			}
 			
 		except Exception as e:
@@ -214,32 +512,130 @@ class ImageStore:
 			}
 			raise ValueError(f"Failed to get task statistics: {json.dumps(error_details, ensure_ascii=False)}") from e
 	
-	def cleanup_old_files(self, max_age_hours: int = 24) -> int:
-		"""Clean up files older than specified hours with detailed reporting."""
+	def iter_task_records(self, newest_first: bool = False) -> Iterator[TaskRecord]:
+		"""Iterate live task records in creation order (or newest first)."""
+		return self._registry.iter_records(newest_first=newest_first)
+	
+	def last_access(self, task_id: str) -> Optional[float]:
+		"""Epoch time of the last get_path for a task in this process, if any."""
+		return self._last_access.get(task_id)
+	
+	def total_image_bytes(self) -> int:
+		"""Total size of stored images according to the registry."""
+		return self._registry.statistics()["total_size"]
+	
+	def _task_artifacts(self, task_id: str, record: Optional[TaskRecord]) -> List[str]:
+		"""All files belonging to a task: image, metadata, profile and renditions."""
+		paths = []
+		if record is not None and record.path:
+			paths.append(record.path)
+		metadata = self.get_task_metadata(task_id)
+		if metadata:
+			for rendition in metadata.get("renditions", []):
+				if rendition.get("path"):
+					paths.append(rendition["path"])
+		for suffix in (".json", ".profile.txt", ".prof"):
+			path = self._existing_task_file(task_id, suffix)
+			if path:
+				paths.append(path)
+		return paths
+	
+	def delete_task(self, task_id: str) -> int:
+		"""Remove a task and all of its files; returns the number of bytes reclaimed."""
 		try:
-			now = datetime.now()
-			removed_count = 0
-			
-			for filename in os.listdir(self.base_dir):
-				if filename == "tasks.json":
+			record = self._registry.get(task_id)
+			metadata = self.get_task_metadata(task_id) or {}
+			reclaimed = 0
+			for path in self._task_artifacts(task_id, record):
+				try:
+					stat = os.stat(path)
+					os.remove(path)
+					# A hard link shared with other tasks frees nothing by itself
+					if stat.st_nlink <= 1:
+						reclaimed += stat.st_size
+				except FileNotFoundError:
 					continue
-					
-				filepath = os.path.join(self.base_dir, filename)
-				if os.path.isfile(filepath):
-					file_time = datetime.fromtimestamp(os.path.getmtime(filepath))
-					if (now - file_time).total_seconds() > max_age_hours * 3600:
-						# Remove from tasks registry
-						task_id = os.path.splitext(filename)[0]
-						if task_id in self._tasks:
-							del self._tasks[task_id]
-						
-						os.remove(filepath)
-						removed_count += 1
-			
-			if removed_count > 0:
-				self._save_tasks()
-			
-			return removed_count
+			if record is not None and metadata.get("content_sha256"):
+				reclaimed += self._release_blob(metadata["content_sha256"], record.format)
+			if self.storage.remote:
+				self._delete_published(task_id, record, metadata)
+			self._registry.delete(task_id)
+			self._last_access.pop(task_id, None)
+			return reclaimed
+			
+		except Exception as e:
+			error_details = {
+				"error": str(e),
+				"error_type": type(e).__name__,
+				"operation": "delete_task",
+				"task_id": task_id
+			}
+			raise ValueError(f"Failed to delete task: {json.dumps(error_details, ensure_ascii=False)}") from e
+	
+	def _delete_published(self, task_id: str, record: Optional[TaskRecord], metadata: Dict) -> None:
+		"""Delete a task's objects from the storage driver (blobs only when unreferenced)."""
+		self.storage.delete(self._storage_key(self._task_file(task_id, ".json")))
+		for rendition in metadata.get("renditions", []):
+			rendition_key = rendition.get("storage", {}).get("key")
+			if rendition_key:
+				self.storage.delete(rendition_key)
+		key = metadata.get("storage", {}).get("key")
+		if not key:
+			return
+		if key.startswith("blobs/") and record is not None:
+			if os.path.exists(self._blob_path(metadata["content_sha256"], record.format)):
+				return
+		self.storage.delete(key)
+	
+	def migrate_to_sharded_layout(self, batch_size: int = 1000) -> Dict[str, int]:
+		"""Move pre-sharding flat files into shard directories and record exact paths."""
+		try:
+			report = {"tasks": 0, "moved_files": 0, "missing_images": 0}
+			updated: List[TaskRecord] = []
+			
+			def flush() -> None:
+				if updated:
+					self._registry.add_many(updated)
+					updated.clear()
+			
+			for record in list(self.iter_task_records()):
+				task_id = record.task_id
+				moved = False
+				suffixes = [".json", ".profile.txt", ".prof"] + [f".{ext}" for ext in ["png", "jpg", "jpeg", "webp"]]
+				for suffix in suffixes:
+					flat_path = os.path.join(self.base_dir, f"{task_id}{suffix}")
+					if os.path.exists(flat_path):
+						os.replace(flat_path, self._task_file(task_id, suffix, create_dir=True))
+						report["moved_files"] += 1
+						moved = True
+				
+				image_path = self._task_file(task_id, f".{record.format}")
+				if not os.path.exists(image_path):
+					report["missing_images"] += 1
+				elif moved or record.path != image_path:
+					record.path = image_path
+					updated.append(record)
+					report["tasks"] += 1
+				if len(updated) >= batch_size:
+					flush()
+			flush()
+			return report
+			
+		except Exception as e:
+			error_details = {
+				"error": str(e),
+				"error_type": type(e).__name__,
+				"operation": "migrate_to_sharded_layout"
+			}
+			raise ValueError(f"Failed to migrate store layout: {json.dumps(error_details, ensure_ascii=False)}") from e
+	
+	def cleanup_old_files(self, max_age_hours: int = 24) -> int:
+		"""Remove tasks older than max_age_hours with all their files; returns tasks removed."""
+		from .retention import RetentionEngine, RetentionPolicy
+		
+		try:
+			report = RetentionEngine(self, RetentionPolicy(max_age_hours=max_age_hours)).run_once()
+			return report["expired_tasks"]
 			
 		except Exception as e:
 			error_details = {
@@ -0,0 +1,332 @@
+"""
+Supervision of external renderer processes (wkhtmltoimage, markdown-pdf,
+md-to-image).
+
+Every renderer runs in its own session / process group with resource
+limits applied to the child (``resource.prlimit`` right after spawning,
+so nothing runs between fork and exec in this multi-threaded server):
+
+* RLIMIT_DATA caps the heap.  RLIMIT_AS is not used because V8 and
+  WebKit reserve far more address space than they ever touch;
+* RLIMIT_CPU stops a renderer spinning in a layout loop (SIGXCPU at the
+  soft limit, SIGKILL a few seconds later);
+* RLIMIT_FSIZE stops a runaway output file.
+
+A wall-clock timeout covers everything else (a renderer blocked on the
+network, a font lookup or a dead pipe).  On timeout or cancellation the
+whole group is SIGKILLed and reaped, so no grandchild outlives the render,
+and the failure is raised as ``RendererProcessError`` with a ``reason``
+("timeout", "cancelled", "cpu_limit", "memory_limit", "output_limit",
+"killed" or "exit_status") that the render loop records on the task.
+
+A backend whose process had to be killed is suspended for
+``suspend_seconds``: the render loop skips it straight to the next backend
+instead of paying the timeout again on every render.
+
+Configuration:
+    WORD2IMG_RENDER_TIMEOUT          wall-clock seconds per renderer process (default 60)
+    WORD2IMG_RENDER_MEMORY_MB        heap limit per renderer process, 0 disables (default 2048)
+    WORD2IMG_RENDER_CPU_SECONDS      CPU-time limit, 0 disables (default: the wall-clock timeout)
+    WORD2IMG_RENDER_MAX_OUTPUT_MB    largest file a renderer may write, 0 disables (default 512)
+    WORD2IMG_RENDER_SUSPEND_SECONDS  skip a killed backend for this long, 0 disables (default 30)
+"""
+
+import asyncio
+import math
+import os
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .metrics import REGISTRY
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RENDER_TIMEOUT_ENV = "WORD2IMG_RENDER_TIMEOUT"
+RENDER_MEMORY_MB_ENV = "WORD2IMG_RENDER_MEMORY_MB"
+RENDER_CPU_SECONDS_ENV = "WORD2IMG_RENDER_CPU_SECONDS"
+RENDER_MAX_OUTPUT_MB_ENV = "WORD2IMG_RENDER_MAX_OUTPUT_MB"
+RENDER_SUSPEND_SECONDS_ENV = "WORD2IMG_RENDER_SUSPEND_SECONDS"
+
+# 软限制触发 SIGXCPU 后，再给这么多 CPU 秒才由内核 SIGKILL
+CPU_HARD_LIMIT_GRACE = 5
+# 被强制终止的原因：这些情况下暂停该后端
+KILL_REASONS = ("timeout", "cpu_limit", "memory_limit", "output_limit", "killed")
+_OOM_MARKERS = ("out of memory", "bad_alloc", "cannot allocate memory", "memoryerror", "allocation failed")
+
+RENDERER_TERMINATIONS_TOTAL = REGISTRY.counter(
+    "word2img_renderer_terminations_total",
+    "External renderer processes that failed, by backend and reason.", ["backend", "reason"])
+RENDERER_SKIPPED_TOTAL = REGISTRY.counter(
+    "word2img_renderer_skipped_total", "Render attempts skipped because the backend was suspended.", ["backend"])
+
+
+@dataclass
+class SupervisorPolicy:
+    """Limits applied to each external renderer process."""
+
+    timeout: float = 60.0
+    memory_mb: int = 2048
+    cpu_seconds: Optional[int] = None
+    max_output_mb: int = 512
+    suspend_seconds: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "SupervisorPolicy":
+        timeout = os.environ.get(RENDER_TIMEOUT_ENV)
+        memory_mb = os.environ.get(RENDER_MEMORY_MB_ENV)
+        cpu_seconds = os.environ.get(RENDER_CPU_SECONDS_ENV)
+        max_output_mb = os.environ.get(RENDER_MAX_OUTPUT_MB_ENV)
+        suspend_seconds = os.environ.get(RENDER_SUSPEND_SECONDS_ENV)
+        return cls(
+            timeout=float(timeout) if timeout else 60.0,
+            memory_mb=int(memory_mb) if memory_mb else 2048,
+            cpu_seconds=int(cpu_seconds) if cpu_seconds else None,
+            max_output_mb=int(max_output_mb) if max_output_mb else 512,
+            suspend_seconds=float(suspend_seconds) if suspend_seconds else 30.0
+        )
+
+    def rlimits(self) -> List[Tuple[int, int, int]]:
+        """(resource, soft, hard) triples for the child process."""
+        if resource is None:
+            return []
+        limits = []
+        if self.memory_mb > 0 and hasattr(resource, "RLIMIT_DATA"):
+            value = self.memory_mb * 1024 * 1024
+            limits.append((resource.RLIMIT_DATA, value, value))
+        cpu = math.ceil(self.timeout) if self.cpu_seconds is None else self.cpu_seconds
+        if cpu > 0:
+            limits.append((resource.RLIMIT_CPU, cpu, cpu + CPU_HARD_LIMIT_GRACE))
+        if self.max_output_mb > 0:
+            value = self.max_output_mb * 1024 * 1024
+            limits.append((resource.RLIMIT_FSIZE, value, value))
+        return limits
+
+
+class RendererProcessError(RuntimeError):
+    """An external renderer failed or had to be terminated; ``reason`` says why."""
+
+    def __init__(self, message: str, reason: str, returncode: Optional[int] = None,
+                 duration: float = 0.0) -> None:
+        super().__init__(message)
+        self.reason = reason
+        self.returncode = returncode
+        self.duration = duration
+
+
+def _kill_group(pid: int) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+def _decode(data: Optional[bytes]) -> str:
+    return (data or b"").decode("utf-8", "replace")
+
+
+class ProcessSupervisor:
+    """Runs renderer commands under the policy and remembers which backends to skip."""
+
+    def __init__(self, policy: SupervisorPolicy) -> None:
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._suspended_until: Dict[str, float] = {}
+        self._last_reason: Dict[str, str] = {}
+
+    # 子进程限制 -------------------------------------------------------------
+
+    def _popen_kwargs(self) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {"start_new_session": os.name == "posix"}
+        limits = self.policy.rlimits()
+        if limits and not hasattr(resource, "prlimit"):
+            # 没有 prlimit 的平台（macOS）只能在 exec 前设置
+            def preexec() -> None:
+                for which, soft, hard in limits:
+                    resource.setrlimit(which, (soft, hard))
+            kwargs["preexec_fn"] = preexec
+        return kwargs
+
+    def _limit(self, pid: int) -> None:
+        if resource is None or not hasattr(resource, "prlimit"):
+            return
+        for which, soft, hard in self.policy.rlimits():
+            try:
+                resource.prlimit(pid, which, (soft, hard))
+            except (ProcessLookupError, PermissionError, ValueError, OSError):
+                pass
+
+    # 运行 -------------------------------------------------------------------
+
+    def run(self, cmd: Sequence[str], backend: str, input: Optional[bytes] = None,
+            timeout: Optional[float] = None) -> Tuple[bytes, bytes]:
+        """Run ``cmd`` to completion under the limits; raises ``RendererProcessError``."""
+        timeout = self.policy.timeout if timeout is None else timeout
+        started = time.monotonic()
+        proc = subprocess.Popen(
+            list(cmd),
+            stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **self._popen_kwargs()
+        )
+        self._limit(proc.pid)
+        try:
+            stdout, stderr = proc.communicate(input, timeout=timeout)
+        except BaseException as e:
+            _kill_group(proc.pid)
+            # 只等待子进程本身退出；不再读管道，逃逸的孙进程不会拖住这里
+            proc.wait()
+            for stream in (proc.stdin, proc.stdout, proc.stderr):
+                if stream is not None:
+                    stream.close()
+            if isinstance(e, subprocess.TimeoutExpired):
+                raise self._terminated(backend, "timeout", proc.returncode, b"",
+                                       time.monotonic() - started) from None
+            self._terminated(backend, "cancelled", proc.returncode, b"", time.monotonic() - started)
+            raise
+        # 渲染器退出后残留在进程组里的子进程一并清理
+        _kill_group(proc.pid)
+        if proc.returncode != 0:
+            raise self._terminated(backend, None, proc.returncode, stderr, time.monotonic() - started)
+        return stdout, stderr
+
+    async def run_async(self, cmd: Sequence[str], backend: str, input: Optional[bytes] = None,
+                        timeout: Optional[float] = None) -> Tuple[bytes, bytes]:
+        """Async ``run``: the process group is killed and reaped when the awaiting task is cancelled."""
+        timeout = self.policy.timeout if timeout is None else timeout
+        started = time.monotonic()
+        try:
+            stdout, stderr, returncode = await self._communicate(cmd, timeout, input)
+        except TimeoutError:
+            raise self._terminated(backend, "timeout", None, b"", time.monotonic() - started) from None
+        except asyncio.CancelledError:
+            self._terminated(backend, "cancelled", None, b"", time.monotonic() - started)
+            raise
+        if returncode != 0:
+            raise self._terminated(backend, None, returncode, stderr, time.monotonic() - started)
+        return stdout, stderr
+
+    async def _communicate(self, cmd: Sequence[str], timeout: float,
+                           input: Optional[bytes]) -> Tuple[bytes, bytes, int]:
+        kwargs = self._popen_kwargs()
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            **kwargs
+        )
+        self._limit(proc.pid)
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(input), timeout)
+        except BaseException:
+            _kill_group(proc.pid)
+            # 回收子进程避免僵尸进程；再次取消也不打断回收
+            await asyncio.shield(proc.wait())
+            raise
+        _kill_group(proc.pid)
+        return stdout, stderr, proc.returncode
+
+    # 终止原因与后端暂停 -------------------------------------------------------
+
+    def _classify(self, returncode: Optional[int], stderr: str) -> str:
+        if returncode is not None and returncode < 0:
+            signum = -returncode
+            if signum == getattr(signal, "SIGXCPU", None):
+                return "cpu_limit"
+            if signum == getattr(signal, "SIGXFSZ", None):
+                return "output_limit"
+            if signum == getattr(signal, "SIGKILL", None):
+                # 未经本进程终止的 SIGKILL：RLIMIT_CPU 硬限制或系统 OOM killer
+                return "killed"
+        if self.policy.memory_mb > 0 and any(marker in stderr.lower() for marker in _OOM_MARKERS):
+            return "memory_limit"
+        if returncode is not None and returncode < 0 and -returncode in (signal.SIGSEGV, signal.SIGABRT) \
+                and self.policy.memory_mb > 0:
+            # 堆分配失败的进程常以 abort/段错误退出
+            return "memory_limit"
+        return "exit_status"
+
+    def _terminated(self, backend: str, reason: Optional[str], returncode: Optional[int], stderr: bytes,
+                    duration: float) -> RendererProcessError:
+        text = _decode(stderr).strip()
+        reason = reason or self._classify(returncode, text)
+        RENDERER_TERMINATIONS_TOTAL.inc(backend=backend, reason=reason)
+        with self._lock:
+            self._last_reason[backend] = reason
+            if reason in KILL_REASONS and self.policy.suspend_seconds > 0:
+                self._suspended_until[backend] = time.monotonic() + self.policy.suspend_seconds
+        if reason == "timeout":
+            message = f"渲染超时（{self.policy.timeout:g}s），进程组已终止"
+        elif reason == "cancelled":
+            message = "渲染已取消，进程组已终止"
+        elif reason == "exit_status":
+            message = f"CLI执行失败: {text[-2000:]}"
+        else:
+            message = f"渲染进程因资源限制被终止（{reason}，退出码 {returncode}）: {text[-500:]}"
+        return RendererProcessError(message, reason, returncode, duration)
+
+    def suspended(self, backend: str) -> float:
+        """Seconds until ``backend`` may be tried again (0 when it is not suspended)."""
+        with self._lock:
+            until = self._suspended_until.get(backend)
+            if until is None:
+                return 0.0
+            remaining = until - time.monotonic()
+            if remaining <= 0:
+                del self._suspended_until[backend]
+                return 0.0
+            return remaining
+
+    def skip(self, backend: str) -> Optional[RendererProcessError]:
+        """The error to record if ``backend`` is suspended, else None."""
+        remaining = self.suspended(backend)
+        if not remaining:
+            return None
+        RENDERER_SKIPPED_TOTAL.inc(backend=backend)
+        with self._lock:
+            last = self._last_reason.get(backend, "")
+        return RendererProcessError(f"后端已暂停 {remaining:.0f}s（上次: {last}）", "suspended")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            suspended = {backend: round(until - now, 1)
+                         for backend, until in self._suspended_until.items() if until > now}
+            last = dict(self._last_reason)
+        return {
+            "timeout_seconds": self.policy.timeout,
+            "memory_mb": self.policy.memory_mb,
+            "cpu_seconds": math.ceil(self.policy.timeout) if self.policy.cpu_seconds is None
+            else self.policy.cpu_seconds,
+            "max_output_mb": self.policy.max_output_mb,
+            "suspended_backends": suspended,
+            "last_failure_reason": last,
+        }
+
+
+SUPERVISOR = ProcessSupervisor(SupervisorPolicy.from_env())
+
+
+async def run_subprocess(cmd: Sequence[str], timeout: float,
+                         input: Optional[bytes] = None) -> Tuple[bytes, bytes]:
+    """Run ``cmd`` in its own process group under the default limits; kill and reap the
+    group on timeout or cancellation.
+
+    Raises ``subprocess.CalledProcessError`` on a non-zero exit and
+    ``TimeoutError`` when ``timeout`` expires.
+    """
+    stdout, stderr, returncode = await SUPERVISOR._communicate(cmd, timeout, input)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, list(cmd), stdout, stderr)
+    return stdout, stderr
@@ -0,0 +1,185 @@
+"""
+Table layout for the PIL backend.
+
+A table is laid out in one pass over its cells:
+
+* every distinct character in the table is measured once per font and kept
+  in that font's ``GlyphMetrics`` (see text_layout.py), so cell and word
+  widths are sums of cached advances instead of one ``textbbox`` call per
+  cell;
+* column widths follow the CSS automatic table layout: each column gets at
+  least its min-content width (its longest unbreakable word) and the space
+  left over is shared in proportion to how much each column would need to
+  reach its max-content width (its longest cell on one line).  A column's
+  min-content width is capped at an even share of the table, so one long
+  word (a URL, an identifier) is broken between characters instead of
+  squeezing every other column;
+* cell text is wrapped at word boundaries (CJK text between any two
+  characters) and each row is as tall as its tallest cell.
+
+The result is a ``TableLayout``: text runs grouped by row with positions
+relative to the table origin, so drawing is a flat loop that skips rows
+outside the canvas (or the band being redrawn).
+"""
+
+import math
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Any, List, Optional, Sequence, Tuple
+
+from .text_layout import GlyphMetrics, break_tokens, glyph_metrics
+
+# 列间距与单元格上下留白，与原先的表格样式一致
+COLUMN_GAP = 20
+ROW_PADDING = 10
+# 单元格内换行时的行间距
+LINE_GAP = 4
+
+
+@dataclass(frozen=True)
+class TableLayout:
+    """A laid-out table; run and row positions are relative to the table origin."""
+
+    width: int
+    height: int
+    col_widths: Tuple[int, ...]
+    row_tops: Tuple[int, ...]
+    row_heights: Tuple[int, ...]
+    # 每行的文字片段 (x, y, text)；第 0 行为表头，用粗体绘制
+    row_runs: Tuple[Tuple[Tuple[int, int, str], ...], ...]
+    line_advance: int
+    wrapped_cells: int = 0
+
+    def visible_rows(self, top: int, bottom: int) -> range:
+        """Indices of rows overlapping [top, bottom) in table coordinates."""
+        first = max(0, bisect_right(self.row_tops, top) - 1)
+        last = bisect_right(self.row_tops, bottom)
+        return range(first, min(last, len(self.row_tops)))
+
+
+def _column_widths(min_widths: List[float], max_widths: List[float], available: float) -> List[int]:
+    """CSS auto-layout column widths for ``available`` pixels of content."""
+    total_max = sum(max_widths)
+    if total_max <= available:
+        return [math.ceil(w) for w in max_widths]
+    # 超长的词最多占平均列宽，超出部分在字符之间断开
+    share = available / len(min_widths)
+    min_widths = [min(w, share) for w in min_widths]
+    # 先满足最小宽度，剩余空间按各列到最大宽度的差值分配
+    spare = available - sum(min_widths)
+    growth = total_max - sum(min_widths)
+    return [max(1, int(lo + (hi - lo) * spare / growth)) for lo, hi in zip(min_widths, max_widths)]
+
+
+def _wrap(tokens: List[str], metrics: GlyphMetrics, limit: float) -> List[str]:
+    """Greedy line breaking of pre-split ``tokens`` into lines at most ``limit`` wide."""
+    lines: List[str] = []
+    line = ""
+    line_width = 0.0
+    for token in tokens:
+        width = metrics.width(token)
+        if token.isspace():
+            if line:
+                line += token
+                line_width += width
+            continue
+        if line and line_width + width > limit:
+            lines.append(line.rstrip())
+            line, line_width = "", 0.0
+        if not line and width > limit:
+            # 单个词比列还宽：在字符之间断开
+            for ch in token:
+                ch_width = metrics.advances[ch]
+                if line and line_width + ch_width > limit:
+                    lines.append(line)
+                    line, line_width = "", 0.0
+                line += ch
+                line_width += ch_width
+            continue
+        line += token
+        line_width += width
+    if line.strip():
+        lines.append(line.rstrip())
+    return lines or [""]
+
+
+def layout_table(rows: Sequence[Sequence[str]], font, header_font, max_width: int) -> Optional[TableLayout]:
+    """Lay out ``rows`` (the first one is the header) within ``max_width`` pixels."""
+    if not rows:
+        return None
+    col_count = max(len(row) for row in rows)
+    if col_count == 0:
+        return None
+    body = glyph_metrics(font)
+    header = glyph_metrics(header_font)
+    header.prepare(rows[0])
+    body.prepare([cell for row in rows[1:] for cell in row])
+
+    # 所有单元格只切分、测量一次
+    min_widths = [0.0] * col_count
+    max_widths = [0.0] * col_count
+    cells: List[List[Tuple[List[str], str, float]]] = []
+    for row_index, row in enumerate(rows):
+        metrics = header if row_index == 0 else body
+        measured = []
+        for col, text in enumerate(row):
+            text = text.strip()
+            tokens = break_tokens(text)
+            full = metrics.width(text)
+            longest = max((metrics.width(t) for t in tokens if not t.isspace()), default=0.0)
+            if full > max_widths[col]:
+                max_widths[col] = full
+            if longest > min_widths[col]:
+                min_widths[col] = longest
+            measured.append((tokens, text, full))
+        cells.append(measured)
+
+    available = max(col_count, max_width - COLUMN_GAP * (col_count - 1))
+    col_widths = _column_widths(min_widths, max_widths, available)
+    col_x = [0] * col_count
+    for col in range(1, col_count):
+        col_x[col] = col_x[col - 1] + col_widths[col - 1] + COLUMN_GAP
+
+    line_height = max(body.line_height, header.line_height)
+    line_advance = line_height + LINE_GAP
+    row_tops: List[int] = []
+    row_heights: List[int] = []
+    row_runs: List[Tuple[Tuple[int, int, str], ...]] = []
+    wrapped_cells = 0
+    y = 0
+    for row_index, measured in enumerate(cells):
+        metrics = header if row_index == 0 else body
+        runs = []
+        row_lines = 1
+        for col, (tokens, text, full) in enumerate(measured):
+            if full <= col_widths[col]:
+                lines = [text]
+            else:
+                lines = _wrap(tokens, metrics, col_widths[col])
+                wrapped_cells += 1
+            row_lines = max(row_lines, len(lines))
+            for line_index, line in enumerate(lines):
+                if line:
+                    runs.append((col_x[col], y + line_index * line_advance, line))
+        height = row_lines * line_advance - LINE_GAP + ROW_PADDING
+        row_tops.append(y)
+        row_heights.append(height)
+        row_runs.append(tuple(runs))
+        y += height
+
+    return TableLayout(
+        width=col_x[-1] + col_widths[-1], height=y, col_widths=tuple(col_widths),
+        row_tops=tuple(row_tops), row_heights=tuple(row_heights), row_runs=tuple(row_runs),
+        line_advance=line_advance, wrapped_cells=wrapped_cells)
+
+
+def draw_table(draw, table: TableLayout, x: int, y: int, font, header_font,
+               color: Any, header_color: Any = None) -> None:
+    """Draw ``table`` with its origin at (``x``, ``y``), skipping rows outside the canvas."""
+    canvas_height = draw.im.size[1]
+    text = draw.text
+    header_fill = header_color or color
+    for row_index in table.visible_rows(-y, canvas_height - y):
+        row_font, fill = (header_font, header_fill) if row_index == 0 else (font, color)
+        for run_x, run_y, line in table.row_runs[row_index]:
+            text((x + run_x, y + run_y), line, fill=fill, font=row_font)
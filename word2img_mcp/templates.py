@@ -0,0 +1,296 @@
+"""
+Pre-laid-out Markdown templates.
+
+A template is Markdown with ``{{ name }}`` placeholders plus fixed
+RenderOptions.  Registration does the per-template work once:
+
+* the Markdown is parsed into segments and each segment is marked static
+  or dynamic (contains a placeholder);
+* for the PIL backend, everything above the first dynamic segment is drawn
+  once onto a cached base canvas, and the block layout of static segments
+  is cached;
+* for the imgkit backend, the Markdown is converted to a complete HTML
+  document (theme CSS included) with placeholder tokens left in it.
+
+Rendering a variant then only substitutes values: PIL copies the base
+canvas and draws from the first dynamic segment down, imgkit fills the
+prepared HTML and runs wkhtmltoimage.  Values are inserted as plain text
+(HTML-escaped for imgkit; newlines become spaces), never as Markdown.
+
+The MCP server calls ``render_async``: wkhtmltoimage runs as a supervised
+asyncio subprocess (supervisor.py) and the PIL path in the thread pool, so
+a template render neither blocks the event loop nor outlives a cancelled
+request.
+"""
+
+import asyncio
+import html
+import os
+import re
+import sys
+import threading
+import uuid
+from collections import ChainMap
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Hashable, List, Optional, Tuple
+
+from .layout import BlockLayout
+from .metrics import (
+    RENDER_BACKEND_FAILURES_TOTAL,
+    RENDER_DURATION_SECONDS,
+    RENDER_FAILURES_TOTAL,
+    RENDER_FALLBACKS_TOTAL,
+    RENDERS_TOTAL,
+)
+from .render import IMGKIT_AVAILABLE, PIL_AVAILABLE, MarkdownRenderer, RenderOptions
+from .supervisor import SUPERVISOR
+from .timing import StageTimer
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+# 模板渲染只使用可预处理的后端
+TEMPLATE_BACKENDS = ("imgkit-wkhtmltopdf", "pil-fallback")
+
+
+def _plain(value: Any) -> str:
+    return " ".join(str(value).split())
+
+
+class MarkdownTemplate:
+    """One registered template and its precomputed render state."""
+
+    def __init__(self, name: str, markdown_text: str, options: RenderOptions) -> None:
+        self.name = name
+        self.markdown_text = markdown_text
+        self.options = options
+        self.variables = sorted(set(PLACEHOLDER.findall(markdown_text)))
+        self.created_at = datetime.now().isoformat()
+        self.render_count = 0
+        self._renderer = MarkdownRenderer()
+
+        self._segments = self._renderer._parse_markdown(markdown_text)
+        self._first_dynamic = next(
+            (i for i, segment in enumerate(self._segments) if self._is_dynamic(segment)), len(self._segments))
+        self._layout_cache: Dict[Hashable, BlockLayout] = {}
+        self._base_canvas: Optional["Image.Image"] = None
+        self._base_offset = 0
+        self._html_shell: Optional[str] = None
+        self._html_tokens: Dict[str, str] = {}
+
+        if PIL_AVAILABLE:
+            self._prepare_pil()
+        if IMGKIT_AVAILABLE:
+            self._prepare_html()
+
+    @staticmethod
+    def _is_dynamic(segment: Dict) -> bool:
+        if segment["kind"] == "table":
+            return any(PLACEHOLDER.search(cell) for row in segment["table_data"] for cell in row)
+        return bool(PLACEHOLDER.search(segment.get("text", "")))
+
+    def _prepare_pil(self) -> None:
+        # 第一个动态段落之前的内容只绘制一次
+        canvas, draw = self._renderer._new_pil_canvas(self.options)
+        self._base_offset = self._renderer._draw_pil_segments(
+            draw, self._segments[:self._first_dynamic], self.options,
+            self._renderer._pil_top_offset(self.options), self._layout_cache)
+        self._base_canvas = canvas
+        # 预先计算其余静态段落的布局（动态段落的布局随后丢弃）
+        static_tail = [segment for segment in self._segments[self._first_dynamic:] if not self._is_dynamic(segment)]
+        self._renderer._layout_pil_segments(static_tail, self.options, self._base_offset, self._layout_cache)
+
+    def _prepare_html(self) -> None:
+        # 占位符先换成不含 Markdown 语法字符的令牌，转换后再定位
+        tokens = {name: f"W2ITPL{uuid.uuid4().hex}" for name in self.variables}
+        tokenized = PLACEHOLDER.sub(lambda match: tokens[match.group(1)], self.markdown_text)
+        self._html_shell = self._renderer._markdown_to_html(tokenized, self.options)
+        self._html_tokens = tokens
+
+    def substitute(self, values: Dict[str, Any]) -> str:
+        """The Markdown this variant corresponds to."""
+        return PLACEHOLDER.sub(lambda match: _plain(values[match.group(1)]), self.markdown_text)
+
+    def _check_values(self, values: Dict[str, Any]) -> None:
+        missing = [name for name in self.variables if name not in values]
+        if missing:
+            raise ValueError(f"模板 {self.name} 缺少变量: {missing}")
+
+    def _fill_segment(self, segment: Dict, values: Dict[str, Any]) -> Dict:
+        fill = lambda text: PLACEHOLDER.sub(lambda match: _plain(values[match.group(1)]), text)
+        if segment["kind"] == "table":
+            return {**segment, "table_data": [[fill(cell) for cell in row] for row in segment["table_data"]]}
+        filled = {**segment, "text": fill(segment["text"])}
+        if "runs" in segment:
+            filled["runs"] = tuple((fill(text), flags) for text, flags in segment["runs"])
+        return filled
+
+    def render_pil(self, values: Dict[str, Any]) -> "Image.Image":
+        canvas = self._base_canvas.copy()
+        from PIL import ImageDraw
+
+        draw = ImageDraw.Draw(canvas)
+        tail = [
+            self._fill_segment(segment, values) if self._is_dynamic(segment) else segment
+            for segment in self._segments[self._first_dynamic:]
+        ]
+        # 静态段落的布局在注册时已缓存且只读；本次变量值的布局写入临时层，不累积
+        layout_cache = ChainMap({}, self._layout_cache)
+        self._renderer._draw_pil_segments(draw, tail, self.options, self._base_offset, layout_cache)
+        self._renderer._draw_pil_watermark(draw, self.options)
+        return canvas
+
+    def _fill_html(self, values: Dict[str, Any]) -> str:
+        document = self._html_shell
+        for name, token in self._html_tokens.items():
+            document = document.replace(token, html.escape(_plain(values[name])))
+        return document
+
+    @staticmethod
+    def _load_and_remove(path: str) -> "Image.Image":
+        from PIL import Image
+
+        try:
+            with Image.open(path) as img:
+                img.load()
+                return img.copy()
+        finally:
+            os.remove(path)
+
+    def render_imgkit(self, values: Dict[str, Any]) -> "Image.Image":
+        path = self._renderer._render_html_with_imgkit(self._fill_html(values), self.options)
+        return self._load_and_remove(path)
+
+    async def render_imgkit_async(self, values: Dict[str, Any]) -> "Image.Image":
+        """wkhtmltoimage as a supervised asyncio subprocess: cancelling the render kills it."""
+        output_file = self._renderer._output_file("template", self.options.output_format)
+        cmd = self._renderer._wkhtmltoimage_command(output_file, self.options)
+        try:
+            await SUPERVISOR.run_async(cmd, "imgkit-wkhtmltopdf", self._fill_html(values).encode("utf-8"))
+        except BaseException:
+            if output_file.exists():
+                os.remove(output_file)
+            raise
+        if not output_file.exists():
+            raise RuntimeError("图片文件未生成")
+        return await asyncio.to_thread(self._load_and_remove, str(output_file))
+
+    def _ready_backends(self) -> List[str]:
+        # 沿用渲染器的后端优先级，只取支持模板预处理且已准备好的后端
+        ready = {"imgkit-wkhtmltopdf": self._html_shell is not None, "pil-fallback": self._base_canvas is not None}
+        return [name for name in self._renderer.backends if ready.get(name)]
+
+    def render(self, values: Dict[str, Any], timer: Optional[StageTimer] = None) -> Tuple["Image.Image", str]:
+        """Render a variant; returns the image and the backend that produced it (blocking)."""
+        self._check_values(values)
+        timer = timer or StageTimer()
+        failed_attempts = 0
+        for backend in self._ready_backends():
+            if self._skip(backend):
+                continue
+            try:
+                with timer.stage(f"render.template.{backend}", backend=backend, template=self.name) as attempt:
+                    if backend == "imgkit-wkhtmltopdf":
+                        image = self.render_imgkit(values)
+                    else:
+                        image = self.render_pil(values)
+            except Exception as e:
+                failed_attempts += 1
+                self._record_failure(backend, e)
+                continue
+            self._record_success(backend, attempt, failed_attempts)
+            return image, backend
+        RENDER_FAILURES_TOTAL.inc()
+        raise RuntimeError(f"模板 {self.name} 所有渲染后端都失败了")
+
+    async def render_async(self, values: Dict[str, Any], timer: Optional[StageTimer] = None) -> Tuple["Image.Image", str]:
+        """Async ``render``: wkhtmltoimage runs under the process supervisor, PIL in the thread pool.
+
+        Cancellation propagates instead of falling back to the next backend.
+        """
+        self._check_values(values)
+        timer = timer or StageTimer()
+        failed_attempts = 0
+        for backend in self._ready_backends():
+            if self._skip(backend):
+                continue
+            try:
+                with timer.stage(f"render.template.{backend}", backend=backend, template=self.name) as attempt:
+                    if backend == "imgkit-wkhtmltopdf":
+                        image = await self.render_imgkit_async(values)
+                    else:
+                        image = await asyncio.to_thread(self.render_pil, values)
+            except Exception as e:
+                failed_attempts += 1
+                self._record_failure(backend, e)
+                continue
+            self._record_success(backend, attempt, failed_attempts)
+            return image, backend
+        RENDER_FAILURES_TOTAL.inc()
+        raise RuntimeError(f"模板 {self.name} 所有渲染后端都失败了")
+
+    @staticmethod
+    def _skip(backend: str) -> bool:
+        # 刚被强制终止过的后端暂停期间直接跳过
+        return SUPERVISOR.skip(backend) is not None
+
+    def _record_success(self, backend: str, attempt: Dict[str, Any], failed_attempts: int) -> None:
+        RENDERS_TOTAL.inc(backend=backend)
+        RENDER_DURATION_SECONDS.observe(attempt["duration_ms"] / 1000, backend=backend)
+        if failed_attempts:
+            RENDER_FALLBACKS_TOTAL.inc()
+        self.render_count += 1
+
+    def _record_failure(self, backend: str, error: Exception) -> None:
+        RENDER_BACKEND_FAILURES_TOTAL.inc(backend=backend)
+        print(f"⚠️  模板 {self.name} 使用 {backend} 渲染失败: {error}", file=sys.stderr)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "variables": self.variables,
+            "created_at": self.created_at,
+            "render_count": self.render_count,
+            "theme": self.options.theme,
+            "image_size": f"{self.options.width}x{self.options.height}",
+            "static_prefix_segments": self._first_dynamic,
+            "total_segments": len(self._segments),
+            "backends": [
+                backend for backend, ready in (
+                    ("imgkit-wkhtmltopdf", self._html_shell is not None),
+                    ("pil-fallback", self._base_canvas is not None),
+                ) if ready
+            ]
+        }
+
+
+class TemplateRegistry:
+    """Templates registered in this process, by name."""
+
+    def __init__(self) -> None:
+        self._templates: Dict[str, MarkdownTemplate] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, markdown_text: str, options: Optional[RenderOptions] = None) -> MarkdownTemplate:
+        template = MarkdownTemplate(name, markdown_text, options or RenderOptions())
+        with self._lock:
+            self._templates[name] = template
+        return template
+
+    def get(self, name: str) -> MarkdownTemplate:
+        template = self._templates.get(name)
+        if template is None:
+            raise ValueError(f"模板不存在: {name}")
+        return template
+
+    def remove(self, name: str) -> bool:
+        with self._lock:
+            return self._templates.pop(name, None) is not None
+
+    def describe(self) -> List[Dict[str, Any]]:
+        return [template.describe() for template in list(self._templates.values())]
+
+
+TEMPLATES = TemplateRegistry()
@@ -0,0 +1,165 @@
+"""
+Text measurement and line breaking for the PIL backend.
+
+``GlyphMetrics`` caches the advance width of every character measured in a
+font, so the width of a word is a sum of dictionary lookups rather than a
+``textbbox`` call.  Fonts are themselves cached per size and style, so the
+metrics live as long as the process.
+
+``break_runs`` lays out styled inline runs (``(text, flags)`` pairs from
+document.py) greedily into lines.  Text is split at whitespace, and between
+any two CJK characters; a word wider than the line is broken between
+characters.  Each line comes back as positioned pieces with consecutive
+same-style words merged, so drawing a line takes one ``draw.text`` call per
+style change rather than per word.
+"""
+
+import re
+import threading
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+from weakref import WeakKeyDictionary
+
+# 中日韩文字、全角符号可在任意两个字符之间断行，其余文字在空白处断行
+_CJK = "⺀-鿿가-힯豈-﫿︰-﹏＀-￯"
+_TOKEN = re.compile(rf"\s+|[{_CJK}]|[^\s{_CJK}]+")
+_CJK_CHAR = re.compile(f"[{_CJK}]")
+
+# 一行中的一个片段：(相对行首的 x, 文本, 样式标记, 宽度)
+Piece = Tuple[int, str, str, int]
+
+
+def break_tokens(text: str) -> List[str]:
+    """Split ``text`` into the units lines may break between (words, CJK characters, whitespace)."""
+    return _TOKEN.findall(text)
+
+
+class GlyphMetrics:
+    """Advance widths of the characters seen so far in one font."""
+
+    def __init__(self, font) -> None:
+        self.font = font
+        self.advances: Dict[str, float] = {}
+        bbox = font.getbbox("Hg")
+        self.line_height = bbox[3] - bbox[1]
+        try:
+            self.ascent = font.getmetrics()[0]
+        except Exception:
+            self.ascent = self.line_height
+
+    def prepare(self, texts: Sequence[str]) -> None:
+        """Measure every character of ``texts`` not measured yet."""
+        missing = set("".join(texts)).difference(self.advances)
+        for ch in missing:
+            self.advances[ch] = self._advance(ch)
+
+    def width(self, text: str) -> float:
+        advances = self.advances
+        try:
+            return sum(map(advances.__getitem__, text))
+        except KeyError:
+            self.prepare((text,))
+            return sum(map(advances.__getitem__, text))
+
+    def _advance(self, ch: str) -> float:
+        try:
+            return self.font.getlength(ch)
+        except Exception:
+            # 旧版 Pillow 或位图字体没有 getlength
+            bbox = self.font.getbbox(ch)
+            return bbox[2] - bbox[0]
+
+
+_METRICS: "WeakKeyDictionary[Any, GlyphMetrics]" = WeakKeyDictionary()
+_METRICS_LOCK = threading.Lock()
+
+
+def glyph_metrics(font) -> GlyphMetrics:
+    """The shared ``GlyphMetrics`` of ``font`` (fonts are cached per size/style, so this is too)."""
+    metrics = _METRICS.get(font)
+    if metrics is None:
+        with _METRICS_LOCK:
+            metrics = _METRICS.get(font)
+            if metrics is None:
+                metrics = _METRICS[font] = GlyphMetrics(font)
+    return metrics
+
+
+def break_runs(runs: Sequence[Tuple[str, str]], metrics_for: Callable[[str], GlyphMetrics],
+               max_width: float) -> List[List[Piece]]:
+    """Greedy line breaking of styled ``runs`` into lines at most ``max_width`` wide.
+
+    ``metrics_for(flags)`` returns the metrics of the font a run with those
+    style flags is drawn in.  A ``"\\n"`` in a run forces a line break.
+    """
+    lines: List[List[Piece]] = []
+    line: List[List[Any]] = []  # [x, text, flags, width]，宽度为浮点，结束时取整
+    x = 0.0
+
+    def finish() -> None:
+        # 去掉行尾空白
+        while line and line[-1][1].isspace():
+            line.pop()
+        if line and line[-1][1] != line[-1][1].rstrip():
+            last = line[-1]
+            last[1] = last[1].rstrip()
+            last[3] = metrics_for(last[2]).width(last[1])
+        lines.append([(int(round(px)), text, flags, int(round(width))) for px, text, flags, width in line])
+
+    def put(token: str, flags: str, width: float) -> None:
+        nonlocal x
+        if line and line[-1][2] == flags:
+            line[-1][1] += token
+            line[-1][3] += width
+        else:
+            line.append([x, token, flags, width])
+        x += width
+
+    for text, flags in runs:
+        metrics = metrics_for(flags)
+        for index, part in enumerate(text.split("\n")):
+            if index:
+                finish()
+                line, x = [], 0.0
+            for token in _TOKEN.findall(part):
+                width = metrics.width(token)
+                if token.isspace():
+                    if line:
+                        put(" ", flags, metrics.width(" "))
+                    continue
+                if line and x + width > max_width:
+                    finish()
+                    line, x = [], 0.0
+                if not line and width > max_width:
+                    # 单个词比整行还宽：在字符之间断开
+                    for ch in token:
+                        ch_width = metrics.advances[ch]
+                        if line and x + ch_width > max_width:
+                            finish()
+                            line, x = [], 0.0
+                        put(ch, flags, ch_width)
+                    continue
+                put(token, flags, width)
+    if line or not lines:
+        finish()
+    return lines
+
+
+def break_text(text: str, metrics: GlyphMetrics, max_width: float) -> List[str]:
+    """Break preformatted ``text`` (code) at ``max_width``, keeping all whitespace."""
+    lines: List[str] = []
+    for source_line in text.expandtabs(4).split("\n"):
+        metrics.prepare((source_line,))
+        line, width = "", 0.0
+        for ch in source_line:
+            ch_width = metrics.advances[ch]
+            if line and width + ch_width > max_width:
+                lines.append(line)
+                line, width = "", 0.0
+            line += ch
+            width += ch_width
+        lines.append(line)
+    return lines
+
+
+def has_cjk(text: str) -> bool:
+    return _CJK_CHAR.search(text) is not None
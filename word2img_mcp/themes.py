@@ -0,0 +1,351 @@
+"""
+Theme registry shared by all render backends.
+
+A theme fixes the look of a card: colours, fonts, sizes and spacing.  Each
+theme is compiled once into a CSS bundle (imgkit) and a PIL style table, so
+a render only appends a few lines of page-geometry CSS.  Per-request style
+overrides (e.g. a custom ``accent_color``) compile a variant on first use and
+hit the cache afterwards.
+
+Built-in themes: default, light, dark, professional, casual.  Additional
+themes are loaded from JSON files listed in WORD2IMG_THEME_PATH (files or
+directories, separated by ``os.pathsep``)::
+
+    {
+        "name": "brand",
+        "extends": "light",
+        "description": "Company card",
+        "accent_color": "#D81B60",
+        "heading_color": "#880E4F"
+    }
+"""
+
+import functools
+import json
+import os
+import re
+import threading
+from dataclasses import asdict, dataclass, fields, replace
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from .metrics import track_lru_cache
+
+if TYPE_CHECKING:
+    from .render import RenderOptions
+
+THEME_PATH_ENV = "WORD2IMG_THEME_PATH"
+
+# 标题字号 = font_size * header_scale * 系数（h1..h6），CSS 与 PIL 共用
+HEADING_FACTORS = (2.0, 1.7, 1.4, 1.2, 1.1, 1.0)
+
+_HEX_COLOR = re.compile(r"^#([0-9a-fA-F]{3}|[0-9a-fA-F]{6})$")
+_RGBA_COLOR = re.compile(r"^rgba?\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*(?:,\s*([\d.]+)\s*)?\)$")
+
+
+@dataclass(frozen=True)
+class ThemeStyle:
+    """Everything about a card's look except its page geometry and alignment.
+
+    Optional colours (``None``) are derived from the main three at compile time.
+    """
+
+    background_color: str = "#FFFFFF"
+    text_color: str = "#000000"
+    accent_color: str = "#4682B4"
+    font_family: str = "Microsoft YaHei, PingFang SC, Helvetica Neue, Arial, sans-serif"
+    font_size: int = 20
+    line_height: float = 1.6
+    header_scale: float = 1.5
+    shadow: bool = True
+    heading_color: Optional[str] = None
+    strong_color: Optional[str] = None
+    code_background: str = "rgba(0, 0, 0, 0.1)"
+    table_header_text: Optional[str] = None
+
+
+# RenderOptions 中可被主题提供默认值的字段
+OPTION_FIELDS = (
+    "background_color", "text_color", "accent_color", "font_family",
+    "font_size", "line_height", "header_scale", "shadow",
+)
+
+
+@dataclass(frozen=True)
+class PilStyle:
+    """Precomputed drawing parameters for the PIL backend."""
+
+    background: str
+    text: str
+    accent: str
+    heading: str
+    strong: str
+    body_size: int
+    heading_sizes: Tuple[int, ...]
+    line_height: float
+    paragraph_spacing: int
+    table_header: str
+    shadow: Optional[Tuple[int, int, int]]
+    # 半透明的 CSS 背景色预先与页面背景混合成不透明色
+    code_background: Tuple[int, int, int] = (230, 230, 230)
+    quote_background: Tuple[int, int, int] = (240, 240, 240)
+
+
+@dataclass(frozen=True)
+class Theme:
+    name: str
+    description: str
+    style: ThemeStyle
+    css: str
+    pil: PilStyle
+
+    def option_defaults(self) -> Dict[str, Any]:
+        """RenderOptions values this theme supplies when a request leaves them unset."""
+        return {name: getattr(self.style, name) for name in OPTION_FIELDS}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "description": self.description, **asdict(self.style)}
+
+
+BUILTIN_THEMES: Dict[str, Tuple[str, ThemeStyle]] = {
+    "default": ("白底黑字，钢蓝色强调", ThemeStyle()),
+    "light": ("浅灰底深灰字，无阴影", ThemeStyle(
+        background_color="#FAFAFA", text_color="#333333", accent_color="#1E88E5", shadow=False,
+        code_background="rgba(30, 136, 229, 0.08)")),
+    "dark": ("深色背景", ThemeStyle(
+        background_color="#1E1E1E", text_color="#E6E6E6", accent_color="#64B5F6", shadow=False,
+        strong_color="#FFFFFF", code_background="rgba(255, 255, 255, 0.12)",
+        table_header_text="#1E1E1E")),
+    "professional": ("商务风格：深蓝标题，衬线字体", ThemeStyle(
+        text_color="#222222", accent_color="#1F3A5F", shadow=False,
+        font_family="Source Han Serif SC, SimSun, Georgia, Times New Roman, serif",
+        line_height=1.7, header_scale=1.3, strong_color="#222222")),
+    "casual": ("暖色卡片，大行距", ThemeStyle(
+        background_color="#FFF8E7", text_color="#3E2723", accent_color="#FF7043",
+        line_height=1.8, heading_color="#E64A19", code_background="rgba(255, 112, 67, 0.12)")),
+}
+
+
+def _rgb(color: str) -> Optional[Tuple[int, int, int]]:
+    """Parse #RGB / #RRGGBB; None for other CSS colour syntaxes."""
+    match = _HEX_COLOR.match(color.strip())
+    if not match:
+        return None
+    value = match.group(1)
+    if len(value) == 3:
+        value = "".join(ch * 2 for ch in value)
+    return int(value[0:2], 16), int(value[2:4], 16), int(value[4:6], 16)
+
+
+def _blend(color: str, background: Tuple[int, int, int]) -> Tuple[int, int, int]:
+    """An opaque RGB equal to CSS ``color`` (hex, rgb() or rgba()) drawn over ``background``."""
+    rgb = _rgb(color)
+    if rgb is not None:
+        return rgb
+    match = _RGBA_COLOR.match(color.strip())
+    if not match:
+        return background
+    alpha = float(match.group(4)) if match.group(4) is not None else 1.0
+    return tuple(int(bg + (int(fg) - bg) * alpha) for fg, bg in zip(match.group(1, 2, 3), background))
+
+
+def _quote_background(style: ThemeStyle) -> str:
+    accent_rgb = _rgb(style.accent_color)
+    return f"rgba({accent_rgb[0]}, {accent_rgb[1]}, {accent_rgb[2]}, 0.1)" if accent_rgb \
+        else "rgba(0, 0, 0, 0.05)"
+
+
+def _heading_sizes(style: ThemeStyle) -> Tuple[int, ...]:
+    return tuple(int(style.font_size * style.header_scale * factor) for factor in HEADING_FACTORS)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_css(style: ThemeStyle) -> str:
+    """Compile the geometry-independent CSS for a style (cached per style)."""
+    heading_color = style.heading_color or style.accent_color
+    strong_color = style.strong_color or style.accent_color
+    header_text = style.table_header_text or style.background_color
+    quote_background = _quote_background(style)
+    heading_rules = "\n".join(
+        f"h{level} {{ font-size: {size}px; }}" for level, size in enumerate(_heading_sizes(style), start=1)
+    )
+
+    css = f"""
+* {{ margin: 0; padding: 0; box-sizing: border-box; }}
+body {{
+    font-family: {style.font_family};
+    font-size: {style.font_size}px;
+    line-height: {style.line_height};
+    color: {style.text_color};
+    background-color: {style.background_color};
+    margin: 0;
+    padding: 0;
+}}
+.container {{ height: 100%; width: 100%; box-sizing: border-box; }}
+h1, h2, h3, h4, h5, h6 {{ color: {heading_color}; margin: 0.5em 0; font-weight: bold; }}
+{heading_rules}
+p {{ margin: 0.6em 0; }}
+strong, b {{ font-weight: bold; color: {strong_color}; }}
+em, i {{ font-style: italic; }}
+ul, ol {{ margin: 0.5em 0; padding-left: 2em; }}
+li {{ margin: 0.3em 0; }}
+blockquote {{
+    border-left: 4px solid {style.accent_color};
+    margin: 1em 0;
+    padding: 0.5em 1em;
+    background: {quote_background};
+    font-style: italic;
+}}
+code {{
+    background-color: {style.code_background};
+    padding: 2px 4px;
+    border-radius: 3px;
+    font-family: 'Consolas', 'Monaco', 'Courier New', monospace;
+    font-size: {int(style.font_size * 0.9)}px;
+}}
+pre {{ background-color: {style.code_background}; padding: 1em; border-radius: 5px; overflow-x: auto; margin: 1em 0; }}
+pre code {{ background: none; padding: 0; }}
+table {{ border-collapse: collapse; width: 100%; margin: 1em 0; }}
+th, td {{ border: 1px solid {style.accent_color}; padding: 0.5em 1em; text-align: left; }}
+th {{ background-color: {style.accent_color}; color: {header_text}; font-weight: bold; }}
+hr {{ border: none; height: 2px; background-color: {style.accent_color}; margin: 1.5em 0; }}
+a {{ color: {style.accent_color}; text-decoration: underline; }}
+img {{ max-width: 100%; height: auto; margin: 1em 0; }}
+"""
+    if style.shadow:
+        css += "h1, h2, h3, h4, h5, h6 { text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.3); }\n"
+    return css
+
+
+@functools.lru_cache(maxsize=256)
+def compile_pil_style(style: ThemeStyle) -> PilStyle:
+    """Compile the PIL drawing table for a style (cached per style)."""
+    shadow = None
+    background = _rgb(style.background_color) or (255, 255, 255)
+    if style.shadow:
+        # 与 CSS 的 rgba(0,0,0,0.3) 阴影在背景上的混合色一致
+        shadow = tuple(int(channel * 0.7) for channel in background)
+    return PilStyle(
+        background=style.background_color,
+        text=style.text_color,
+        accent=style.accent_color,
+        heading=style.heading_color or style.accent_color,
+        strong=style.strong_color or style.accent_color,
+        body_size=style.font_size,
+        heading_sizes=_heading_sizes(style),
+        line_height=style.line_height,
+        paragraph_spacing=int(style.font_size * 0.6),
+        table_header=style.accent_color,
+        shadow=shadow,
+        code_background=_blend(style.code_background, background),
+        quote_background=_blend(_quote_background(style), background),
+    )
+
+
+track_lru_cache("theme_css", compile_css)
+track_lru_cache("theme_pil", compile_pil_style)
+
+
+def layout_css(width: int, height: int, align: str, top_margin: int, side_margin: int) -> str:
+    """Per-render page geometry appended after the compiled theme CSS."""
+    text_align = align if align in ("center", "right") else "left"
+    return (
+        f"body {{ width: {width}px; min-height: {height}px; }}\n"
+        f".container {{ padding: {top_margin}px {side_margin}px; text-align: {text_align}; }}\n"
+        f"p {{ text-align: {text_align}; }}\n"
+    )
+
+
+def _compile_theme(name: str, description: str, style: ThemeStyle) -> Theme:
+    return Theme(name=name, description=description, style=style,
+                 css=compile_css(style), pil=compile_pil_style(style))
+
+
+class ThemeRegistry:
+    """Named, precompiled themes."""
+
+    def __init__(self) -> None:
+        self._themes: Dict[str, Theme] = {}
+        self._lock = threading.Lock()
+        for name, (description, style) in BUILTIN_THEMES.items():
+            self.register(name, style, description)
+
+    def register(self, name: str, style: ThemeStyle, description: str = "") -> Theme:
+        theme = _compile_theme(name, description, style)
+        with self._lock:
+            self._themes[name] = theme
+        return theme
+
+    def get(self, name: Optional[str]) -> Theme:
+        theme = self._themes.get(name or "default")
+        if theme is None:
+            raise ValueError(f"Unknown theme {name!r}; available: {self.names()}")
+        return theme
+
+    def names(self) -> List[str]:
+        return list(self._themes)
+
+    def load_file(self, path: str) -> Theme:
+        """Register a theme from a JSON file (see module docstring)."""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        name = data.pop("name", None) or os.path.splitext(os.path.basename(path))[0]
+        base = self.get(data.pop("extends", "default")).style
+        description = data.pop("description", "")
+        known = {field.name for field in fields(ThemeStyle)}
+        unknown = sorted(set(data) - known)
+        if unknown:
+            raise ValueError(f"Theme file {path} has unknown keys: {unknown}")
+        return self.register(name, replace(base, **data), description)
+
+    def load_path(self, theme_path: str) -> List[str]:
+        """Load every theme file in an os.pathsep-separated list of files/directories."""
+        loaded = []
+        for entry in filter(None, theme_path.split(os.pathsep)):
+            if os.path.isdir(entry):
+                paths = [os.path.join(entry, name) for name in sorted(os.listdir(entry)) if name.endswith(".json")]
+            else:
+                paths = [entry]
+            for path in paths:
+                loaded.append(self.load_file(path).name)
+        return loaded
+
+
+_registry: Optional[ThemeRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_theme_registry() -> ThemeRegistry:
+    """The process-wide registry: built-ins plus WORD2IMG_THEME_PATH files."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = ThemeRegistry()
+                theme_path = os.environ.get(THEME_PATH_ENV)
+                if theme_path:
+                    registry.load_path(theme_path)
+                _registry = registry
+    return _registry
+
+
+def get_theme(name: Optional[str]) -> Theme:
+    return get_theme_registry().get(name)
+
+
+def resolve_style(options: "RenderOptions") -> ThemeStyle:
+    """The theme's style with the request's explicit values applied."""
+    style = get_theme(options.theme).style
+    overrides = {name: getattr(options, name) for name in OPTION_FIELDS}
+    if all(getattr(style, name) == value for name, value in overrides.items()):
+        return style
+    return replace(style, **overrides)
+
+
+def render_css(options: "RenderOptions", top_margin: int, side_margin: int) -> str:
+    """Full stylesheet for one render: cached theme CSS plus page geometry."""
+    return compile_css(resolve_style(options)) + layout_css(
+        options.width, options.height, options.align, top_margin, side_margin)
+
+
+def pil_style(options: "RenderOptions") -> PilStyle:
+    return compile_pil_style(resolve_style(options))
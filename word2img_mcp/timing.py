@@ -0,0 +1,113 @@
+"""
+Render stage timing: per-request stage timers and process-wide histograms.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# 直方图桶上界（毫秒）
+TIMING_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class TimingHistograms:
+    """Thread-safe aggregated duration histograms keyed by stage name."""
+
+    def __init__(self, buckets: tuple = TIMING_BUCKETS_MS) -> None:
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, Any]] = {}
+
+    def observe(self, stage: str, duration_ms: float, failed: bool = False) -> None:
+        """Record one duration for a stage."""
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = {
+                    "count": 0,
+                    "failed": 0,
+                    "sum_ms": 0.0,
+                    "min_ms": None,
+                    "max_ms": None,
+                    "buckets": [0] * (len(self._buckets) + 1)
+                }
+                self._stages[stage] = entry
+            entry["count"] += 1
+            if failed:
+                entry["failed"] += 1
+            entry["sum_ms"] += duration_ms
+            entry["min_ms"] = duration_ms if entry["min_ms"] is None else min(entry["min_ms"], duration_ms)
+            entry["max_ms"] = duration_ms if entry["max_ms"] is None else max(entry["max_ms"], duration_ms)
+            for i, bound in enumerate(self._buckets):
+                if duration_ms <= bound:
+                    entry["buckets"][i] += 1
+                    break
+            else:
+                entry["buckets"][-1] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serializable copy of all histograms."""
+        with self._lock:
+            result = {}
+            for stage, entry in sorted(self._stages.items()):
+                labels = [f"le_{bound}ms" for bound in self._buckets] + ["inf"]
+                result[stage] = {
+                    "count": entry["count"],
+                    "failed": entry["failed"],
+                    "avg_ms": round(entry["sum_ms"] / entry["count"], 3) if entry["count"] else 0,
+                    "min_ms": entry["min_ms"],
+                    "max_ms": entry["max_ms"],
+                    "buckets": dict(zip(labels, entry["buckets"]))
+                }
+            return result
+
+    def reset(self) -> None:
+        """Drop all recorded observations."""
+        with self._lock:
+            self._stages.clear()
+
+
+# 进程级聚合直方图，由 get_render_info 暴露
+STAGE_HISTOGRAMS = TimingHistograms()
+
+
+class StageTimer:
+    """Collects per-stage durations for a single render request."""
+
+    def __init__(self, histograms: Optional[TimingHistograms] = STAGE_HISTOGRAMS) -> None:
+        self._histograms = histograms
+        self._started = time.perf_counter()
+        self.stages: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def stage(self, name: str, **extra: Any) -> Iterator[Dict[str, Any]]:
+        """Time a block; failures are recorded with their error and re-raised."""
+        entry: Dict[str, Any] = {"stage": name, **extra}
+        start = time.perf_counter()
+        try:
+            yield entry
+        except BaseException as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+            entry["error_type"] = type(e).__name__
+            raise
+        else:
+            entry.setdefault("status", "ok")
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            entry["duration_ms"] = round(duration_ms, 3)
+            self.stages.append(entry)
+            if self._histograms is not None:
+                self._histograms.observe(name, duration_ms, failed=entry["status"] == "failed")
+
+    def elapsed_ms(self) -> float:
+        """Wall time since the timer was created."""
+        return round((time.perf_counter() - self._started) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize recorded stages for task metadata."""
+        return {
+            "total_ms": self.elapsed_ms(),
+            "stages": [dict(entry) for entry in self.stages]
+        }